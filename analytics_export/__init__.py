@@ -0,0 +1 @@
+from .analytics_exporter import AnalyticsExporter, TRACK_COLUMNS, parquet_available, load_metadata, load_table, load_track, load_tracks
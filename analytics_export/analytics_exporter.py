@@ -0,0 +1,351 @@
+import json
+import os
+import numpy as np
+from track_table import TrackTable, OBJECT_CLASSES
+from possession_statistics import PossessionStatistics
+
+# Columns of the tracks file, one row per object and analysed frame
+TRACK_COLUMNS = ('frame', 'video_frame', 'time', 'object_class', 'track_id',
+                 'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'pitch_x', 'pitch_y',
+                 'speed', 'distance', 'team', 'team_confidence', 'has_ball')
+
+FORMATS = ('parquet', 'npz')
+
+
+def parquet_available():
+    # pyarrow is optional, it is only imported when Parquet is asked for
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class AnalyticsExporter:
+    """
+    Exports the analytics of a match to a directory of columnar files, for dashboards and notebooks:
+
+    - tracks: one row per object and analysed frame with the columns of TRACK_COLUMNS (bbox, court position in
+      metres from ViewTransformer, speed in km/h, cumulative distance in m, team and possession of the ball).
+      It is written one time window of window_seconds at a time, as one row group of tracks.parquet or one file
+      tracks/window-NNNNN.npz, so the whole match is never held as a table in memory.
+      Inside a window the rows are sorted by object class, track id and frame.
+    - frames: one row per analysed frame with the camera movement, the team in possession of the ball and the
+      share of possession of each team since the start of the match and over the last 5 minutes.
+    - players and teams: aggregates of the match per player (frames, minutes, distance, speeds, team, possession)
+      and per team, updated window by window.
+    - metadata.json: frame rate, frame range, windows and for every track the windows and rows where it is,
+      so load_track reads only the windows of one player.
+
+    format is 'parquet' (needs pyarrow), 'npz' or None for Parquet when pyarrow is installed and NPZ otherwise.
+    Analysed frame i is the frame start_frame + i * stride of the video.
+    """
+
+    def __init__(self, directory, frame_rate=24, window_seconds=60, format=None, start_frame=0, stride=1):
+        if format is None:
+            format = 'parquet' if parquet_available() else 'npz'
+        if format not in FORMATS:
+            raise ValueError(f"format must be one of {FORMATS}, got {format!r}")
+        if format == 'parquet' and not parquet_available():
+            raise ImportError("the Parquet export needs pyarrow, install it or use format='npz'")
+        self.directory = directory
+        self.format = format
+        self.frame_rate = frame_rate
+        self.window_frames = max(int(round(window_seconds * frame_rate)), 1)
+        self.start_frame = start_frame
+        self.stride = stride
+
+    def export(self, tracks, camera_movement_per_frame=None, team_ball_control=None):
+        """
+        Writes the tracks (the nested dictionary or a TrackTable, with the columns added by the enrichment stages),
+        the camera movement and the team in possession of every frame. Returns the metadata written to metadata.json.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if isinstance(tracks, TrackTable):
+            number_of_frames = tracks.number_of_frames
+        else:
+            number_of_frames = max((len(object_tracks) for object_tracks in tracks.values()), default=0)
+        writer = self._open_tracks_writer()
+        windows = []
+        track_index = {}
+        player_totals = {}
+        team_colors = {}
+        try:
+            for window, start in enumerate(range(0, number_of_frames, self.window_frames)):
+                end = min(start + self.window_frames, number_of_frames)
+                if isinstance(tracks, TrackTable):
+                    table = tracks.frame_range(start, end)
+                else:
+                    table = TrackTable.from_tracks({object: object_tracks[start:end]
+                                                    for object, object_tracks in tracks.items()})
+                team_colors.update(table.team_colors)
+                columns = self._window_columns(table, start)
+                writer(window, columns)
+                windows.append({'start': start, 'end': end, 'rows': len(table)})
+                # rows of every track in the window, in the track order of the columns
+                for (object_class, track_id), row_start, row_end in zip(
+                        table.track_keys, table.track_offsets[:-1].tolist(), table.track_offsets[1:].tolist()):
+                    track_index.setdefault(f"{OBJECT_CLASSES[object_class]}:{track_id}", []).append(
+                        [window, row_start, row_end])
+                self._add_player_totals(player_totals, columns)
+        finally:
+            writer(None, None)
+
+        frames = self._frame_columns(number_of_frames, camera_movement_per_frame, team_ball_control)
+        players = self._player_columns(player_totals)
+        self._write_table('frames', frames)
+        self._write_table('players', players)
+        self._write_table('teams', self._team_columns(players, team_ball_control))
+
+        metadata = {
+            'format': self.format,
+            'frame_rate': self.frame_rate,
+            'start_frame': self.start_frame,
+            'stride': self.stride,
+            'number_of_frames': number_of_frames,
+            'window_frames': self.window_frames,
+            'object_classes': list(OBJECT_CLASSES),
+            'columns': list(TRACK_COLUMNS),
+            'team_colors': {str(team): list(color) for team, color in sorted(team_colors.items())},
+            'windows': windows,
+            'tracks': track_index,
+        }
+        with open(os.path.join(self.directory, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+        return metadata
+
+    # Columns
+
+    def _window_columns(self, table, start):
+        # Columns of the rows of a window, sorted by object class, track id and frame
+        order = table.track_order
+        frame = table.frame[order] + start
+        bbox = table.bbox[order]
+        pitch = table.position_transformed[order]
+        return {
+            'frame': frame,
+            'video_frame': self.start_frame + frame * self.stride,
+            'time': frame / self.frame_rate,
+            'object_class': table.object_class[order],
+            'track_id': table.track_id[order],
+            'bbox_x1': bbox[:, 0], 'bbox_y1': bbox[:, 1], 'bbox_x2': bbox[:, 2], 'bbox_y2': bbox[:, 3],
+            'pitch_x': pitch[:, 0], 'pitch_y': pitch[:, 1],
+            'speed': table.speed[order],
+            'distance': table.distance[order],
+            'team': table.team[order],
+            'team_confidence': table.team_confidence[order],
+            'has_ball': table.has_ball[order],
+        }
+
+    def _frame_columns(self, number_of_frames, camera_movement_per_frame, team_ball_control):
+        frame = np.arange(number_of_frames)
+        camera_movement = np.zeros((number_of_frames, 2))
+        if camera_movement_per_frame is not None:
+            camera_movement[:] = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        columns = {
+            'frame': frame,
+            'video_frame': self.start_frame + frame * self.stride,
+            'time': frame / self.frame_rate,
+            'camera_x': camera_movement[:, 0],
+            'camera_y': camera_movement[:, 1],
+        }
+        if team_ball_control is not None:
+            possession_statistics = PossessionStatistics(team_ball_control, frame_rate=self.frame_rate)
+            columns['team_ball_control'] = np.asarray(team_ball_control, dtype=np.int8).reshape(-1)
+            for index, team in enumerate(possession_statistics.teams):
+                columns[f'possession_team_{team}'] = possession_statistics.cumulative_shares[:, index]
+                columns[f'rolling_possession_team_{team}'] = possession_statistics.rolling_shares[:, index]
+        return columns
+
+    @staticmethod
+    def _add_player_totals(player_totals, columns):
+        # Adds the rows of the players of a window to the running totals of each player
+        players = np.flatnonzero(columns['object_class'] == OBJECT_CLASSES.index('players'))
+        if len(players) == 0:
+            return
+        track_id = columns['track_id'][players]
+        # the rows are sorted by track, each player is one contiguous run
+        starts = np.flatnonzero(np.r_[True, track_id[1:] != track_id[:-1]])
+        ends = np.r_[starts[1:], len(track_id)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            rows = players[start:end]
+            speed = columns['speed'][rows]
+            speed = speed[~np.isnan(speed)]
+            distance = columns['distance'][rows]
+            distance = distance[~np.isnan(distance)]
+            totals = player_totals.setdefault(int(track_id[start]), {
+                'frames': 0, 'first_frame': int(columns['frame'][rows[0]]), 'last_frame': 0,
+                'distance': 0.0, 'max_speed': 0.0, 'speed_sum': 0.0, 'speed_frames': 0,
+                'ball_frames': 0, 'team_frames': {}})
+            totals['frames'] += len(rows)
+            totals['last_frame'] = int(columns['frame'][rows[-1]])
+            if len(distance):
+                # the distance is cumulative over the track
+                totals['distance'] = max(totals['distance'], float(distance.max()))
+            if len(speed):
+                totals['max_speed'] = max(totals['max_speed'], float(speed.max()))
+                totals['speed_sum'] += float(speed.sum())
+                totals['speed_frames'] += len(speed)
+            totals['ball_frames'] += int(columns['has_ball'][rows].sum())
+            teams, counts = np.unique(columns['team'][rows], return_counts=True)
+            for team, count in zip(teams.tolist(), counts.tolist()):
+                totals['team_frames'][team] = totals['team_frames'].get(team, 0) + count
+
+    def _player_columns(self, player_totals):
+        # One row per player sorted by track id, the team is the one assigned in most of its frames
+        track_ids = sorted(player_totals)
+        totals = [player_totals[track_id] for track_id in track_ids]
+        teams = []
+        for player in totals:
+            assigned = {team: count for team, count in player['team_frames'].items() if team > 0}
+            teams.append(max(assigned, key=assigned.get) if assigned else 0)
+        return {
+            'track_id': np.array(track_ids, dtype=np.int64),
+            'team': np.array(teams, dtype=np.int8),
+            'frames': np.array([player['frames'] for player in totals], dtype=np.int64),
+            'first_frame': np.array([player['first_frame'] for player in totals], dtype=np.int64),
+            'last_frame': np.array([player['last_frame'] for player in totals], dtype=np.int64),
+            'minutes': np.array([player['frames'] for player in totals], dtype=np.float64) / (60 * self.frame_rate),
+            'distance': np.array([player['distance'] for player in totals], dtype=np.float64),
+            'max_speed': np.array([player['max_speed'] for player in totals], dtype=np.float64),
+            'mean_speed': np.array([player['speed_sum'] / player['speed_frames'] if player['speed_frames'] else np.nan
+                                    for player in totals], dtype=np.float64),
+            'ball_frames': np.array([player['ball_frames'] for player in totals], dtype=np.int64),
+            'ball_seconds': np.array([player['ball_frames'] for player in totals], dtype=np.float64) / self.frame_rate,
+        }
+
+    def _team_columns(self, players, team_ball_control):
+        # One row per team with the totals of its players and its possession of the ball
+        teams = sorted(set(players['team'].tolist()) - {0})
+        if team_ball_control is not None:
+            team_ball_control = np.asarray(team_ball_control).reshape(-1)
+            teams = sorted(set(teams) | (set(np.unique(team_ball_control).tolist()) - {0}))
+            possession_frames = [int((team_ball_control == team).sum()) for team in teams]
+        else:
+            possession_frames = [0] * len(teams)
+        total_possession = max(sum(possession_frames), 1)
+        members = [players['team'] == team for team in teams]
+        return {
+            'team': np.array(teams, dtype=np.int8),
+            'players': np.array([int(member.sum()) for member in members], dtype=np.int64),
+            'distance': np.array([players['distance'][member].sum() for member in members], dtype=np.float64),
+            'max_speed': np.array([players['max_speed'][member].max() if member.any() else np.nan
+                                   for member in members], dtype=np.float64),
+            'possession_frames': np.array(possession_frames, dtype=np.int64),
+            'possession_share': np.array(possession_frames, dtype=np.float64) / total_possession,
+        }
+
+    # Writers
+
+    def _open_tracks_writer(self):
+        """
+        Returns write(window, columns) writing the columns of one window, write(None, None) closes the file.
+        Parquet windows are row groups of one file, NPZ windows are files of the tracks directory.
+        """
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            state = {'writer': None}
+            path = os.path.join(self.directory, 'tracks.parquet')
+
+            def write(window, columns):
+                if columns is None:
+                    if state['writer'] is not None:
+                        state['writer'].close()
+                    else:
+                        # an empty match still gets a file with the columns
+                        pq.write_table(pa.table(empty_track_columns()), path)
+                    return
+                batch = pa.table(columns)
+                if state['writer'] is None:
+                    state['writer'] = pq.ParquetWriter(path, batch.schema, compression='zstd')
+                # one row group per window
+                state['writer'].write_table(batch, row_group_size=max(len(batch), 1))
+            return write
+
+        tracks_directory = os.path.join(self.directory, 'tracks')
+        os.makedirs(tracks_directory, exist_ok=True)
+
+        def write(window, columns):
+            if columns is not None:
+                np.savez_compressed(os.path.join(tracks_directory, f'window-{window:05d}.npz'), **columns)
+        return write
+
+    def _write_table(self, name, columns):
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table(columns), os.path.join(self.directory, f'{name}.parquet'), compression='zstd')
+        else:
+            np.savez_compressed(os.path.join(self.directory, f'{name}.npz'), **columns)
+
+
+def empty_track_columns():
+    # Columns of a window without rows, with the dtypes of the exported ones
+    return AnalyticsExporter(None, format='npz')._window_columns(TrackTable([], [], [], []), 0)
+
+
+def load_metadata(directory):
+    with open(os.path.join(directory, 'metadata.json')) as f:
+        return json.load(f)
+
+
+def load_table(directory, name):
+    # Dictionary of the NumPy columns of the frames, players or teams table of an export
+    metadata = load_metadata(directory)
+    if metadata['format'] == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(os.path.join(directory, f'{name}.parquet'))
+        return {column: table.column(column).to_numpy() for column in table.column_names}
+    with np.load(os.path.join(directory, f'{name}.npz'), allow_pickle=False) as data:
+        return {column: data[column] for column in data.files}
+
+
+def read_windows(directory, metadata, locations, columns):
+    # Yields the columns of the rows row_start:row_end of every (window, row_start, row_end) of locations
+    if metadata['format'] == 'parquet':
+        if not locations:
+            return
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(os.path.join(directory, 'tracks.parquet'))
+        for window, row_start, row_end in locations:
+            row_group = parquet_file.read_row_group(window, columns=columns)
+            yield {column: row_group.column(column).to_numpy()[row_start:row_end] for column in columns}
+    else:
+        for window, row_start, row_end in locations:
+            with np.load(os.path.join(directory, 'tracks', f'window-{window:05d}.npz'), allow_pickle=False) as data:
+                yield {column: data[column][row_start:row_end] for column in columns}
+
+
+def concatenate_windows(parts, columns):
+    if not parts:
+        empty = empty_track_columns()
+        return {column: empty[column] for column in columns}
+    return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+
+def load_track(directory, track_id, object='players', columns=None, metadata=None):
+    """
+    Dictionary of the NumPy columns of one track sorted by frame, e.g. the whole match of one player.
+    Only the windows where the track is are read (the row groups of tracks.parquet or the files of tracks/),
+    and only the given columns (all of TRACK_COLUMNS by default).
+    """
+    if metadata is None:
+        metadata = load_metadata(directory)
+    columns = list(columns) if columns is not None else list(metadata['columns'])
+    locations = metadata['tracks'].get(f"{object}:{track_id}", [])
+    return concatenate_windows(list(read_windows(directory, metadata, locations, columns)), columns)
+
+
+def load_tracks(directory, columns=None, start_frame=0, end_frame=None, metadata=None):
+    """
+    Dictionary of the NumPy columns of every row of the windows overlapping the analysed frames start_frame to
+    end_frame (the whole match by default), in the order they were written: by window, then by track.
+    """
+    if metadata is None:
+        metadata = load_metadata(directory)
+    columns = list(columns) if columns is not None else list(metadata['columns'])
+    end_frame = metadata['number_of_frames'] if end_frame is None else end_frame
+    locations = [(window, 0, info['rows']) for window, info in enumerate(metadata['windows'])
+                 if info['end'] > start_frame and info['start'] < end_frame]
+    return concatenate_windows(list(read_windows(directory, metadata, locations, columns)), columns)
@@ -0,0 +1 @@
+from .annotation_renderer import AnnotationRenderer, build_match_renderer
@@ -0,0 +1,54 @@
+import functools
+from possession_statistics import PossessionStatistics
+
+
+class AnnotationRenderer:
+    """
+    Draws every registered overlay layer into one frame buffer, in a single pass per frame.
+
+    A layer is any callable layer(frame, frame_num) that draws in place on frame. Layers are drawn
+    in the order they were added, so a later layer is drawn on top of the earlier ones.
+    The frame is never copied, so the frames given to the renderer must be owned by the caller
+    (e.g. freshly decoded frames in a FramePipeline).
+    """
+
+    def __init__(self):
+        self.layers = []
+
+    def add_layer(self, layer):
+        self.layers.append(layer)
+        return self
+
+    def render(self, frame, frame_num):
+        for layer in self.layers:
+            layer(frame, frame_num)
+        return frame
+
+    # Lets the renderer be used directly as a FramePipeline stage
+    def process_window(self, start_frame_num, frames):
+        for i, frame in enumerate(frames):
+            self.render(frame, start_frame_num + i)
+        return frames
+
+
+def build_match_renderer(tracker, tracks, team_ball_control,
+                         camera_movement_estimator, camera_movement_per_frame,
+                         speed_and_distance_estimator):
+    """
+    Builds the renderer of main.py with the layers in the same order as the previous three drawing loops:
+    players, referees and ball, the team ball control box, the camera movement box and the speed and distance labels.
+    team_ball_control can be the array of PlayerBallAssigner or a PossessionStatistics.
+    """
+    renderer = AnnotationRenderer()
+    # the possession shares of all the frames are computed once, drawing a frame only looks its shares up
+    if not isinstance(team_ball_control, PossessionStatistics):
+        team_ball_control = PossessionStatistics(team_ball_control)
+    renderer.add_layer(functools.partial(
+        tracker.draw_frame_tracks, tracks=tracks))
+    renderer.add_layer(functools.partial(
+        tracker.draw_team_ball_control, team_ball_control=team_ball_control))
+    renderer.add_layer(functools.partial(
+        camera_movement_estimator.draw_frame_camera_movement, camera_movement_per_frame=camera_movement_per_frame))
+    renderer.add_layer(functools.partial(
+        speed_and_distance_estimator.draw_frame_speed_and_distance, tracks=tracks))
+    return renderer
@@ -0,0 +1 @@
+from .ball_trajectory import BallTrajectory, ball_bboxes_from_tracks, to_ball_tracks
@@ -0,0 +1,208 @@
+import numpy as np
+
+
+class BallTrajectory:
+    """
+    Cleaning of the ball track with NumPy: outlier rejection, gap interpolation and optional Kalman smoothing.
+
+    max_speed: a detection is rejected as a false positive when the ball would have moved faster than max_speed
+    pixels per frame both to come from the previous detection and to go to the next one (an isolated jump).
+    The first and the last detection are always kept. None keeps every detection.
+    max_gap: gaps of at most max_gap frames are interpolated linearly, longer gaps stay without ball.
+    None interpolates every gap. The frames before the first and after the last detection take its bbox,
+    like the pandas interpolate() and bfill() of Tracker.interpolate_ball_positions.
+    kalman: the centre of the ball is smoothed by a constant velocity Kalman filter, the size of the bbox is kept.
+    The filter starts again after every gap without ball.
+
+    With the default parameters process() gives the same bboxes as the pandas version.
+    process() cleans a whole track at once, add_frames() and flush() clean it while it is being streamed
+    and give the same result.
+    """
+
+    def __init__(self, max_gap=None, max_speed=None, kalman=False, process_noise=1.0, measurement_noise=4.0):
+        self.max_gap = max_gap
+        self.max_speed = max_speed
+        self.kalman = kalman
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def reset(self):
+        # Forgetting the frames of a stream
+        self.pending = np.empty((0, 4))
+        # True when the first pending frame is a detection that was already accepted
+        self.pending_starts_accepted = False
+        self.started = False
+        self.kalman_state = None
+
+    # Batch
+
+    def process(self, bboxes):
+        """
+        Cleans a (F, 4) array of ball bboxes (NaN where there is no ball) and returns the (F, 4) cleaned array.
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        accepted = self.reject_outliers(bboxes)
+        filled = self.interpolate(accepted)
+        if self.kalman:
+            filled, _ = self.smooth(filled, None)
+        return filled
+
+    def interpolate_ball_tracks(self, ball_tracks):
+        # Same input and output as Tracker.interpolate_ball_positions, frames left without ball are empty dictionaries
+        return to_ball_tracks(self.process(ball_bboxes_from_tracks(ball_tracks)))
+
+    def reject_outliers(self, bboxes, first_accepted=False):
+        """
+        Returns bboxes with the rejected detections set to NaN.
+        first_accepted=True keeps the first detection whatever its neighbours (used when streaming).
+        """
+        bboxes = bboxes.copy()
+        if self.max_speed is None:
+            return bboxes
+        detected = np.flatnonzero(~np.isnan(bboxes[:, 0]))
+        if len(detected) < 3:
+            return bboxes
+
+        centers = (bboxes[detected, :2] + bboxes[detected, 2:]) / 2
+        # speed between each detection and the next one, in pixels per frame
+        speeds = np.hypot(*np.diff(centers, axis=0).T) / np.diff(detected)
+        too_fast = speeds > self.max_speed
+        # the first and last detections have only one neighbour and are kept
+        outliers = np.zeros(len(detected), dtype=bool)
+        outliers[1:-1] = too_fast[:-1] & too_fast[1:]
+        if first_accepted:
+            outliers[0] = False
+        bboxes[detected[outliers]] = np.nan
+        return bboxes
+
+    def interpolate(self, bboxes, fill_start=True, fill_end=True):
+        """
+        Linear interpolation of the gaps of at most max_gap frames, all the columns at once.
+        The frames before the first (fill_start) and after the last (fill_end) detection take its bbox.
+        """
+        filled = bboxes.copy()
+        detected = np.flatnonzero(~np.isnan(bboxes[:, 0]))
+        if len(detected) == 0:
+            return filled
+
+        frame_nums = np.arange(len(bboxes))
+        for column in range(4):
+            filled[:, column] = np.interp(
+                frame_nums, detected, bboxes[detected, column])
+
+        if self.max_gap is not None:
+            # gap length of every frame: the number of missing frames between its two detections
+            next_detection = np.searchsorted(detected, frame_nums)
+            previous_frame = np.where(
+                next_detection > 0, detected[np.maximum(next_detection - 1, 0)], -1)
+            next_frame = np.where(next_detection < len(
+                detected), detected[np.minimum(next_detection, len(detected) - 1)], len(bboxes))
+            gap_length = next_frame - previous_frame - 1
+            filled[(gap_length > self.max_gap) & np.isnan(bboxes[:, 0])] = np.nan
+        if not fill_start:
+            filled[:detected[0]] = np.nan
+        if not fill_end:
+            filled[detected[-1] + 1:] = np.nan
+        return filled
+
+    def smooth(self, bboxes, state):
+        """
+        Constant velocity Kalman filter on the centre of the bboxes, one filter per axis.
+        state is the state of the filter at the end of the previous call (None to start a new one),
+        the new state is returned with the smoothed bboxes.
+        """
+        centers = ((bboxes[:, :2] + bboxes[:, 2:]) / 2).tolist()
+        shifts = [[0.0, 0.0] for _ in centers]
+        q, r = self.process_noise, self.measurement_noise
+        # position, velocity and covariance (p00, p01, p11) of each axis
+        axes = state
+        for frame_num, center in enumerate(centers):
+            if center[0] != center[0]:  # NaN, the filter starts again after the gap
+                axes = None
+                continue
+            if axes is None:
+                axes = [[center[axis], 0.0, r, 0.0, 100.0]
+                        for axis in (0, 1)]
+                continue
+            for axis in (0, 1):
+                position, velocity, p00, p01, p11 = axes[axis]
+                # predicting one frame ahead
+                position += velocity
+                p00 += 2 * p01 + p11 + q / 4
+                p01 += p11 + q / 2
+                p11 += q
+                # correcting with the measured centre
+                s = p00 + r
+                k0, k1 = p00 / s, p01 / s
+                innovation = center[axis] - position
+                position += k0 * innovation
+                velocity += k1 * innovation
+                p11 -= k1 * p01
+                p00, p01 = (1 - k0) * p00, (1 - k0) * p01
+                axes[axis] = [position, velocity, p00, p01, p11]
+                shifts[frame_num][axis] = position - center[axis]
+        # the whole bbox is moved with its centre
+        smoothed = bboxes + np.tile(np.array(shifts).reshape(-1, 2), 2)
+        return smoothed, axes
+
+    # Streaming
+
+    def add_frames(self, bboxes):
+        """
+        Adds the ball bboxes (F, 4) of the next frames of a stream and returns the cleaned bboxes of the frames that
+        are final. A frame is final once the detection after its gap is confirmed, i.e. when the detection after it
+        is known too, so the returned frames lag behind the added ones by about one gap.
+        """
+        self.pending = np.concatenate(
+            [self.pending, np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)])
+        detected = np.flatnonzero(~np.isnan(self.pending[:, 0]))
+        if len(detected) < 2:
+            return np.empty((0, 4))
+
+        # the last detection can't be judged before the next one, the detections before it can
+        accepted = self.reject_outliers(
+            self.pending, self.pending_starts_accepted)
+        confirmed_accepted = np.flatnonzero(
+            ~np.isnan(accepted[:detected[-1], 0]))
+        if len(confirmed_accepted) == 0:
+            return np.empty((0, 4))
+        boundary = confirmed_accepted[-1]
+
+        # frames up to the last confirmed accepted detection are final, it starts the next pending frames
+        filled = self.interpolate(
+            accepted[:boundary + 1], fill_start=not self.started)
+        output = self.finish(filled)
+        self.pending = self.pending[boundary + 1:]
+        self.pending = np.concatenate([accepted[boundary:boundary + 1], self.pending])
+        self.pending_starts_accepted = True
+        self.started = True
+        return output
+
+    def flush(self):
+        # Returns the cleaned bboxes of the frames still pending at the end of the stream
+        accepted = self.reject_outliers(
+            self.pending, self.pending_starts_accepted)
+        filled = self.interpolate(accepted, fill_start=not self.started)
+        output = self.finish(filled)
+        self.reset()
+        return output
+
+    def finish(self, filled):
+        if self.started:
+            # the first frame (the detection starting the pending frames) was returned by the previous call
+            filled = filled[1:]
+        if self.kalman:
+            filled, self.kalman_state = self.smooth(filled, self.kalman_state)
+        return filled
+
+
+def ball_bboxes_from_tracks(ball_tracks):
+    # (F, 4) array of the ball bboxes of the tracks dictionary, NaN where there is no ball
+    return np.array([ball_track.get(1, {}).get('bbox', [np.nan] * 4) for ball_track in ball_tracks],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def to_ball_tracks(bboxes):
+    # Back to the [{1: {"bbox": [...]}}, ...] format, frames without ball are empty dictionaries
+    return [{1: {"bbox": bbox}} if bbox[0] == bbox[0] else {} for bbox in bboxes.tolist()]
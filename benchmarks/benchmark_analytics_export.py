@@ -0,0 +1,77 @@
+"""
+Benchmark of the columnar analytics export (AnalyticsExporter) on a full match: the enriched tracks of the bundled
+stubs repeated to --minutes of match at 24 fps, keeping their track ids so every player plays the whole match.
+
+For every format (Parquet when pyarrow is installed, and NPZ) it reports the time of the export, the size on disk and
+how much the RSS of the process grew, then the time to load the whole match of one player with load_track (only its
+columns of the windows where it plays) compared with load_tracks reading every column of every row, and with loading
+the pickle of the nested tracks dictionary (what a reader had to do before the export).
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_analytics_export --minutes 90
+"""
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from profiling import current_rss
+from trackers import Tracker
+from analytics_export import AnalyticsExporter, parquet_available, load_track, load_tracks
+from benchmarks.common import prepare_stub_tracks, repeat_tracks, repeat_camera_movement, timed
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--minutes', type=float, default=90)
+    parser.add_argument('--window-seconds', type=float, default=60)
+    parser.add_argument('--frame-rate', type=float, default=24)
+    args = parser.parse_args()
+
+    tracker = Tracker.__new__(Tracker)
+    tracks, team_ball_control, camera_movement_per_frame = prepare_stub_tracks(tracker)
+    number_of_frames = int(args.minutes * 60 * args.frame_rate)
+    tracks = repeat_tracks(tracks, number_of_frames, id_offset=0)
+    camera_movement_per_frame = repeat_camera_movement(camera_movement_per_frame, number_of_frames)
+    team_ball_control = np.resize(team_ball_control, number_of_frames)
+    rows = sum(len(track) for object_tracks in tracks.values() for track in object_tracks)
+    print(f"{number_of_frames} frames, {rows} rows")
+
+    with tempfile.NamedTemporaryFile(suffix='.pkl') as f:
+        pickle.dump(tracks, f)
+        f.flush()
+        f.seek(0)
+        _, pickle_time = timed(pickle.load, f)
+        print(f"pickle: {os.path.getsize(f.name) / 2**20:.1f} MB, loaded in {pickle_time * 1000:.0f} ms")
+
+    formats = ['parquet', 'npz'] if parquet_available() else ['npz']
+    for format in formats:
+        directory = tempfile.mkdtemp(prefix='analytics-')
+        try:
+            exporter = AnalyticsExporter(directory, frame_rate=args.frame_rate, window_seconds=args.window_seconds,
+                                         format=format)
+            rss_before = current_rss()
+            metadata, export_time = timed(exporter.export, tracks, camera_movement_per_frame, team_ball_control)
+            rss_growth = (current_rss() - rss_before) / 2**20
+
+            track_id = min(int(key.split(':')[1]) for key in metadata['tracks'] if key.startswith('players:'))
+            player, player_time = timed(load_track, directory, track_id, columns=['frame', 'pitch_x', 'pitch_y',
+                                                                                  'speed', 'distance'])
+            _, all_time = timed(load_tracks, directory, metadata=metadata)
+
+            print(f"{format}: export {export_time:.2f} s ({rows / export_time:.0f} rows/s), "
+                  f"{directory_size(directory) / 2**20:.1f} MB in {len(metadata['windows'])} windows, "
+                  f"RSS +{rss_growth:.0f} MB")
+            print(f"{format}: player {track_id} ({len(player['frame'])} frames) loaded in {player_time * 1000:.0f} ms, "
+                  f"every column of every track in {all_time * 1000:.0f} ms")
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark of the annotation drawing of Tracker.draw_frame_tracks (the ellipses, id labels and triangles) with and
+without a SpriteCache, in ms per frame, on synthetic frames with the tracks of the bundled stubs.
+
+"cold" starts with an empty cache, "warm" draws the same frames again with every sprite already rendered.
+It also reports the hit rate of the cache and the largest difference with the direct drawing (0: the shapes are
+drawn without antialiasing and the sprites are copied exactly). The speed and distance labels, which are still
+drawn with putText, are timed for comparison.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_annotation_sprites --frames 300
+"""
+import argparse
+import numpy as np
+from utils import SpriteCache
+from trackers import Tracker
+from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from benchmarks.common import synthetic_frame, prepare_stub_tracks, timed
+
+
+def draw_all(draw_frame, frames, number_of_frames, tracks):
+    # drawing frame_num on a frame of a small pool of copies, so the frames don't all have to be kept in memory
+    for frame_num in range(number_of_frames):
+        draw_frame(frames[frame_num % len(frames)], frame_num, tracks)
+
+
+def largest_difference(tracker, base_frame, number_of_frames, tracks):
+    sprite_cache, difference = tracker.sprite_cache, 0
+    for frame_num in range(number_of_frames):
+        tracker.sprite_cache = None
+        direct = tracker.draw_frame_tracks(base_frame.copy(), frame_num, tracks)
+        tracker.sprite_cache = sprite_cache
+        cached = tracker.draw_frame_tracks(base_frame.copy(), frame_num, tracks)
+        difference = max(difference, int(np.abs(direct.astype(np.int16) - cached).max()))
+    return difference
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--max-sprites', type=int, default=4096)
+    args = parser.parse_args()
+
+    # drawing doesn't use the detector, so the YOLO model is not loaded
+    tracker = Tracker.__new__(Tracker)
+    tracks, _, _ = prepare_stub_tracks(tracker)
+    number_of_frames = min(args.frames, len(tracks['players']))
+    base_frame = synthetic_frame()
+    number_of_players = sum(len(track) for track in tracks['players'][:number_of_frames])
+    frames = [base_frame.copy() for _ in range(8)]
+
+    def per_frame(seconds):
+        return seconds * 1000 / number_of_frames
+
+    _, direct_time = timed(draw_all, tracker.draw_frame_tracks, frames, number_of_frames, tracks)
+    tracker.sprite_cache = SpriteCache(args.max_sprites)
+    _, cold_time = timed(draw_all, tracker.draw_frame_tracks, frames, number_of_frames, tracks)
+    _, warm_time = timed(draw_all, tracker.draw_frame_tracks, frames, number_of_frames, tracks)
+    _, labels_time = timed(draw_all, SpeedAndDistance_Estimator().draw_frame_speed_and_distance,
+                           frames, number_of_frames, tracks)
+    stats = dict(tracker.sprite_cache.stats)
+    difference = largest_difference(tracker, base_frame, number_of_frames, tracks)
+
+    print(f"{number_of_frames} frames, {number_of_players / number_of_frames:.1f} players per frame")
+    print(f"direct drawing: {per_frame(direct_time):.2f} ms/frame")
+    print(f"sprite cache: {per_frame(cold_time):.2f} ms/frame cold ({direct_time / cold_time:.2f}x), "
+          f"{per_frame(warm_time):.2f} ms/frame warm ({direct_time / warm_time:.2f}x)")
+    print(f"sprites: {len(tracker.sprite_cache)}, hits: {stats['hits']}, misses: {stats['misses']}, "
+          f"evictions: {stats['evictions']}, hit rate: {stats['hits'] / max(stats['hits'] + stats['misses'], 1):.1%}")
+    print(f"largest pixel difference: {difference}")
+    print(f"speed and distance labels (putText): {per_frame(labels_time):.2f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of the ball track cleaning: the previous pandas interpolate() and bfill() against BallTrajectory
+(the same interpolation, then with outlier rejection, max gap and Kalman smoothing, and streamed by windows).
+
+The ball track of a whole match is made by repeating the ball of stubs/track_stubs.pkl, with false positive jumps
+added to 2% of the detections so the rejection can be checked against them.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_ball_trajectory --frames 130000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from ball_trajectory import BallTrajectory, ball_bboxes_from_tracks
+from benchmarks.common import load_stub, timed, TRACK_STUB_PATH
+
+
+def pandas_interpolation(ball_positions):
+    # Tracker.interpolate_ball_positions before BallTrajectory
+    ball_positions = [x.get(1, {}).get('bbox', []) for x in ball_positions]
+    df_ball_positions = pd.DataFrame(
+        ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
+    df_ball_positions = df_ball_positions.interpolate()
+    df_ball_positions = df_ball_positions.bfill()
+    return [{1: {"bbox": x}} for x in df_ball_positions.to_numpy().tolist()]
+
+
+def streamed(ball_trajectory, bboxes, window_size):
+    ball_trajectory.reset()
+    parts = [ball_trajectory.add_frames(bboxes[start:start + window_size])
+             for start in range(0, len(bboxes), window_size)]
+    parts.append(ball_trajectory.flush())
+    return np.concatenate(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=130000)
+    parser.add_argument('--max-speed', type=float, default=60)
+    parser.add_argument('--max-gap', type=int, default=48)
+    parser.add_argument('--window', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    stub_bboxes = ball_bboxes_from_tracks(load_stub(TRACK_STUB_PATH)['ball'])
+    repeats = -(-args.frames // len(stub_bboxes))
+    bboxes = np.tile(stub_bboxes, (repeats, 1))[:args.frames]
+    # false positives: detections moved 300 to 800 pixels away
+    detected = np.flatnonzero(~np.isnan(bboxes[:, 0]))
+    false_positives = rng.choice(detected, len(detected) // 50, replace=False)
+    bboxes[false_positives] += np.tile(
+        rng.uniform(300, 800, (len(false_positives), 2)) * rng.choice([-1, 1], (len(false_positives), 2)), 2)
+    ball_tracks = [{1: {"bbox": bbox}} if bbox[0] == bbox[0] else {}
+                   for bbox in bboxes.tolist()]
+
+    reference, pandas_time = timed(pandas_interpolation, ball_tracks)
+    reference = ball_bboxes_from_tracks(reference)
+    print(f"{args.frames} frames, {len(detected)} detections, {len(false_positives)} false positives")
+    print(f"{'version':<34}{'ms':>9}{'speedup':>9}{'rejected':>10}{'false positives kept':>22}")
+    print(f"{'pandas':<34}{pandas_time * 1000:>9.1f}{1:>8.1f}x")
+
+    _, conversion_time = timed(ball_bboxes_from_tracks, ball_tracks)
+    versions = [
+        ('numpy, same as pandas', BallTrajectory(), False),
+        ('numpy, max speed + max gap', BallTrajectory(
+            max_gap=args.max_gap, max_speed=args.max_speed), False),
+        ('numpy, + kalman', BallTrajectory(max_gap=args.max_gap,
+                                           max_speed=args.max_speed, kalman=True), False),
+        (f'streamed by {args.window} frames, + kalman', BallTrajectory(max_gap=args.max_gap,
+                                                                   max_speed=args.max_speed, kalman=True), True),
+    ]
+    for name, ball_trajectory, is_streamed in versions:
+        if is_streamed:
+            cleaned, elapsed = timed(
+                streamed, ball_trajectory, bboxes, args.window)
+        else:
+            cleaned, elapsed = timed(ball_trajectory.process, bboxes)
+        # the pandas version starts from the tracks dictionary, so does the timing of the numpy versions
+        elapsed += conversion_time
+        rejected = ball_trajectory.reject_outliers(bboxes)
+        rejected_mask = ~np.isnan(bboxes[:, 0]) & np.isnan(rejected[:, 0])
+        kept = (~rejected_mask[false_positives]).sum()
+        print(f"{name:<34}{elapsed * 1000:>9.1f}{pandas_time / elapsed:>8.1f}x{rejected_mask.sum():>10}{kept:>22}")
+
+        if ball_trajectory.max_speed is None and not np.allclose(cleaned, reference, equal_nan=True):
+            raise AssertionError("the numpy interpolation differs from pandas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Accuracy against speed of the CameraMovementEstimator modes (full resolution, downscaled, ROI only).
+
+With --video (the clip the stubs were made from, 08fd33_4.mp4) the reference is the bundled
+stubs/camera_movement_stub.pkl. Without it, a synthetic panning clip with a known movement is used.
+Each mode is also compared with the full resolution result of the same run.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_camera_movement --video input-videos/08fd33_4.mp4
+"""
+import argparse
+import numpy as np
+from utils import read_video
+from camera_movement_estimator import CameraMovementEstimator
+from benchmarks.common import load_stub, synthetic_pan_frames, timed, CAMERA_MOVEMENT_STUB_PATH
+
+MODES = [
+    ('full resolution', dict()),
+    ('scale 0.5', dict(scale=0.5)),
+    ('scale 0.25', dict(scale=0.25)),
+    ('roi only', dict(roi_only=True)),
+    ('roi only, scale 0.5', dict(roi_only=True, scale=0.5)),
+]
+
+
+def error(movement, reference):
+    # per frame length of the difference between two (F, 2) movement arrays
+    return np.hypot(*(np.asarray(movement, dtype=np.float64) - reference).T)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--frames', type=int, default=120,
+                        help='number of synthetic frames when no video is given')
+    parser.add_argument('--motion-estimator', default='max',
+                        choices=CameraMovementEstimator.MOTION_ESTIMATORS)
+    args = parser.parse_args()
+
+    if args.video is not None:
+        frames = read_video(args.video)
+        reference = np.asarray(
+            load_stub(CAMERA_MOVEMENT_STUB_PATH), dtype=np.float64)
+        if len(reference) != len(frames):
+            raise ValueError(
+                f"the stub has {len(reference)} frames but the video has {len(frames)}")
+        reference_name = 'stub'
+    else:
+        frames, reference = synthetic_pan_frames(args.frames)
+        reference_name = 'ground truth'
+
+    full_resolution = None
+    print(f"{'mode':<22}{'ms/frame':>10}{'speedup':>9}  mean/p95 error vs {reference_name} (px)  mean error vs full resolution (px)")
+    for name, options in MODES:
+        estimator = CameraMovementEstimator(
+            frames[0], motion_estimator=args.motion_estimator, **options)
+        movement, elapsed = timed(estimator.get_camera_movement, frames)
+        if full_resolution is None:
+            full_resolution, full_resolution_time = movement, elapsed
+
+        reference_error = error(movement, reference)
+        print(f"{name:<22}{elapsed/len(frames)*1000:>10.2f}{full_resolution_time/elapsed:>8.1f}x"
+              f"  {reference_error.mean():>8.2f} / {np.percentile(reference_error, 95):<8.2f}"
+              f"  {error(movement, np.asarray(full_resolution, dtype=np.float64)).mean():>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of the FrameCache against decoding the video: reading every frame in order, reading random frames,
+and the camera movement of the whole video from the decoded frames or from a grayscale downscaled cache.
+
+Without --video a synthetic panning clip is written to a temporary .avi first.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_frame_cache --video input-videos/08fd33_4.mp4
+"""
+import argparse
+import os
+import tempfile
+import numpy as np
+from utils import iter_video, get_frame_count, VideoSink, FrameCache
+from camera_movement_estimator import CameraMovementEstimator
+from benchmarks.common import synthetic_pan_frames, timed
+
+
+def read_all(frames):
+    # reading a grid of pixels of every frame, so the frames are really decoded or paged in
+    return sum(int(frame[::64, ::64].sum()) for frame in frames)
+
+
+def read_random(video, frame_nums):
+    if isinstance(video, FrameCache):
+        return read_all(video[frame_num] for frame_num in frame_nums)
+    return read_all(next(iter_video(video, frame_num, frame_num + 1)) for frame_num in frame_nums)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--frames', type=int, default=240,
+                        help='number of synthetic frames when no video is given')
+    parser.add_argument('--random-reads', type=int, default=50)
+    parser.add_argument('--scale', type=float, default=0.5,
+                        help='scale of the grayscale cache used by the optical flow')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        video_path = args.video
+        if video_path is None:
+            video_path = os.path.join(directory, 'pan.avi')
+            sink = VideoSink(video_path)
+            for frame in synthetic_pan_frames(args.frames)[0]:
+                sink.write(frame)
+            sink.close()
+        number_of_frames = get_frame_count(video_path)
+
+        color_cache, color_build_time = timed(
+            FrameCache.build, video_path, os.path.join(directory, 'color'))
+        gray_cache, gray_build_time = timed(FrameCache.build, video_path, os.path.join(directory, 'gray'),
+                                            scale=args.scale, grayscale=True)
+        print(f"{len(color_cache)} frames, cache of {color_cache.frames.nbytes / 1e6:.0f} MB built in "
+              f"{color_build_time:.2f} s, grayscale x{args.scale} cache of {gray_cache.frames.nbytes / 1e6:.0f} MB "
+              f"in {gray_build_time:.2f} s")
+
+        rng = np.random.default_rng(0)
+        frame_nums = rng.integers(0, len(color_cache), args.random_reads).tolist()
+        print(f"{'':<34}{'decode':>10}{'cache':>10}{'speedup':>9}")
+        for name, video_run, cache_run in [
+            ('sequential read (ms/frame)', lambda: read_all(iter_video(video_path)),
+             lambda: read_all(iter_video(color_cache))),
+            ('random read (ms/frame)', lambda: read_random(video_path, frame_nums),
+             lambda: read_random(color_cache, frame_nums)),
+        ]:
+            _, video_time = timed(video_run)
+            _, cache_time = timed(cache_run)
+            count = number_of_frames if name.startswith('sequential') else len(frame_nums)
+            print(f"{name:<34}{video_time * 1000 / count:>10.2f}{cache_time * 1000 / count:>10.2f}"
+                  f"{video_time / cache_time:>8.1f}x")
+
+        def camera_movement(frames, **options):
+            frames = iter(frames)
+            first_frame = next(frames)
+            estimator = CameraMovementEstimator(first_frame, scale=args.scale, **options)
+            estimator.get_frame_camera_movement(first_frame)
+            return [estimator.get_frame_camera_movement(frame) for frame in frames]
+
+        decoded, video_time = timed(camera_movement, iter_video(video_path))
+        cached, cache_time = timed(camera_movement, iter_video(gray_cache), frame_scale=args.scale)
+        difference = np.abs(np.asarray(decoded, dtype=np.float64) - np.asarray(cached, dtype=np.float64)).max()
+        print(f"{'camera movement (ms/frame)':<34}{video_time * 1000 / number_of_frames:>10.2f}"
+              f"{cache_time * 1000 / number_of_frames:>10.2f}{video_time / cache_time:>8.1f}x"
+              f"  max difference {difference:.2f} px")
+        # the memory maps have to be closed before the temporary directory is removed
+        del color_cache, gray_cache
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Accuracy loss of the KeyframeTracker (detector run every N frames, boxes propagated in between) against the
+full rate tracks of the bundled stubs/track_stubs.pkl.
+
+Without --video and --model the keyframes are "detected" by replaying the boxes of the stub, so the report
+measures only what the propagation loses. With them the YOLO model is run on the keyframes of the real clip
+(08fd33_4.mp4, the clip the stubs were made from).
+The camera movement used for the propagation is the one of stubs/camera_movement_stub.pkl.
+
+For every N it reports the share of frames sent to the detector, the recall and mean IoU of the players and referees
+of the stub (matched with IoU >= 0.5), the number of id switches and the mean error of the interpolated ball centre.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_frame_skipping --detect-every 1 2 3 4 6
+"""
+import argparse
+import numpy as np
+from utils import iter_video, bbox_iou
+from trackers import Tracker, KeyframeTracker, FrameDetections
+from benchmarks.common import load_stub, timed, TRACK_STUB_PATH, CAMERA_MOVEMENT_STUB_PATH
+
+# class names of the model the stubs were made with
+CLASS_NAMES = {0: 'ball', 1: 'goalkeeper', 2: 'player', 3: 'referee'}
+
+
+class StubDetectionEngine:
+    # Perfect detector: the "frames" are frame numbers and their detections are the boxes of the stub
+    def __init__(self, reference_tracks):
+        self.reference_tracks = reference_tracks
+        self.class_ids = {v: k for k, v in CLASS_NAMES.items()}
+
+    def iter_batches(self, frame_nums, batch_size=20):
+        # Yields the detections of the frames in batches, like DetectionEngine
+        batch = []
+        for detection in self.iter_detections(frame_nums):
+            batch.append(detection)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def iter_detections(self, frame_nums):
+        for frame_num in frame_nums:
+            bboxes, class_ids = [], []
+            for object, class_name in (("players", 'player'), ("referees", 'referee'), ("ball", 'ball')):
+                for track_info in self.reference_tracks[object][frame_num].values():
+                    bboxes.append(track_info['bbox'])
+                    class_ids.append(self.class_ids[class_name])
+            yield FrameDetections(np.array(bboxes, dtype=np.float32).reshape(-1, 4),
+                                  np.ones(len(bboxes), dtype=np.float32),
+                                  np.array(class_ids, dtype=int), CLASS_NAMES)
+
+
+def compare_tracks(tracks, reference_tracks):
+    matched = total = 0
+    ious = []
+    id_switches = 0
+    for object in ("players", "referees"):
+        last_matched_id = {}
+        for track, reference_track in zip(tracks[object], reference_tracks[object]):
+            total += len(reference_track)
+            if not track or not reference_track:
+                continue
+            track_ids = list(track)
+            iou = bbox_iou([info['bbox'] for info in reference_track.values()],
+                           [track[track_id]['bbox'] for track_id in track_ids])
+            best = iou.argmax(axis=1)
+            for reference_id, i, j in zip(reference_track, range(len(best)), best):
+                if iou[i, j] < 0.5:
+                    continue
+                matched += 1
+                ious.append(iou[i, j])
+                if reference_id in last_matched_id and last_matched_id[reference_id] != track_ids[j]:
+                    id_switches += 1
+                last_matched_id[reference_id] = track_ids[j]
+
+    ball_errors = []
+    for track, reference_track in zip(tracks["ball"], reference_tracks["ball"]):
+        if 1 in reference_track and 1 in track and not np.isnan(track[1]['bbox'][0]):
+            center = np.reshape(track[1]['bbox'], (2, 2)).mean(axis=0)
+            reference_center = np.reshape(
+                reference_track[1]['bbox'], (2, 2)).mean(axis=0)
+            ball_errors.append(np.hypot(*(center - reference_center)))
+
+    return {'recall': matched / max(total, 1),
+            'mean_iou': float(np.mean(ious)) if ious else 0.0,
+            'id_switches': id_switches,
+            'ball_error': float(np.mean(ball_errors)) if ball_errors else float('nan')}
+
+
+def run(tracker, frames, detect_every, camera_movement_per_frame, max_drift, max_camera_movement,
+        compensate_camera_movement, window_size=40):
+    # a new ByteTrack is created by the first tracked frame
+    tracker.tracker = None
+    keyframe_tracker = KeyframeTracker(tracker, detect_every=detect_every, max_drift=max_drift,
+                                       max_camera_movement=max_camera_movement,
+                                       camera_movement_per_frame=camera_movement_per_frame,
+                                       compensate_camera_movement=compensate_camera_movement)
+    tracks = {"players": [], "referees": [], "ball": []}
+    window = []
+    for frame in frames:
+        window.append(frame)
+        if len(window) == window_size:
+            keyframe_tracker.add_frames_to_tracks(window, tracks)
+            window = []
+    if window:
+        keyframe_tracker.add_frames_to_tracks(window, tracks)
+    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+    return tracks, keyframe_tracker.keyframes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--detect-every', type=int, nargs='+',
+                        default=[1, 2, 3, 4, 6])
+    parser.add_argument('--max-drift', type=float, default=None,
+                        help='pixels a track may drift before a keyframe is forced')
+    parser.add_argument('--max-camera-movement', type=float, default=None,
+                        help='camera movement (pixels per frame) above which a keyframe is forced')
+    parser.add_argument('--compensate-camera-movement', action='store_true')
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--model', default=None)
+    args = parser.parse_args()
+
+    reference_tracks = load_stub(TRACK_STUB_PATH)
+    camera_movement_per_frame = load_stub(CAMERA_MOVEMENT_STUB_PATH)
+    number_of_frames = len(reference_tracks["players"])
+
+    if args.video is not None and args.model is not None:
+        tracker = Tracker(args.model)
+
+        def frames():
+            return iter_video(args.video, 0, number_of_frames)
+    else:
+        # the stub replay doesn't need the YOLO model
+        tracker = Tracker.__new__(Tracker)
+        tracker.detection_engine = StubDetectionEngine(reference_tracks)
+
+        def frames():
+            return range(number_of_frames)
+
+    print(f"{'N':>3}{'detected':>10}{'s':>8}{'recall':>8}{'mean IoU':>10}{'id switches':>13}{'ball error px':>15}")
+    for detect_every in args.detect_every:
+        (tracks, keyframes), elapsed = timed(run, tracker, frames(), detect_every, camera_movement_per_frame,
+                                             args.max_drift, args.max_camera_movement,
+                                             args.compensate_camera_movement)
+        report = compare_tracks(tracks, reference_tracks)
+        print(f"{detect_every:>3}{len(keyframes) / number_of_frames:>9.0%}{elapsed:>8.2f}{report['recall']:>8.3f}"
+              f"{report['mean_iou']:>10.3f}{report['id_switches']:>13}{report['ball_error']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
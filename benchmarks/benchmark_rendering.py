@@ -0,0 +1,72 @@
+"""
+Benchmark of the annotation drawing: the three drawing loops of the list based API
+(Tracker.draw_annotations, CameraMovementEstimator.draw_camera_movement and
+SpeedAndDistance_Estimator.draw_speed_and_distance) against the single pass AnnotationRenderer.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_rendering --frames 200
+"""
+import argparse
+from trackers import Tracker
+from camera_movement_estimator import CameraMovementEstimator
+from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from annotation_renderer import build_match_renderer
+from benchmarks.common import synthetic_frame, prepare_stub_tracks, timed
+
+
+def slice_tracks(tracks, start, end):
+    return {object: object_tracks[start:end] for object, object_tracks in tracks.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--chunk', type=int, default=25,
+                        help='frames held in memory at once by the list based API')
+    args = parser.parse_args()
+
+    # drawing doesn't use the detector, so the YOLO model is not loaded
+    tracker = Tracker.__new__(Tracker)
+    base_frame = synthetic_frame()
+    camera_movement_estimator = CameraMovementEstimator(base_frame)
+    speed_and_distance_estimator = SpeedAndDistance_Estimator()
+    tracks, team_ball_control, camera_movement_per_frame = prepare_stub_tracks(
+        tracker)
+    number_of_frames = min(args.frames, len(tracks['players']))
+
+    # Three passes with a copy of every frame in the first two
+    three_pass_time = 0
+    for start in range(0, number_of_frames, args.chunk):
+        end = min(start + args.chunk, number_of_frames)
+        frames = [base_frame.copy() for _ in range(start, end)]
+        chunk_tracks = slice_tracks(tracks, start, end)
+
+        def draw_three_passes():
+            output_frames = tracker.draw_annotations(
+                frames, chunk_tracks, team_ball_control[start:end])
+            output_frames = camera_movement_estimator.draw_camera_movement(
+                output_frames, camera_movement_per_frame[start:end])
+            return speed_and_distance_estimator.draw_speed_and_distance(output_frames, chunk_tracks)
+
+        _, elapsed = timed(draw_three_passes)
+        three_pass_time += elapsed
+
+    # One pass drawing every layer in place
+    renderer = build_match_renderer(tracker, tracks, team_ball_control,
+                                    camera_movement_estimator, camera_movement_per_frame,
+                                    speed_and_distance_estimator)
+    single_pass_time = 0
+    for start in range(0, number_of_frames, args.chunk):
+        end = min(start + args.chunk, number_of_frames)
+        frames = [base_frame.copy() for _ in range(start, end)]
+        _, elapsed = timed(renderer.process_window, start, frames)
+        single_pass_time += elapsed
+
+    print(f"frames: {number_of_frames}")
+    print(f"three pass drawing: {number_of_frames/three_pass_time:.1f} fps")
+    print(f"single pass renderer: {number_of_frames/single_pass_time:.1f} fps")
+    print(f"speedup: {three_pass_time/single_pass_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
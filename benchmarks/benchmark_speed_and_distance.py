@@ -0,0 +1,101 @@
+"""
+Benchmark of the speed and distance of the players: the previous loop over windows of 5 frames against the
+vectorized SpeedAndDistance_Estimator, on the nested tracks dictionary and on a TrackTable.
+
+The tracks of a whole match are made by repeating the players of stubs/track_stubs.pkl with new track ids for
+every repetition, after adding their positions like main.py. The spread of the speeds (median, p99 and max)
+shows the spikes that the smoothing removes.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_speed_and_distance --frames 130000
+"""
+import argparse
+import copy
+import numpy as np
+from utils import measure_distance
+from trackers import Tracker
+from camera_movement_estimator import CameraMovementEstimator
+from view_transformer import ViewTransformer
+from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from track_table import TrackTable
+from benchmarks.common import load_stub, synthetic_frame, repeat_tracks, timed, TRACK_STUB_PATH, CAMERA_MOVEMENT_STUB_PATH
+
+
+def window_loop(tracks, frame_window=5, frame_rate=24):
+    # SpeedAndDistance_Estimator.add_speed_and_distance_to_tracks before the vectorized version
+    total_distance = {}
+    for object, object_tracks in tracks.items():
+        if object == "ball" or object == "referees":
+            continue
+        number_of_frames = len(object_tracks)
+        for frame_num in range(0, number_of_frames, frame_window):
+            last_frame = min(frame_num + frame_window, number_of_frames - 1)
+            for track_id, _ in object_tracks[frame_num].items():
+                if track_id not in object_tracks[last_frame]:
+                    continue
+                start_position = object_tracks[frame_num][track_id]['position_transformed']
+                end_position = object_tracks[last_frame][track_id]['position_transformed']
+                if start_position is None or end_position is None or last_frame == frame_num:
+                    continue
+                distance_covered = measure_distance(start_position, end_position)
+                speed_km_per_hour = distance_covered / ((last_frame - frame_num) / frame_rate) * 3.6
+                total_distance.setdefault(object, {}).setdefault(track_id, 0)
+                total_distance[object][track_id] += distance_covered
+                for frame_num_batch in range(frame_num, last_frame):
+                    if track_id not in tracks[object][frame_num_batch]:
+                        continue
+                    tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
+                    tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
+
+
+def match_tracks(number_of_frames):
+    # players and referees of the stub with their transformed positions, repeated up to number_of_frames
+    tracks = load_stub(TRACK_STUB_PATH)
+    tracks.pop("ball")
+    Tracker.__new__(Tracker).add_position_to_tracks(tracks)
+    CameraMovementEstimator(synthetic_frame()).add_adjust_positions_to_tracks(
+        tracks, load_stub(CAMERA_MOVEMENT_STUB_PATH))
+    ViewTransformer().add_transformed_position_to_tracks(tracks)
+    # new track ids for every repetition, like new players
+    return repeat_tracks(tracks, number_of_frames)
+
+
+def speed_spread(tracks):
+    speeds = [track_info['speed'] for track in tracks["players"]
+              for track_info in track.values() if 'speed' in track_info]
+    return np.percentile(speeds, [50, 99, 100])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=130000)
+    parser.add_argument('--frame-window', type=int, default=5)
+    parser.add_argument('--smoothing-window', type=int, default=5)
+    args = parser.parse_args()
+
+    tracks = match_tracks(args.frames)
+    table = TrackTable.from_tracks(tracks)
+    number_of_rows = sum(len(track) for track in tracks["players"])
+    print(f"{args.frames} frames, {number_of_rows} player detections")
+    print(f"{'version':<36}{'s':>8}{'speedup':>9}{'median km/h':>13}{'p99 km/h':>10}{'max km/h':>10}")
+
+    loop_tracks = copy.deepcopy(tracks)
+    _, loop_time = timed(window_loop, loop_tracks, args.frame_window)
+    print(f"{'window loop':<36}{loop_time:>8.2f}{1:>8.1f}x" +
+          "".join(f"{value:>{width}.1f}" for value, width in zip(speed_spread(loop_tracks), (13, 10, 10))))
+
+    for smoothing_window in sorted({1, args.smoothing_window}):
+        estimator = SpeedAndDistance_Estimator(frame_window=args.frame_window,
+                                               smoothing_window=smoothing_window)
+        dict_tracks = copy.deepcopy(tracks)
+        _, dict_time = timed(estimator.add_speed_and_distance_to_tracks, dict_tracks)
+        _, table_time = timed(estimator.add_speed_and_distance_to_tracks, table)
+        spread = "".join(f"{value:>{width}.1f}" for value, width in zip(speed_spread(dict_tracks), (13, 10, 10)))
+        print(f"{f'vectorized, smoothing {smoothing_window}, dict':<36}{dict_time:>8.2f}{loop_time / dict_time:>8.1f}x"
+              f"{spread}")
+        print(f"{f'vectorized, smoothing {smoothing_window}, TrackTable':<36}{table_time:>8.2f}"
+              f"{loop_time / table_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of the startup of a replay run, where the tracks come from the stage cache or a stub and the detector never
+runs: the import time measured by `python -X importtime` in a new interpreter, the heavy modules (torch, ultralytics,
+supervision, sklearn, pandas) that were imported anyway and the modules taking the most time.
+
+Two scenarios are measured:
+- import: `import main`;
+- replay: importing main, building the Tracker, the team assigner and a TrackingStage replaying the bundled track stub.
+With --video the whole replay run of main.py on that video (--no-render) is measured as well: a first run with the
+bundled stubs fills a temporary stage cache, then the runs reading every stage from the cache are measured.
+
+For comparison it also measures the import time of each heavy module that is installed, which is what every replay
+run paid when they were imported at the top of the modules.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_startup --repeat 5
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.common import TRACK_STUB_PATH, CAMERA_MOVEMENT_STUB_PATH
+
+HEAVY_MODULES = ('torch', 'ultralytics', 'supervision', 'sklearn', 'pandas')
+
+REPLAY_SCRIPT = f"""
+import main
+from trackers import Tracker
+from team_assigner import OnlineTeamAssigner
+from pipeline import TrackingStage
+tracker = Tracker('models/best.pt')
+team_assigner = OnlineTeamAssigner()
+tracking_stage = TrackingStage(tracker, read_from_stub=True, stub_path={TRACK_STUB_PATH!r})
+assert not tracking_stage.needs_frames
+"""
+
+
+def parse_importtime(output):
+    # (module, self us, cumulative us, depth) of every line written by -X importtime
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_time), int(cumulative), depth))
+    return imports
+
+
+def run_importtime(arguments):
+    # Runs python -X importtime with arguments, returns the imports and the wall time of the process
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments)} failed:\n{process.stderr[-2000:]}")
+    return parse_importtime(process.stderr), elapsed
+
+
+def measure(name, arguments, repeat, top):
+    # Median import time and wall time over repeat runs, and the details of the last run
+    import_times, wall_times = [], []
+    for _ in range(repeat):
+        imports, elapsed = run_importtime(arguments)
+        import_times.append(sum(cumulative for _, _, cumulative, depth in imports if depth == 0) / 1e6)
+        wall_times.append(elapsed)
+    modules = {module for module, _, _, _ in imports}
+    heavy = [module for module in HEAVY_MODULES if module in modules]
+    print(f"{name}: imports {np.median(import_times):.3f} s, process {np.median(wall_times):.3f} s, "
+          f"{len(modules)} modules, heavy modules imported: {', '.join(heavy) or 'none'}")
+    for module, _, cumulative, _ in sorted(
+            (entry for entry in imports if entry[3] <= 1), key=lambda entry: -entry[2])[:top]:
+        print(f"    {module:<40}{cumulative / 1000:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help="number of the slowest imports listed")
+    parser.add_argument('--video', default=None, help="video of the bundled stubs to time a whole replay run of main.py")
+    args = parser.parse_args()
+
+    measure('import', ['-c', 'import main'], args.repeat, args.top)
+    measure('replay', ['-c', REPLAY_SCRIPT], args.repeat, args.top)
+    if args.video is not None:
+        directory = tempfile.mkdtemp(prefix='startup-')
+        try:
+            arguments = ['main.py', args.video, '--no-render', '--cache-dir', f'{directory}/cache',
+                         '--analytics', f'{directory}/analytics', '--analytics-format', 'npz']
+            run_importtime(arguments + ['--track-stub', TRACK_STUB_PATH,
+                                        '--camera-movement-stub', CAMERA_MOVEMENT_STUB_PATH])
+            measure('main.py replay', arguments, args.repeat, args.top)
+        finally:
+            shutil.rmtree(directory)
+
+    print("import time of the heavy modules, no longer paid by replay runs:")
+    for module in HEAVY_MODULES:
+        try:
+            imports, _ = run_importtime(['-c', f'import {module}'])
+        except RuntimeError:
+            print(f"    {module:<40}{'not installed':>12}")
+            continue
+        cumulative = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+        print(f"    {module:<40}{cumulative / 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Benchmark suite of every stage after the detector, at several lengths of match (1x, 10x and 100x a clip by default),
+to catch regressions and check that the time per frame and the memory stay flat when the match gets longer.
+
+The stages working on the tracks run on the bundled stubs (stubs/track_stubs.pkl and
+stubs/camera_movement_stub.pkl, 750 frames) repeated to the length of the match with new track ids, like main.py:
+interpolation on the dictionaries, track_table (the conversion to a TrackTable and the positions), then
+camera_adjustment, view_transform, speed_and_distance and ball_assignment on the table.
+The stages working on the frames run on deterministic synthetic footage (SyntheticMatch: a panning camera over a
+textured pitch, players in two kit colours and a ball) of --footage-frames frames times the scale, rendered one frame
+at a time and not timed: camera_movement (optical flow), team_assignment (OnlineTeamAssigner) and drawing
+(the AnnotationRenderer of main.py).
+
+For every stage and scale it reports the frames, the time, the throughput, the time per frame and its p95, the time
+per frame relative to the smallest scale (1.0 means linear scaling) and how much the RSS of the process grew during
+the stage. Every stage runs once, untimed, on a few frames before the measures, so that the lazy imports and first
+calls are not counted. --output saves the results as JSON, and --baseline compares the time per frame with a saved
+run and exits with an error when a stage is more than --tolerance slower.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_suite --scales 1 10 100 --output benchmark_results.json
+"""
+import argparse
+import json
+import sys
+from profiling import StageProfiler
+from utils import SpriteCache
+from trackers import Tracker
+from camera_movement_estimator import CameraMovementEstimator
+from view_transformer import ViewTransformer
+from team_assigner import OnlineTeamAssigner
+from player_ball_assigner import PlayerBallAssigner
+from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from possession_statistics import PossessionStatistics
+from annotation_renderer import build_match_renderer
+from track_table import TrackTable
+from benchmarks.common import (load_stub, synthetic_frame, repeat_tracks, repeat_camera_movement, SyntheticMatch,
+                               TEAM_COLORS, TRACK_STUB_PATH, CAMERA_MOVEMENT_STUB_PATH)
+
+TRACK_STAGES = ['interpolation', 'track_table', 'camera_adjustment', 'view_transform', 'speed_and_distance',
+                'ball_assignment']
+FRAME_STAGES = ['camera_movement', 'team_assignment', 'drawing']
+# frames of the untimed warm-up run of every stage before the measures
+WARMUP_FRAMES = 8
+
+
+def measure(name, run):
+    # Runs run(profiler), which times the stage name with the profiler, and returns its results
+    profiler = StageProfiler(rss_interval=0.01)
+    profiler.start()
+    run(profiler)
+    profiler.stop()
+    stats = profiler.summary()[name]
+    return {'frames': stats['frames'], 'seconds': stats['total_time'], 'fps': stats['fps'],
+            'us_per_frame': stats['mean_ms'] * 1000, 'p95_us': stats['p95_ms'] * 1000,
+            'rss_growth_mb': (profiler.peak_rss - profiler.rss_samples[0][1]) / 2**20}
+
+
+def add_teams(tracks):
+    for player_track in tracks['players']:
+        for track in player_track.values():
+            track.setdefault('team', int(track.get('team', 1)))
+            track['team_color'] = TEAM_COLORS[track['team']]
+
+
+def run_track_stages(number_of_frames, stages):
+    """
+    Runs the stages on the stub tracks repeated to number_of_frames, in the order of main.py since each stage
+    uses the columns added by the previous ones: the ball interpolation on the dictionaries, then the conversion to a
+    TrackTable (with the positions) and the other stages on the table. Stages that are not selected are run without
+    being measured.
+    """
+    tracker = Tracker.__new__(Tracker)
+    tracks = repeat_tracks(load_stub(TRACK_STUB_PATH), number_of_frames)
+    camera_movement_per_frame = repeat_camera_movement(load_stub(CAMERA_MOVEMENT_STUB_PATH), number_of_frames)
+    # the stubs come without the video, the teams are assigned from the track ids like prepare_stub_tracks
+    for player_track in tracks['players']:
+        for player_id, track in player_track.items():
+            track['team'] = int(player_id) % 2 + 1
+    add_teams(tracks)
+    table = {}
+
+    def to_track_table():
+        table['tracks'] = TrackTable.from_tracks(tracks)
+        tracker.add_position_to_tracks(table['tracks'])
+
+    steps = {
+        'interpolation': lambda: tracks.update(ball=tracker.interpolate_ball_positions(
+            tracks['ball'], max_gap=48, max_speed=60)),
+        'track_table': to_track_table,
+        'camera_adjustment': lambda: CameraMovementEstimator(synthetic_frame()).add_adjust_positions_to_tracks(
+            table['tracks'], camera_movement_per_frame),
+        'view_transform': lambda: ViewTransformer().add_transformed_position_to_tracks(table['tracks']),
+        'speed_and_distance': lambda: SpeedAndDistance_Estimator().add_speed_and_distance_to_tracks(table['tracks']),
+        'ball_assignment': lambda: PlayerBallAssigner().add_ball_possession_to_tracks(table['tracks']),
+    }
+    results = {}
+    for name in TRACK_STAGES:
+        if name not in stages:
+            steps[name]()
+            continue
+
+        def run(profiler):
+            with profiler.stage(name, number_of_frames):
+                steps[name]()
+        results[name] = measure(name, run)
+    return results
+
+
+def run_frame_stages(number_of_frames, stages, height, width):
+    # Runs the stages on synthetic footage of number_of_frames frames, each frame is rendered before being timed
+    match = SyntheticMatch(number_of_frames, height=height, width=width)
+    results = {}
+
+    if 'camera_movement' in stages:
+        def run(profiler):
+            estimator = None
+            for frame in match.iter_frames():
+                if estimator is None:
+                    estimator = CameraMovementEstimator(frame)
+                with profiler.stage('camera_movement'):
+                    estimator.get_frame_camera_movement(frame)
+        results['camera_movement'] = measure('camera_movement', run)
+
+    if 'team_assignment' in stages:
+        def run(profiler):
+            team_assigner = OnlineTeamAssigner()
+            for frame_num, frame in enumerate(match.iter_frames()):
+                with profiler.stage('team_assignment'):
+                    team_assigner.assign_frame_teams(frame, match.tracks['players'][frame_num])
+        results['team_assignment'] = measure('team_assignment', run)
+
+    if 'drawing' in stages:
+        # everything main.py adds to the tracks before drawing, with the true teams of the footage
+        tracks = match.tracks
+        for player_track in tracks['players']:
+            for player_id, track in player_track.items():
+                track['team'] = match.teams[player_id - 1]
+        add_teams(tracks)
+        tracker = Tracker.__new__(Tracker)
+        tracker.sprite_cache = SpriteCache()
+        tracker.add_position_to_tracks(tracks)
+        camera_movement_estimator = CameraMovementEstimator(synthetic_frame(height, width))
+        camera_movement_estimator.add_adjust_positions_to_tracks(tracks, match.camera_movement)
+        ViewTransformer().add_transformed_position_to_tracks(tracks)
+        tracks['ball'] = tracker.interpolate_ball_positions(tracks['ball'])
+        speed_and_distance_estimator = SpeedAndDistance_Estimator()
+        speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
+        possession_statistics = PossessionStatistics(PlayerBallAssigner().add_ball_possession_to_tracks(tracks))
+        renderer = build_match_renderer(tracker, tracks, possession_statistics, camera_movement_estimator,
+                                        match.camera_movement, speed_and_distance_estimator)
+
+        def run(profiler):
+            for frame_num, frame in enumerate(match.iter_frames()):
+                with profiler.stage('drawing'):
+                    renderer.render(frame, frame_num)
+        results['drawing'] = measure('drawing', run)
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    # Returns the (stage, scale, ratio) of the stages more than tolerance slower per frame than in the baseline
+    regressions = []
+    for scale, stages in results.items():
+        for name, stats in stages.items():
+            reference = baseline.get(scale, {}).get(name)
+            if reference is None or reference['us_per_frame'] <= 0:
+                continue
+            ratio = stats['us_per_frame'] / reference['us_per_frame']
+            if ratio > 1 + tolerance:
+                regressions.append((name, scale, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='lengths of the match in clips: 750 frames of stubs, --footage-frames synthetic frames')
+    parser.add_argument('--footage-frames', type=int, default=96)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--stages', nargs='+', default=TRACK_STAGES + FRAME_STAGES,
+                        choices=TRACK_STAGES + FRAME_STAGES)
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--baseline', default=None, help='JSON file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    clip_length = len(load_stub(TRACK_STUB_PATH)['players'])
+    # every stage runs once on a few frames before being measured, so that the lazy imports (sklearn, supervision)
+    # and the first calls of OpenCV and NumPy are not counted in the smallest scale
+    if any(name in args.stages for name in TRACK_STAGES):
+        run_track_stages(WARMUP_FRAMES, args.stages)
+    if any(name in args.stages for name in FRAME_STAGES):
+        run_frame_stages(WARMUP_FRAMES, args.stages, args.height, args.width)
+
+    results = {}
+    print(f"{'stage':<20}{'scale':>6}{'frames':>9}{'s':>9}{'fps':>11}{'us/frame':>10}{'p95 us':>10}"
+          f"{'vs 1st':>8}{'RSS +MB':>9}")
+    for scale in sorted(args.scales):
+        results[str(scale)] = {}
+        if any(name in args.stages for name in TRACK_STAGES):
+            results[str(scale)].update(run_track_stages(clip_length * scale, args.stages))
+        if any(name in args.stages for name in FRAME_STAGES):
+            results[str(scale)].update(run_frame_stages(args.footage_frames * scale, args.stages,
+                                                        args.height, args.width))
+
+        first = results[str(min(args.scales))]
+        for name in TRACK_STAGES + FRAME_STAGES:
+            stats = results[str(scale)].get(name)
+            if stats is None:
+                continue
+            scaling = stats['us_per_frame'] / first[name]['us_per_frame'] if first[name]['us_per_frame'] else 0
+            print(f"{name:<20}{scale:>5}x{stats['frames']:>9}{stats['seconds']:>9.2f}{stats['fps']:>11.0f}"
+                  f"{stats['us_per_frame']:>10.1f}{stats['p95_us']:>10.1f}{scaling:>8.2f}{stats['rss_growth_mb']:>9.0f}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for name, scale, ratio in regressions:
+            print(f"regression: {name} at {scale}x is {ratio:.2f}x slower per frame than the baseline")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
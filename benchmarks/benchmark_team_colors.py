@@ -0,0 +1,55 @@
+"""
+Benchmark of the TeamAssigner colour modes: cost per player crop and agreement of the predicted teams
+with the 'exact' (one KMeans per crop) mode, on synthetic frames with the players of the bundled track stub.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_team_colors --frames 20
+"""
+import argparse
+from team_assigner import TeamAssigner
+from benchmarks.common import load_stub, synthetic_players_frame, timed, TRACK_STUB_PATH
+
+
+def team_of(player_id):
+    return int(player_id) % 2 + 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=20)
+    args = parser.parse_args()
+
+    tracks = load_stub(TRACK_STUB_PATH)
+    player_tracks = tracks['players'][:args.frames]
+    frames = [synthetic_players_frame(player_track, team_of, seed=frame_num)
+              for frame_num, player_track in enumerate(player_tracks)]
+    number_of_crops = sum(len(player_track) for player_track in player_tracks)
+
+    exact_teams = None
+    for color_mode in TeamAssigner.COLOR_MODES:
+        team_assigner = TeamAssigner(color_mode=color_mode)
+        team_assigner.assign_team_color(frames[0], player_tracks[0])
+
+        def extract_all():
+            return [team_assigner.get_player_colors(frame, [track['bbox'] for track in player_track.values()])
+                    for frame, player_track in zip(frames, player_tracks)]
+
+        colors, elapsed = timed(extract_all)
+        teams = [team for frame_colors in colors
+                 for team in (team_assigner.kmeans.predict(frame_colors) + 1).tolist()] if colors else []
+        # the team numbers of two runs can be swapped, agreement is measured up to the swap
+        truth = [team_of(player_id)
+                 for player_track in player_tracks for player_id in player_track]
+        accuracy = sum(a == b for a, b in zip(teams, truth)) / len(truth)
+        accuracy = max(accuracy, 1 - accuracy)
+        if exact_teams is None:
+            exact_teams = teams
+        agreement = sum(a == b for a, b in zip(teams, exact_teams)) / len(teams)
+        agreement = max(agreement, 1 - agreement)
+
+        print(f"{color_mode:<10} {elapsed/number_of_crops*1e6:>10.1f} us/crop"
+              f"  accuracy {accuracy*100:6.2f}%  agreement with exact {agreement*100:6.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Micro-benchmark of ViewTransformer: one transform_point call per object and frame against
+one transform_points call on all the positions, for the bundled stub tracks repeated to a whole match.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_view_transformer --repeat 10
+"""
+import argparse
+import numpy as np
+from view_transformer import ViewTransformer
+from track_table import TrackTable
+from benchmarks.common import load_stub, timed, TRACK_STUB_PATH, CAMERA_MOVEMENT_STUB_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='number of times the stub positions are repeated')
+    args = parser.parse_args()
+
+    table = TrackTable.from_tracks(load_stub(TRACK_STUB_PATH))
+    table.add_positions()
+    table.add_adjusted_positions(load_stub(CAMERA_MOVEMENT_STUB_PATH))
+    positions = np.tile(table.position_adjusted, (args.repeat, 1))
+
+    view_transformer = ViewTransformer()
+
+    def transform_one_by_one():
+        return [view_transformer.transform_point(position) for position in positions]
+
+    per_point, per_point_time = timed(transform_one_by_one)
+    batch, batch_time = timed(view_transformer.transform_points, positions)
+
+    # both ways must give the same points
+    per_point = np.array([np.full(2, np.nan) if point is None else point[0]
+                          for point in per_point])
+    assert np.allclose(per_point, batch, equal_nan=True)
+
+    print(f"points: {len(positions)}")
+    print(f"transform_point loop: {per_point_time*1000:.1f} ms")
+    print(f"transform_points batch: {batch_time*1000:.1f} ms")
+    print(f"speedup: {per_point_time/batch_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Helpers shared by the benchmarks.
+The benchmarks run from the root of the repository, e.g. `python -m benchmarks.benchmark_rendering`
+"""
+import pickle
+import time
+import numpy as np
+
+TRACK_STUB_PATH = 'stubs/track_stubs.pkl'
+CAMERA_MOVEMENT_STUB_PATH = 'stubs/camera_movement_stub.pkl'
+
+# colours used for the two teams when the teams are not assigned from real footage
+TEAM_COLORS = {1: (255, 255, 255), 2: (40, 40, 200)}
+
+
+def load_stub(stub_path):
+    with open(stub_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def synthetic_frame(height=1080, width=1920):
+    # a plain green pitch, enough for drawing benchmarks
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    frame[:] = (40, 140, 40)
+    return frame
+
+
+def synthetic_pan_frames(number_of_frames, velocity=(7, 2), height=1080, width=1920, seed=0):
+    """
+    Frames of a camera panning over a textured pitch at a constant velocity (pixels per frame).
+    Returns the frames and the true camera movement of each frame (0 for the first frame),
+    in the same convention as CameraMovementEstimator (old minus new position of the background).
+    """
+    import cv2
+    rng = np.random.default_rng(seed)
+    velocity = np.asarray(velocity)
+    travel = np.abs(velocity) * max(number_of_frames - 1, 0)
+    background = (rng.random((height + int(travel[1]) + 1, width + int(travel[0]) + 1, 3)) * 255).astype(np.uint8)
+    background = cv2.GaussianBlur(background, (7, 7), 0)
+
+    frames = []
+    for frame_num in range(number_of_frames):
+        x, y = (velocity * frame_num).astype(int)
+        # moving in the negative direction starts from the other side of the background
+        x = x if velocity[0] >= 0 else int(travel[0]) + x
+        y = y if velocity[1] >= 0 else int(travel[1]) + y
+        frames.append(background[y:y + height, x:x + width].copy())
+
+    movement = np.tile(velocity.astype(np.float64), (number_of_frames, 1))
+    movement[0] = 0
+    return frames, movement
+
+
+def synthetic_players_frame(player_track, team_of, height=1080, width=1920, seed=0):
+    """
+    Green pitch with every player of player_track drawn in its bbox: a shirt in the kit colour of its team
+    (team_of(player_id) -> 1 or 2, colours from TEAM_COLORS) on the top half and dark shorts on the bottom half.
+    """
+    rng = np.random.default_rng(seed)
+    frame = synthetic_frame(height, width)
+    for player_id, track in player_track.items():
+        x1, y1, x2, y2 = [int(value) for value in track['bbox']]
+        # the player is narrower than its bbox so the corners of the crop stay pitch coloured
+        inset = max((x2 - x1) // 4, 1)
+        middle = (y1 + y2) // 2
+        frame[y1 + 2:middle, x1 + inset:x2 - inset] = TEAM_COLORS[team_of(player_id)]
+        frame[middle:y2, x1 + inset:x2 - inset] = (20, 20, 20)
+    noise = rng.integers(-12, 13, frame.shape)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def repeat_tracks(tracks, number_of_frames, id_offset=1000):
+    """
+    Repeats the frames of tracks up to number_of_frames, like a longer match: every repetition gets new track ids
+    (id + repetition * id_offset) and copies of the track dictionaries. The ball keeps its id 1.
+    """
+    clip_length = len(next(iter(tracks.values())))
+    repeated = {object: [] for object in tracks}
+    for repetition in range(-(-number_of_frames // clip_length)):
+        offset = 0 if repetition == 0 else repetition * id_offset
+        for object, object_tracks in tracks.items():
+            object_offset = 0 if object == 'ball' else offset
+            repeated[object] += [{track_id + object_offset: dict(track_info) for track_id, track_info in track.items()}
+                                 for track in object_tracks]
+    return {object: object_tracks[:number_of_frames] for object, object_tracks in repeated.items()}
+
+
+def repeat_camera_movement(camera_movement_per_frame, number_of_frames):
+    repetitions = -(-number_of_frames // len(camera_movement_per_frame))
+    return ([list(movement) for movement in camera_movement_per_frame] * repetitions)[:number_of_frames]
+
+
+class SyntheticMatch:
+    """
+    Deterministic synthetic footage with its ground truth, for the benchmarks that need frames (optical flow,
+    team colours, drawing) without the real video.
+
+    A textured pitch with mowing stripes and lines is filmed by a camera panning left and right. The players of the
+    two teams are blobs in their kit colours (TEAM_COLORS: shirt on top, dark shorts below), moving smoothly around
+    their own spot, with a referee in yellow, and the ball goes from player to player every 2 seconds.
+
+    tracks are in the format of Tracker.get_object_tracks, with every object inside the frame and the true 'team'
+    of the players, camera_movement is the true movement of every frame (as CameraMovementEstimator measures it).
+    The frames are rendered one at a time by iter_frames, so a long match doesn't have to be held in memory.
+    """
+
+    PLAYER_SIZE = (36, 80)
+    BALL_SIZE = 14
+    REFEREE_COLOR = (0, 220, 220)
+    BALL_PERIOD = 48
+
+    def __init__(self, number_of_frames, players_per_team=10, height=1080, width=1920, pan_period=240, seed=0):
+        rng = np.random.default_rng(seed)
+        self.number_of_frames = number_of_frames
+        self.height = height
+        self.width = width
+        self.pan_range = width // 4
+        self.background = self.render_background(rng)
+
+        frame_nums = np.arange(number_of_frames)
+        # camera position in the background, going from one side to the other and back every pan_period frames
+        self.camera_x = np.round(self.pan_range / 2 * (1 - np.cos(2 * np.pi * frame_nums / pan_period))).astype(int)
+        movement = np.zeros((number_of_frames, 2))
+        movement[1:, 0] = np.diff(self.camera_x)
+        self.camera_movement = movement.tolist()
+
+        # feet of the players and of the referee (last one) in the background, moving around their own spot
+        number_of_people = 2 * players_per_team + 1
+        spots = np.column_stack([rng.uniform(100, width + self.pan_range - 100, number_of_people),
+                                 rng.uniform(300, height - 60, number_of_people)])
+        amplitudes = rng.uniform([60, 20], [200, 80], (number_of_people, 2))
+        periods = rng.uniform(60, 200, (number_of_people, 2))
+        phases = rng.uniform(0, 2 * np.pi, (number_of_people, 2))
+        self.feet = spots + amplitudes * np.sin(2 * np.pi * frame_nums[:, None, None] / periods + phases)
+        self.feet[..., 0] -= self.camera_x[:, None]
+        self.teams = [1] * players_per_team + [2] * players_per_team
+
+        # the player with the ball changes every BALL_PERIOD frames
+        owners = rng.integers(0, 2 * players_per_team, -(-number_of_frames // self.BALL_PERIOD))
+        self.ball_owner = np.repeat(owners, self.BALL_PERIOD)[:number_of_frames]
+        self.ball = self.feet[frame_nums, self.ball_owner] + np.array([14, -8])
+        self.tracks = self.build_tracks()
+
+    def render_background(self, rng):
+        import cv2
+        background_width = self.width + self.pan_range
+        texture = cv2.GaussianBlur(rng.random((self.height, background_width)).astype(np.float32), (7, 7), 0)
+        background = np.empty((self.height, background_width, 3), dtype=np.uint8)
+        stripes = (np.arange(background_width) // 120) % 2 * 15
+        for channel, base in enumerate((40, 140, 40)):
+            background[..., channel] = np.clip(base + stripes + (texture - 0.5) * 160, 0, 255)
+        for x in range(60, background_width, 400):
+            cv2.line(background, (x, 0), (x, self.height), (230, 230, 230), 3)
+        cv2.line(background, (0, 240), (background_width, 240), (230, 230, 230), 3)
+        return background
+
+    def bbox(self, feet):
+        width, height = self.PLAYER_SIZE
+        return [float(feet[0] - width / 2), float(feet[1] - height), float(feet[0] + width / 2), float(feet[1])]
+
+    def is_inside(self, bbox):
+        return bbox[0] >= 0 and bbox[1] >= 0 and bbox[2] < self.width and bbox[3] < self.height
+
+    def build_tracks(self):
+        tracks = {"players": [], "referees": [], "ball": []}
+        half_ball = self.BALL_SIZE / 2
+        for frame_num in range(self.number_of_frames):
+            players, referees, ball = {}, {}, {}
+            for person, feet in enumerate(self.feet[frame_num]):
+                bbox = self.bbox(feet)
+                if not self.is_inside(bbox):
+                    continue
+                if person < len(self.teams):
+                    players[person + 1] = {"bbox": bbox, "team": self.teams[person]}
+                else:
+                    referees[person + 1] = {"bbox": bbox}
+            x, y = self.ball[frame_num]
+            ball_bbox = [float(x - half_ball), float(y - half_ball), float(x + half_ball), float(y + half_ball)]
+            if self.is_inside(ball_bbox):
+                ball[1] = {"bbox": ball_bbox}
+            tracks["players"].append(players)
+            tracks["referees"].append(referees)
+            tracks["ball"].append(ball)
+        return tracks
+
+    def render_frame(self, frame_num):
+        import cv2
+        x = self.camera_x[frame_num]
+        frame = self.background[:, x:x + self.width].copy()
+        for object, color_of in (("players", lambda track: TEAM_COLORS[track["team"]]),
+                                 ("referees", lambda track: self.REFEREE_COLOR)):
+            for track in self.tracks[object][frame_num].values():
+                x1, y1, x2, y2 = [int(value) for value in track["bbox"]]
+                # like synthetic_players_frame, the corners of the bbox stay pitch coloured
+                inset = (x2 - x1) // 4
+                middle = (y1 + y2) // 2
+                frame[y1 + 2:middle, x1 + inset:x2 - inset] = color_of(track)
+                frame[middle:y2, x1 + inset:x2 - inset] = (20, 20, 20)
+        ball = self.tracks["ball"][frame_num].get(1)
+        if ball is not None:
+            x1, y1, x2, y2 = ball["bbox"]
+            cv2.circle(frame, (int((x1 + x2) / 2), int((y1 + y2) / 2)), self.BALL_SIZE // 2, (255, 255, 255), -1)
+        return frame
+
+    def iter_frames(self, start_frame=0, end_frame=None):
+        for frame_num in range(start_frame, self.number_of_frames if end_frame is None else end_frame):
+            yield self.render_frame(frame_num)
+
+
+def timed(function, *args, **kwargs):
+    # Returns the result of the function and the elapsed wall time in seconds
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def prepare_stub_tracks(tracker):
+    """
+    Loads the bundled stubs and adds everything main.py adds to the tracks before drawing
+    (positions, speed and distance, teams and ball possession).
+    Teams are assigned from the track id since the stubs come without the video.
+    Returns tracks, team_ball_control and camera_movement_per_frame.
+    """
+    from camera_movement_estimator import CameraMovementEstimator
+    from view_transformer import ViewTransformer
+    from speed_and_distance_estimator import SpeedAndDistance_Estimator
+    from player_ball_assigner import PlayerBallAssigner
+
+    tracks = load_stub(TRACK_STUB_PATH)
+    camera_movement_per_frame = load_stub(CAMERA_MOVEMENT_STUB_PATH)
+
+    tracker.add_position_to_tracks(tracks)
+    camera_movement_estimator = CameraMovementEstimator(synthetic_frame())
+    camera_movement_estimator.add_adjust_positions_to_tracks(
+        tracks, camera_movement_per_frame)
+    ViewTransformer().add_transformed_position_to_tracks(tracks)
+    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+    SpeedAndDistance_Estimator().add_speed_and_distance_to_tracks(tracks)
+
+    for player_track in tracks['players']:
+        for player_id, track in player_track.items():
+            track['team'] = int(player_id) % 2 + 1
+            track['team_color'] = TEAM_COLORS[track['team']]
+
+    player_assigner = PlayerBallAssigner()
+    team_ball_control = []
+    for frame_num, player_track in enumerate(tracks['players']):
+        ball_bbox = tracks['ball'][frame_num][1]['bbox']
+        assigned_player = player_assigner.assign_ball_to_player(
+            player_track, ball_bbox)
+        if assigned_player != -1:
+            player_track[assigned_player]['has_ball'] = True
+            team_ball_control.append(player_track[assigned_player]['team'])
+        else:
+            team_ball_control.append(
+                team_ball_control[-1] if team_ball_control else 1)
+
+    return tracks, np.array(team_ball_control), camera_movement_per_frame
@@ -1,4 +1,5 @@
-from utils import measure_distance, measure_xy_distance
+from utils import draw_transparent_rectangle
+from track_table import TrackTable
 import cv2
 import pickle
 import numpy as np
@@ -8,9 +9,43 @@ sys.path.append('../')
 
 
 class CameraMovementEstimator:
-    def __init__(self, frame):
+    # Ways of turning the feature displacements of a frame into one camera movement
+    MOTION_ESTIMATORS = ('max', 'median', 'affine')
+
+    def __init__(self, frame, motion_estimator='max', scale=1.0, roi_only=False, roi_margin=40, frame_scale=1.0):
         self.minimum_distance = 5
         """
+        motion_estimator chooses how the camera movement is computed from the tracked features:
+        'max': the displacement of the feature that moved the most (the original behaviour)
+        'median': the per-axis median displacement, robust to players moving in the masked strips
+        'affine': a RANSAC partial affine (rotation, uniform scale and translation) fit with OpenCV, evaluated at the centre of the frame
+        """
+        if motion_estimator not in self.MOTION_ESTIMATORS:
+            raise ValueError(
+                f"motion_estimator must be one of {self.MOTION_ESTIMATORS}, got {motion_estimator!r}")
+        self.motion_estimator = motion_estimator
+
+        """
+        scale: the optical flow is computed on the frame resized by this factor (e.g. 0.5), the movement is scaled back to full resolution.
+        roi_only: only the strips of the feature mask (widened by roi_margin pixels on each side so the features can move)
+        are cropped and converted to grayscale, instead of the whole frame.
+        The camera movement is always returned in full resolution pixels.
+        frame_scale: the frames given (the first one included) were already resized by this factor, e.g. frames of a
+        downscaled FrameCache, and they can be grayscale. scale stays relative to the full resolution, so it can't be
+        above frame_scale, and with scale == frame_scale the frames are used as they are.
+        """
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be in (0, 1]")
+        if scale > frame_scale:
+            raise ValueError("scale can't be above frame_scale")
+        self.scale = scale
+        self.frame_scale = frame_scale
+        self.roi_only = roi_only
+        self.roi_margin = round(roi_margin * frame_scale)
+        # centre of the full resolution frame, the point where the affine motion is measured
+        self.frame_center = np.array(
+            [frame.shape[1] / 2, frame.shape[0] / 2], dtype=np.float32) / frame_scale
+        """
         Here we define a dictionary self.lk_params that contains parameters for the Lucas-Kanade optical flow method.
         The Lucas-Kanade method is used to estimate the motion of objects between two consecutive frames.
 
@@ -31,14 +66,18 @@ class CameraMovementEstimator:
                       cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         )
 
-        # Here we converting the input frame from RGB color space to grayscale using OpenCV's cvtColor function. cv2.COLOR_BGR2GRAY specifies the conversion type.
-        first_frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # Creating an array of zeros with the same shape as first_frame_grayscale. This will serve as a mask to specify regions of interest for feature detection.
-        mask_features = np.zeros_like(first_frame_grayscale)
+        # Creating an array of zeros with the height and width of the frame. This will serve as a mask to specify regions of interest for feature detection.
+        mask_features = np.zeros(frame.shape[:2], dtype=np.uint8)
         # Setting the first 20 columns and the columns from 900 to 1050 in the mask_features array to 1.
         # This indicates that only these regions will be used for feature detection.
-        mask_features[:, 0:20] = 1
-        mask_features[:, 900:1050] = 1
+        # (columns of the full resolution frame, scaled like the frames)
+        mask_features[:, 0:round(20 * frame_scale)] = 1
+        mask_features[:, round(900 * frame_scale):round(1050 * frame_scale)] = 1
+
+        # Column ranges of the frame used for the optical flow, the whole frame unless roi_only is set
+        self.roi_columns = self.get_roi_columns(mask_features)
+        # the mask is cropped and resized like the frames
+        mask_features = self.prepare_image(mask_features, cv2.INTER_NEAREST)
 
         """
         Here we are defining a dictionary self.features with parameters for the cv2.goodFeaturesToTrack function:
@@ -57,12 +96,21 @@ class CameraMovementEstimator:
             mask=mask_features
         )
 
+        # grayscale image and features of the previous frame, kept between calls so frames can be streamed
+        self.old_gray = None
+        self.old_features = None
+
     # This method adjusts the positions of tracked objects based on the movement of the camera.
     # We take three parameters
     # self: Refers to the instance of the class.
     # tracks: A dictionary containing tracking information for multiple objects. Each object has its own set of tracks across frames.
     # camera_movement_per_frame: A list where each element represents the camera movement(x and y coordinates) for each frame.
     def add_adjust_positions_to_tracks(self, tracks, camera_movement_per_frame):
+        # a TrackTable adjusts all the rows in one vectorized pass
+        if isinstance(tracks, TrackTable):
+            tracks.add_adjusted_positions(camera_movement_per_frame)
+            return
+
         # Iterating over the tracks dictionary. object is the key representing a specific object, and object_tracks is the value, which is a list of tracks for that object.
         for object, object_tracks in tracks.items():
             # Iterating  over the list of object_tracks. frame_num is the index of the current frame, and track is the tracking information for that frame.
@@ -86,65 +134,12 @@ class CameraMovementEstimator:
             with open(stub_path, 'rb') as f:
                 return pickle.load(f)
 
-        # movement for x and movement for y coordinates and multiplying by frames
-        camera_movement = [[0, 0]]*len(frames)
-
-        # extrcting old frames and features
-        # Converting the first frame in frames to grayscale.
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
-        # Detecting  good features to track in old_gray using the parameters defined in self.features.
-        #  The **self.features syntax unpacks the dictionary into keyword arguments.
-        old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
-
-        for frame_num in range(1, len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            new_features, _, _ = cv2.calcOpticalFlowPyrLK(
-                old_gray, frame_gray, old_features, None, **self.lk_params)
-
-            # Measuring distance between new and old features
-            max_distance = 0
-            camera_movement_x, camera_movement_y = 0, 0
-
-            """
-            Here we are iterating over the pairs of new and old features.
-
-            new and old are points representing feature coordinates.
-            .ravel() is a method in NumPy that flattens an array. It returns a contiguous flattened array, meaning it converts a multi-dimensional array into a one-dimensional array.
-
-            new and old is likely a 2D array with the shape (1, 2) (or similar), containing the x and y coordinates of a feature point.
-            new.ravel() flattens this 2D array into a 1D array with the shape (2,), which means new_features_point will be a 1D array containing the x and y coordinates
-            """
-            for i, (new, old) in enumerate(zip(new_features, old_features)):
-                new_features_point = new.ravel()
-                old_features_point = old.ravel()
-
-                # calculating the distance between the new and old features using a custom function measure_distance.
-                distance = measure_distance(
-                    new_features_point, old_features_point)
-
-                # If the current distance is greater than max_distance, update max_distance and calculate the x and y movement using a custom function measure_xy_distance.
-                if distance > max_distance:
-                    max_distance = distance
-                    camera_movement_x, camera_movement_y = measure_xy_distance(
-                        old_features_point, new_features_point)
-
-            """
-            Here we check the max_distance (the maximum distance between new and old features calculated in the loop) is greater than a threshold value, self.minimum_distance.
-            If the condition is true we update the camera_movement list at the index frame_num (the current frame number).
-            camera_movement_x and camera_movement_y are the x and y components of the movement vector, calculated as the largest movement of features between the two frames.
-
-            After recording the camera movement, this line detects new features in the current frame (now stored in frame_gray).
-            cv2.goodFeaturesToTrack is an OpenCV function used to detect good features (corners) to track in an image.
-            The **self.features syntax unpacks the dictionary self.features into keyword arguments for the cv2.goodFeaturesToTrack function. This dictionary contains parameters like maxCorners, qualityLevel, minDistance, blockSize, and mask.
-            """
-            if max_distance > self.minimum_distance:
-                camera_movement[frame_num] = [
-                    camera_movement_x, camera_movement_y]
-                old_features = cv2.goodFeaturesToTrack(
-                    frame_gray, **self.features)
-
-            # Updating old_gray to be the current frame's grayscale image.
-            old_gray = frame_gray.copy()
+        # movement for x and movement for y coordinates of every frame
+        camera_movement = []
+
+        # frames can be a list or a generator, they are consumed one at a time
+        self.reset_camera_movement()
+        self.add_frames_to_camera_movement(frames, camera_movement)
 
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
@@ -152,23 +147,190 @@ class CameraMovementEstimator:
 
         return camera_movement
 
+    # Forgetting the previous frame so the next frame is treated as the first frame of a video
+    def reset_camera_movement(self):
+        self.old_gray = None
+        self.old_features = None
+
+    # Appending the camera movement of each frame to camera_movement, can be called with consecutive windows of the video
+    def add_frames_to_camera_movement(self, frames, camera_movement):
+        for frame in frames:
+            camera_movement.append(self.get_frame_camera_movement(frame))
+
+    def get_frame_camera_movement(self, frame):
+        """
+        Returns the camera movement between the previous frame given to this method and frame.
+        Only the grayscale image and features of the previous frame are kept, so the frames can be streamed.
+        """
+        # Converting the frame (only the strips in roi_only mode, resized if scale < 1) to grayscale.
+        frame_gray = self.prepare_gray(frame)
+
+        # extrcting old frames and features from the first frame, there is no movement on the first frame
+        # the same is done when the previous frame had no features to track
+        if self.old_gray is None or self.old_features is None or len(self.old_features) == 0:
+            self.old_gray = frame_gray
+            # Detecting  good features to track in old_gray using the parameters defined in self.features.
+            #  The **self.features syntax unpacks the dictionary into keyword arguments.
+            self.old_features = cv2.goodFeaturesToTrack(
+                frame_gray, **self.features)
+            return [0, 0]
+
+        new_features, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.old_gray, frame_gray, self.old_features, None, **self.lk_params)
+
+        # Keeping only the features that were found in the new frame (status 1)
+        tracked = status.ravel() == 1
+        old_features = self.old_features.reshape(-1, 2)[tracked]
+        new_features = new_features.reshape(-1, 2)[tracked]
+        # a feature that drifted across the seam of two ROI strips would be mapped with the offset of the other
+        # strip, the features are mapped with the strip of their old position and the ones that changed are dropped
+        strip = self.get_strips(old_features)
+        same_strip = self.get_strips(new_features) == strip
+        old_points = self.to_frame_coordinates(
+            old_features[same_strip], strip[same_strip])
+        new_points = self.to_frame_coordinates(
+            new_features[same_strip], strip[same_strip])
+
+        camera_movement_x, camera_movement_y = self.estimate_motion(
+            old_points, new_points)
+
+        """
+        Here we check the length of the movement vector is greater than a threshold value, self.minimum_distance.
+        If the condition is true we return the movement of the current frame.
+
+        After recording the camera movement, this line detects new features in the current frame (now stored in frame_gray).
+        cv2.goodFeaturesToTrack is an OpenCV function used to detect good features (corners) to track in an image.
+        The **self.features syntax unpacks the dictionary self.features into keyword arguments for the cv2.goodFeaturesToTrack function. This dictionary contains parameters like maxCorners, qualityLevel, minDistance, blockSize, and mask.
+        """
+        camera_movement = [0, 0]
+        if np.hypot(camera_movement_x, camera_movement_y) > self.minimum_distance:
+            camera_movement = [camera_movement_x, camera_movement_y]
+            self.old_features = cv2.goodFeaturesToTrack(
+                frame_gray, **self.features)
+
+        # Updating old_gray to be the current frame's grayscale image.
+        self.old_gray = frame_gray
+
+        return camera_movement
+
+    def get_roi_columns(self, mask_features):
+        """
+        Returns the (start, end) column ranges of the frame used for the optical flow.
+        In roi_only mode these are the strips of the mask widened by roi_margin and merged when they overlap.
+        """
+        width = mask_features.shape[1]
+        if not self.roi_only:
+            return [(0, width)]
+
+        masked = np.flatnonzero(mask_features.any(axis=0))
+        # starts and ends of the runs of consecutive masked columns
+        breaks = np.flatnonzero(np.diff(masked) > 1)
+        starts = np.concatenate(([masked[0]], masked[breaks + 1]))
+        ends = np.concatenate((masked[breaks], [masked[-1]])) + 1
+
+        roi_columns = []
+        for start, end in zip(starts, ends):
+            start, end = max(start - self.roi_margin, 0), min(end + self.roi_margin, width)
+            if roi_columns and start <= roi_columns[-1][1]:
+                roi_columns[-1] = (roi_columns[-1][0], end)
+            else:
+                roi_columns.append((start, end))
+        return [(int(start), int(end)) for start, end in roi_columns]
+
+    def prepare_image(self, image, interpolation=cv2.INTER_AREA):
+        # Cropping the ROI strips side by side and resizing them to self.scale of the full resolution
+        if len(self.roi_columns) > 1 or self.roi_columns[0] != (0, image.shape[1]):
+            image = np.hstack([image[:, start:end]
+                               for start, end in self.roi_columns])
+        if self.scale != self.frame_scale:
+            resize = self.scale / self.frame_scale
+            image = cv2.resize(image, None, fx=resize, fy=resize,
+                               interpolation=interpolation)
+        return np.ascontiguousarray(image)
+
+    def prepare_gray(self, frame):
+        # Cropping and resizing before the colour conversion, so only the pixels that are used get converted
+        image = self.prepare_image(frame)
+        if image.ndim == 2:  # already grayscale (FrameCache)
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def get_strip_starts(self):
+        # Columns where each ROI strip starts in the prepared image, at the frame_scale resolution
+        strip_widths = np.array([end - start for start, end in self.roi_columns])
+        return np.concatenate(([0], np.cumsum(strip_widths)[:-1]))
+
+    def get_strips(self, points):
+        # Index of the ROI strip of each (N, 2) point of the prepared grayscale image
+        strip_starts = self.get_strip_starts()
+        x = points[:, 0] * (self.frame_scale / self.scale)
+        return np.clip(np.searchsorted(strip_starts, x, side='right') - 1, 0, len(strip_starts) - 1)
+
+    def to_frame_coordinates(self, points, strip=None):
+        """
+        Mapping (N, 2) points of the prepared grayscale image back to full resolution frame co-ordinates.
+        strip is the index of the ROI strip of each point, by default the strip its x falls in.
+        """
+        if strip is None:
+            strip = self.get_strips(points)
+        points = points * (self.frame_scale / self.scale)
+        if len(self.roi_columns) > 1 or self.roi_columns[0][0] != 0:
+            strip_starts = self.get_strip_starts()
+            column_starts = np.array([start for start, _ in self.roi_columns])
+            points[:, 0] += column_starts[strip] - strip_starts[strip]
+        return points / self.frame_scale
+
+    def estimate_motion(self, old_points, new_points):
+        """
+        Computes the camera movement (old minus new position, like measure_xy_distance) from the (N, 2) arrays of
+        tracked feature points, with all the displacements computed at once.
+        """
+        if len(old_points) == 0:
+            return 0, 0
+
+        displacement = old_points - new_points
+
+        if self.motion_estimator == 'affine' and len(old_points) >= 3:
+            # Fitting old -> new points and measuring how much the centre of the frame moved
+            matrix, _ = cv2.estimateAffinePartial2D(
+                old_points, new_points, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+            if matrix is not None:
+                center_moved = matrix[:, :2] @ self.frame_center + matrix[:, 2]
+                movement = self.frame_center - center_moved
+                return float(movement[0]), float(movement[1])
+
+        if self.motion_estimator in ('median', 'affine'):
+            # also the fallback of the affine fit when there are too few points
+            movement = np.median(displacement, axis=0)
+            return float(movement[0]), float(movement[1])
+
+        # displacement of the feature that moved the most, np.argmax keeps the first one like the loop did
+        distances = np.hypot(displacement[:, 0], displacement[:, 1])
+        x_movement, y_movement = displacement[np.argmax(distances)]
+        return x_movement, y_movement
+
     def draw_camera_movement(self, frames, camera_movement_per_frame):
         output_frames = []
 
         for frame_num, frame in enumerate(frames):
             frame = frame.copy()
+            frame = self.draw_frame_camera_movement(
+                frame, frame_num, camera_movement_per_frame)
+            output_frames.append(frame)
 
-            overlay = frame.copy()
-            cv2.rectangle(overlay, (0, 0), (500, 100), (255, 255, 255), -1)
-            alpha = 0.6  # for ftransparency
-            cv2.addWeighted(overlay, alpha, frame, 1-alpha, 0, frame)
+        return output_frames
 
-            x_movement, y_movement = camera_movement_per_frame[frame_num]
-            frame = cv2.putText(frame, f"Camera Movement X: {x_movement:.2f}", (
-                10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
-            frame = cv2.putText(frame, f"Camera Movement Y: {y_movement:.2f}", (
-                10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+    # Drawing the camera movement of a single frame in place
+    def draw_frame_camera_movement(self, frame, frame_num, camera_movement_per_frame):
+        # blending only the white box in the top-left corner instead of the full frame
+        alpha = 0.6  # for ftransparency
+        draw_transparent_rectangle(
+            frame, (0, 0), (500, 100), (255, 255, 255), alpha)
 
-            output_frames.append(frame)
+        x_movement, y_movement = camera_movement_per_frame[frame_num]
+        frame = cv2.putText(frame, f"Camera Movement X: {x_movement:.2f}", (
+            10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+        frame = cv2.putText(frame, f"Camera Movement Y: {y_movement:.2f}", (
+            10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
 
-        return output_frames
+        return frame
@@ -1,98 +1,381 @@
-from utils import read_video, save_video
+from utils import iter_video, get_video_info, make_video_sink, FrameCache, SpriteCache
 from trackers import Tracker
-from team_assigner import TeamAssigner
+from team_assigner import OnlineTeamAssigner
 from player_ball_assigner import PlayerBallAssigner
 from camera_movement_estimator import CameraMovementEstimator
 from view_transformer import ViewTransformer
 from speed_and_distance_estimator import SpeedAndDistance_Estimator
+from pipeline import StagedExecutor, TrackingStage, CameraMovementStage, TeamAssignmentStage, analyze_video_in_chunks
+from possession_statistics import PossessionStatistics
+from annotation_renderer import build_match_renderer
+from stage_cache import StageCache, encode_tracks, decode_tracks, encode_camera_movement, decode_camera_movement, encode_teams, apply_teams
+from profiling import StageProfiler
+from analytics_export import AnalyticsExporter
+from track_table import TrackTable
+import argparse
+import os
 import cv2
 import numpy as np
 
+# Stages after the tracking that can be left out with --stages, the tracking always runs
+ANALYSIS_STAGES = ('camera_movement', 'teams', 'speed', 'ball')
 
-def main():
 
-    # Reading video
-    video_frames = read_video(
-        '/Users/adityamishra/Documents/Football-Analysis/input-videos/08fd33_4.mp4')
+def parse_team_override(value):
+    # 'track_id:team', e.g. '91:1' for a goalkeeper whose kit matches neither team
+    try:
+        track_id, team = value.split(':')
+        track_id, team = int(track_id), int(team)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TRACK_ID:TEAM, got {value!r}")
+    if team not in (1, 2):
+        raise argparse.ArgumentTypeError(f"the team must be 1 or 2, got {value!r}")
+    return track_id, team
 
-    # Initialising Tracker
-    tracker = Tracker('models/best.pt')
 
-    # Getting object
-    tracks = tracker.get_object_tracks(video_frames,
-                                       read_from_stub=True,
-                                       stub_path='stubs/track_stubs.pkl')
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Detects and tracks the players, referees and ball of a football video, measures their speed, "
+                    "teams and ball possession, and draws them on the video.")
+    parser.add_argument('input', help="input video, the frames are streamed from it instead of being loaded in memory")
+    parser.add_argument('-o', '--output', default='output_videos/output_video.avi',
+                        help="annotated video, the codec is chosen from the extension")
+    parser.add_argument('--video-backend', choices=('opencv', 'ffmpeg'), default='opencv',
+                        help="writer of the annotated video: OpenCV, or an ffmpeg process fed the raw frames (libx264)")
+    parser.add_argument('--threaded-writer', action='store_true',
+                        help="encode the annotated video on a background thread")
+    parser.add_argument('--analytics', default='output_videos/analytics',
+                        help="directory of the columnar analytics: the tracks with every computed column, the camera "
+                             "movement and possession of every frame, and the totals of every player and team")
+    parser.add_argument('--analytics-format', choices=('parquet', 'npz'), default=None,
+                        help="Parquet when pyarrow is installed and NPZ otherwise by default")
+    parser.add_argument('--analytics-window', type=float, default=60,
+                        help="seconds of match in each row group (Parquet) or file (NPZ) of the tracks")
+    parser.add_argument('--no-render', action='store_true',
+                        help="only write the analytics, without decoding the video a second time to draw it")
+    parser.add_argument('--model', default='models/best.pt', help="YOLO weights")
+    parser.add_argument('--detect-every', type=int, default=1,
+                        help="run the detector every N frames and propagate the boxes in between (see KeyframeTracker)")
+    parser.add_argument('--max-drift', type=float, default=None,
+                        help="pixels the fastest track may drift between two keyframes, a shorter interval is used "
+                             "when the tracks move fast")
+    parser.add_argument('--max-camera-movement', type=float, default=None,
+                        help="camera movement (pixels per frame) above which the detector runs on the frame")
+    parser.add_argument('--compensate-camera-movement', action='store_true',
+                        help="propagate the boxes with the camera movement of the frame, for a smooth camera movement "
+                             "estimate (see KeyframeTracker)")
+    parser.add_argument('--cache-dir', default='cache',
+                        help="results of the stages are cached by the content of the video, the model and the "
+                             "parameters, so a second run on the same video skips the detector, the optical flow "
+                             "and the team assignment")
+    parser.add_argument('--no-cache', action='store_true', help="don't read nor write the stage cache")
+    parser.add_argument('--frame-cache', default=None,
+                        help="decoded frames kept on disk (e.g. 'cache/frames/08fd33_4') so that repeated runs on the "
+                             "same clip read them from a memory-mapped file instead of decoding the video again")
+    parser.add_argument('--track-stub', default=None,
+                        help="pickle of the tracks, read when it exists instead of running the detector")
+    parser.add_argument('--camera-movement-stub', default=None,
+                        help="pickle of the camera movement, read when it exists instead of running the optical flow")
+    parser.add_argument('--start-frame', type=int, default=0)
+    parser.add_argument('--end-frame', type=int, default=None, help="first frame left out, the end of the video by default")
+    parser.add_argument('--stride', type=int, default=1,
+                        help="analyse every stride-th frame, the speeds and the output video use the reduced frame rate")
+    parser.add_argument('--stages', nargs='+', choices=ANALYSIS_STAGES, default=list(ANALYSIS_STAGES),
+                        help="stages run after the tracking. Without camera_movement the camera is assumed to be "
+                             "static, ball (possession) needs teams, and drawing the video needs every stage")
+    parser.add_argument('--team-override', type=parse_team_override, action='append', default=[],
+                        metavar='TRACK_ID:TEAM', help="fixes the team of a track, can be repeated")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes analysing the video in parallel chunks (for a whole match), each one runs the "
+                             "tracking, the camera movement and the teams. 0 analyses it in this process")
+    parser.add_argument('--render-workers', type=int, default=2,
+                        help="threads drawing the frames, the drawing of different windows is independent")
+    parser.add_argument('--window-size', type=int, default=40, help="number of frames in each window given to the stages")
+    parser.add_argument('--queue-size', type=int, default=2, help="number of windows queued between two stages")
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help="MB of decoded frames held at the same time, the window size is reduced to stay within it")
+    parser.add_argument('--profile-output', default=None,
+                        help="time of every stage, latency histograms and peak RSS ('.json' or '.csv')")
+    parser.add_argument('--profile-stage', default=None,
+                        help="stage run under cProfile (e.g. 'detect' or 'draw'), its stats are written next to the "
+                             "output as profile.prof")
+    args = parser.parse_args(argv)
 
-    # Getting object positions
-    tracker.add_position_to_tracks(tracks)
+    if args.start_frame < 0:
+        parser.error("--start-frame must be at least 0")
+    if args.end_frame is not None and args.end_frame <= args.start_frame:
+        parser.error("--end-frame must be after --start-frame")
+    if args.stride < 1:
+        parser.error("--stride must be at least 1")
+    if args.workers < 0 or args.render_workers < 1:
+        parser.error("--workers must be at least 0 and --render-workers at least 1")
+    if args.detect_every < 1:
+        parser.error("--detect-every must be at least 1")
+    if args.detect_every == 1 and (args.max_drift is not None or args.max_camera_movement is not None or
+                                   args.compensate_camera_movement):
+        parser.error("--max-drift, --max-camera-movement and --compensate-camera-movement need --detect-every above 1")
+    if (args.max_drift is not None and args.max_drift <= 0) or \
+            (args.max_camera_movement is not None and args.max_camera_movement <= 0):
+        parser.error("--max-drift and --max-camera-movement must be positive")
+    # a stub holds every frame of its clip, its rows would be matched to the wrong frames of a range or a stride
+    if (args.track_stub is not None or args.camera_movement_stub is not None) and \
+            (args.start_frame != 0 or args.end_frame is not None or args.stride != 1):
+        parser.error("the stubs hold the whole clip, they can't be used with --start-frame, --end-frame or --stride")
+    if args.workers > 0:
+        # the chunk workers decode their own chunk of the video and always run the camera movement and the teams
+        if args.track_stub is not None or args.camera_movement_stub is not None:
+            parser.error("the stubs can't be used with --workers, the chunks are analysed from the video")
+        if args.frame_cache is not None:
+            parser.error("--frame-cache can't be used with --workers, each chunk decodes its own frames")
+        if not {'camera_movement', 'teams'} <= set(args.stages):
+            parser.error("--workers runs the camera movement and the teams in every chunk, keep them in --stages")
+    if args.analytics_window <= 0:
+        parser.error("--analytics-window must be positive")
+    if args.memory_budget is not None and args.memory_budget <= 0:
+        parser.error("--memory-budget must be positive")
+    if 'ball' in args.stages and 'teams' not in args.stages:
+        parser.error("the ball possession needs the teams, add teams to --stages")
+    if not args.no_render and set(args.stages) != set(ANALYSIS_STAGES):
+        parser.error("drawing the video needs every stage, use --no-render to run only some of them")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    video_path = args.input
+    model_path = args.model
+    stages = set(args.stages)
+    window_size = args.window_size
+
+    profiler = StageProfiler(profile_stage=args.profile_stage,
+                             profile_path=os.path.join(os.path.dirname(args.output), 'profile.prof')
+                             if args.profile_stage is not None else None)
+    profiler.start()
+
+    # frame rate of the analysed frames, used for the speeds and for the output video
+    video_info = get_video_info(video_path)
+    frame_rate = video_info.fps / args.stride
+    frame_range = (args.start_frame, args.end_frame, args.stride)
+    memory_budget = args.memory_budget * 2**20 if args.memory_budget is not None else None
+    frame_bytes = video_info.width * video_info.height * 3
+
+    # frames are read from the frame cache when there is one, it only holds the frames of the range
+    video = video_path
+    video_range = frame_range
+    if args.frame_cache is not None:
+        video = FrameCache.load_or_build(video_path, args.frame_cache,
+                                         start_frame=args.start_frame, end_frame=args.end_frame)
+        video_range = (0, None, args.stride)
+
+    def iter_frames():
+        return iter_video(video, *video_range)
+
+    # Initialising Tracker
+    tracker = Tracker(model_path)
+    tracker.profiler = profiler
 
     # Adding camera movement estimator
     # Initialising by first frame
-    camera_movement_estimator = CameraMovementEstimator(video_frames[0])
-    camera_movement_per_frame = camera_movement_estimator.get_camera_movement(video_frames,
-                                                                              read_from_stub=True,
-                                                                              stub_path='stubs/camera_movement_stub.pkl')
+    first_frame = next(iter_frames(), None)
+    if first_frame is None:
+        raise IOError(f"no frames could be read from {video_path} in the range {frame_range}")
+    camera_movement_estimator = CameraMovementEstimator(first_frame)
+
+    # initialising team assigner, the team colours start from the first frame and are refined during the match
+    team_assigner = OnlineTeamAssigner(team_overrides=dict(args.team_override))
+
+    # the detector only runs on keyframes with --detect-every, they also depend on the camera movement
+    keyframe_options = None
+    if args.detect_every > 1:
+        keyframe_options = {'detect_every': args.detect_every, 'max_drift': args.max_drift,
+                            'max_camera_movement': args.max_camera_movement,
+                            'compensate_camera_movement': args.compensate_camera_movement}
+
+    # Results of the stages are cached by the content of the video, the frame range, the model and the parameters
+    # the content of a stub is part of the key, so the teams computed on stub tracks are never taken for real ones
+    cache = None
+    tracks_key = camera_movement_key = teams_key = None
+    if not args.no_cache:
+        cache = StageCache(args.cache_dir)
+        video_hash = cache.file_hash(video_path)
+        camera_movement_key = cache.key('camera_movement', video_hash, frame_range=frame_range,
+                                        params={'motion_estimator': camera_movement_estimator.motion_estimator,
+                                                'scale': camera_movement_estimator.scale,
+                                                'roi_only': camera_movement_estimator.roi_only,
+                                                'chunked': args.workers > 0,
+                                                'stub': cache.file_hash(args.camera_movement_stub)})
+        # the keyframes are chosen and the boxes propagated with the camera movement when it is measured
+        tracks_key = cache.key('tracks', video_hash, frame_range=frame_range,
+                               model_hash=cache.file_hash(model_path),
+                               params={'conf': tracker.detection_engine.conf,
+                                       'imgsz': tracker.detection_engine.imgsz,
+                                       'half': tracker.detection_engine.half,
+                                       'keyframe_options': keyframe_options,
+                                       'chunked': args.workers > 0,
+                                       'stub': cache.file_hash(args.track_stub)},
+                               upstream=[camera_movement_key]
+                               if keyframe_options is not None and 'camera_movement' in stages else ())
+        teams_key = cache.key('teams', video_hash, frame_range=frame_range,
+                              params={'assigner': type(team_assigner).__name__,
+                                      'color_mode': team_assigner.color_mode,
+                                      'team_overrides': team_assigner.team_overrides},
+                              upstream=[tracks_key])
+
+    camera_movement_per_frame = None
+    if args.workers > 0:
+        # the chunks are only analysed when one of their stages is missing from the cache
+        cached = None
+        if cache is not None:
+            cached = [cache.load(key) for key in (tracks_key, camera_movement_key, teams_key)]
+        if cached is not None and all(arrays is not None for arrays in cached):
+            tracks = decode_tracks(cached[0])
+            camera_movement_per_frame = decode_camera_movement(cached[1])
+            team_colors = apply_teams(tracks, cached[2])
+        else:
+            # each process tracks its own chunk of the video, the chunks are stitched on their overlapping frames
+            if memory_budget is not None:
+                # every process holds one window of frames
+                window_size = max(1, min(window_size, int(memory_budget // (args.workers * frame_bytes))))
+            with profiler.stage('chunk_analysis') as timer:
+                tracks, camera_movement_per_frame, team_colors = analyze_video_in_chunks(
+                    video_path, model_path, workers=args.workers, window_size=window_size,
+                    camera_movement_options={'motion_estimator': camera_movement_estimator.motion_estimator,
+                                             'scale': camera_movement_estimator.scale,
+                                             'roi_only': camera_movement_estimator.roi_only},
+                    color_mode=team_assigner.color_mode,
+                    team_overrides=team_assigner.team_overrides,
+                    start_frame=args.start_frame, end_frame=args.end_frame, stride=args.stride,
+                    keyframe_options=keyframe_options)
+                timer.frames = len(tracks['players'])
+            if cache is not None:
+                cache.save(tracks_key, encode_tracks(tracks))
+                cache.save(camera_movement_key, encode_camera_movement(camera_movement_per_frame))
+                cache.save(teams_key, encode_teams(tracks, team_colors))
+        if cache is not None:
+            print(f"Stage cache: {cache.stats}")
+    else:
+        # First pass over the video: getting object tracks, camera movement and player teams
+        # decoding, detection, optical flow and team assignment run at the same time on their own threads
+        analysis_pipeline = StagedExecutor(
+            iter_frames(), window_size, args.queue_size, profiler=profiler)
+        # the camera movement of a window is measured before it is tracked, the keyframe tracking reads it
+        camera_movement_stage = None
+        if 'camera_movement' in stages:
+            camera_movement_stage = CameraMovementStage(camera_movement_estimator,
+                                                        read_from_stub=args.camera_movement_stub is not None,
+                                                        stub_path=args.camera_movement_stub,
+                                                        cache=cache, cache_key=camera_movement_key)
+            analysis_pipeline.add_stage(camera_movement_stage, name='camera_movement')
+        tracking_stage = TrackingStage(tracker,
+                                       read_from_stub=args.track_stub is not None,
+                                       stub_path=args.track_stub,
+                                       cache=cache, cache_key=tracks_key, keyframe_options=keyframe_options,
+                                       camera_movement_per_frame=camera_movement_stage.camera_movement
+                                       if camera_movement_stage is not None else None)
+        analysis_pipeline.add_stage(tracking_stage, name='track')
+        if 'teams' in stages:
+            analysis_pipeline.add_stage(
+                TeamAssignmentStage(team_assigner, tracking_stage.tracks,
+                                    cache=cache, cache_key=teams_key), name='team')
+        if memory_budget is not None:
+            analysis_pipeline.limit_memory(memory_budget, frame_bytes)
+        analysis_pipeline.run()
+        if cache is not None:
+            print(f"Stage cache: {cache.stats}")
+        print(analysis_pipeline.report())
+
+        tracks = tracking_stage.tracks
+        team_colors = team_assigner.team_colors
+        if camera_movement_stage is not None:
+            camera_movement_per_frame = camera_movement_stage.camera_movement
+
+    number_of_frames = len(tracks['players'])
+    if camera_movement_per_frame is None:
+        # without the camera movement stage the camera is assumed to be static
+        camera_movement_per_frame = [[0, 0]] * number_of_frames
+
+    # Interpolating/inserting ball positions
+    # isolated jumps faster than 60 pixels per frame are false positives, gaps longer than 2 seconds are left without ball
+    with profiler.stage('interpolation', number_of_frames):
+        tracks["ball"] = tracker.interpolate_ball_positions(
+            tracks["ball"], max_gap=int(2 * frame_rate), max_speed=60 * args.stride)
+
+    # the enrichment stages run on the columns of a TrackTable, each one in a few vectorized passes over every row
+    # instead of a loop over the dictionaries of every frame. Each team is drawn in its final colour, like when
+    # the teams are read from the stage cache
+    with profiler.stage('track_table', number_of_frames):
+        tracks = TrackTable.from_tracks(tracks, team_colors=team_colors)
+
+    # Getting object positions
+    with profiler.stage('positions', number_of_frames):
+        tracker.add_position_to_tracks(tracks)
+
     # Calling adjust camera position
-    camera_movement_estimator.add_adjust_positions_to_tracks(
-        tracks, camera_movement_per_frame)
+    with profiler.stage('camera_adjustment', number_of_frames):
+        camera_movement_estimator.add_adjust_positions_to_tracks(
+            tracks, camera_movement_per_frame)
 
     # Added View Transformer
     view_transformer = ViewTransformer()
-    view_transformer.add_transformed_position_to_tracks(tracks)
-
-    # Interpolating/inserting ball positions
-    tracks["ball"] = tracker.interpolate_ball_positions(tracks["ball"])
+    with profiler.stage('view_transform', number_of_frames):
+        view_transformer.add_transformed_position_to_tracks(tracks)
 
     # Adding speed and distance estimator
-    speed_and_distance_estimator = SpeedAndDistance_Estimator()
-    speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
-
-    # Assigning player teams
-    team_assigner = TeamAssigner()  # initialising team assigner
-    # assigning team their colours and by giving them first frame and tracks of player in first frame
-    team_assigner.assign_team_color(video_frames[0],
-                                    tracks['players'][0])
-
-    # Looping over each player in each frame and assigning them to colour team
-    for frame_num, player_track in enumerate(tracks['players']):
-        for player_id, track in player_track.items():
-            team = team_assigner.get_player_team(video_frames[frame_num],
-                                                 track['bbox'], player_id)
-            tracks['players'][frame_num][player_id]['team'] = team
-            tracks['players'][frame_num][player_id]['team_color'] = team_assigner.team_colors[team]
+    # the speed is measured over 5 frames on positions smoothed over 5 frames
+    speed_and_distance_estimator = SpeedAndDistance_Estimator(
+        frame_window=5, frame_rate=frame_rate, smoothing_window=5)
+    if 'speed' in stages:
+        with profiler.stage('speed', number_of_frames):
+            speed_and_distance_estimator.add_speed_and_distance_to_tracks(tracks)
 
     # Assigning ball to player function
-    player_assigner = PlayerBallAssigner()
-    team_ball_control = []
-    for frame_num, player_track in enumerate(tracks['players']):
-        ball_bbox = tracks['ball'][frame_num][1]['bbox']
-        assigned_player = player_assigner.assign_ball_to_player(
-            player_track, ball_bbox)
-
-        if assigned_player != -1:
-            tracks['players'][frame_num][assigned_player]['has_ball'] = True
-            # we getting tracks of players of frame numbers and then assign teamp player with team
-            team_ball_control.append(
-                tracks['players'][frame_num][assigned_player]['team'])
-        else:
-            # last person who has the ball
-            team_ball_control.append(team_ball_control[-1])
-    team_ball_control = np.array(team_ball_control)
-
-    # Calling draw output function for object tracks
-    output_video_frames = tracker.draw_annotations(
-        video_frames, tracks, team_ball_control)
+    # the ball of every frame is assigned in one call, frames where no player has the ball keep the team of the last player who had it
+    team_ball_control = None
+    possession_statistics = None
+    if 'ball' in stages:
+        player_assigner = PlayerBallAssigner()
+        with profiler.stage('ball_assignment', number_of_frames):
+            team_ball_control = player_assigner.add_ball_possession_to_tracks(tracks)
+        # share of possession of each team for every frame, since the start and over the last 5 minutes
+        with profiler.stage('possession', number_of_frames):
+            possession_statistics = PossessionStatistics(
+                team_ball_control, frame_rate=frame_rate, rolling_window_seconds=300)
 
-    # Drawing camera movement
-    output_video_frames = camera_movement_estimator.draw_camera_movement(
-        output_video_frames, camera_movement_per_frame)
+    # the tracks are written one window of the match at a time, with the totals of every player and team
+    analytics_exporter = AnalyticsExporter(args.analytics, frame_rate=frame_rate, window_seconds=args.analytics_window,
+                                           format=args.analytics_format, start_frame=args.start_frame,
+                                           stride=args.stride)
+    with profiler.stage('analytics_export', number_of_frames):
+        analytics_exporter.export(tracks, camera_movement_per_frame, team_ball_control)
 
-    # Draw Speed and Distance
-    speed_and_distance_estimator.draw_speed_and_distance(
-        output_video_frames, tracks)
+    if not args.no_render:
+        # Second pass over the video: drawing all the overlays on each frame in one pass and saving it as soon as it is drawn
+        # the ellipses, id labels and triangles are rendered once and copied into the frames
+        tracker.sprite_cache = SpriteCache()
+        # the drawing reads the tracks of each frame from a dictionary view of the table
+        renderer = build_match_renderer(tracker, tracks.as_tracks(), possession_statistics,
+                                        camera_movement_estimator, camera_movement_per_frame,
+                                        speed_and_distance_estimator)
+        render_frames = iter_frames()
+        if args.frame_cache is not None:
+            # the frames of the cache are read-only, each one is copied before being drawn on
+            render_frames = (np.array(frame) for frame in render_frames)
+        render_pipeline = StagedExecutor(render_frames, args.window_size, args.queue_size, profiler=profiler)
+        render_pipeline.add_stage(renderer, workers=args.render_workers, name='draw')
+        # the output has the frame rate of the analysed frames, the OpenCV codec is chosen from the extension
+        render_pipeline.set_sink(make_video_sink(args.output, fps=frame_rate, backend=args.video_backend,
+                                                 threaded=args.threaded_writer))
+        if memory_budget is not None:
+            render_pipeline.limit_memory(memory_budget, frame_bytes)
+        render_pipeline.run()
+        print(render_pipeline.report())
 
-    # Saving video
-    save_video(output_video_frames, 'output_videos/output_video.avi')
+    profiler.stop()
+    print(profiler.report())
+    if args.profile_stage is not None:
+        print(profiler.profile_report())
+    if args.profile_output is not None:
+        profiler.save(args.profile_output)
 
 
 if __name__ == "__main__":
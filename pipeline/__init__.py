@@ -0,0 +1,4 @@
+from .frame_pipeline import FramePipeline
+from .staged_executor import StagedExecutor
+from .stages import TrackingStage, CameraMovementStage, TeamAssignmentStage
+from .chunk_parallel import analyze_video_in_chunks, split_into_chunks, stitch_chunk_results
@@ -0,0 +1,201 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils import iter_video, get_frame_count, bbox_iou
+from trackers import Tracker
+from camera_movement_estimator import CameraMovementEstimator
+from team_assigner import OnlineTeamAssigner
+from .frame_pipeline import FramePipeline
+from .stages import TrackingStage, CameraMovementStage, TeamAssignmentStage
+
+"""
+Chunk-parallel analysis of a long match.
+
+The video is split into chunks of chunk_size frames, each chunk starting `overlap` frames before the end of the
+previous one. Every chunk is analysed (tracking, camera movement and team assignment) in its own worker process,
+then the results are stitched:
+- the ByteTrack ids of a chunk are matched to the ids of the previous chunks by the IoU of their bboxes on the
+  overlapping frames, tracks that are not matched get new ids;
+- the overlapping frames of a chunk are only used for this matching and for warming up the optical flow,
+  the frames of the previous chunk are kept;
+- the teams of a chunk are swapped when its team colours are closer to the swapped colours of the first chunk.
+Positions, speeds, cumulative distances and ball control are computed afterwards on the stitched tracks of the
+whole match, so they carry over the chunk boundaries like in a single process run.
+"""
+
+
+def split_into_chunks(number_of_frames, chunk_size, overlap):
+    """
+    Returns (start, stop, kept_start) for every chunk: frames start to stop (excluded) are analysed,
+    the frames from kept_start are the ones kept in the stitched result.
+    """
+    chunks = []
+    for kept_start in range(0, number_of_frames, chunk_size):
+        start = max(kept_start - overlap, 0)
+        chunks.append(
+            (start, min(kept_start + chunk_size, number_of_frames), kept_start))
+    return chunks
+
+
+def analyze_chunk(video_path, model_path, start, stop, window_size=40, camera_movement_options=None, color_mode='fast',
+                  detection_options=None, start_frame=0, stride=1, keyframe_options=None):
+    # Runs in a worker process: every component (and the YOLO model) is created in the process, only the results are sent back
+    # start and stop count the analysed frames, frame i is the frame start_frame + i * stride of the video
+    frames = iter_video(video_path, start_frame + start * stride, start_frame + stop * stride, stride)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        return {'tracks': {"players": [], "referees": [], "ball": []}, 'camera_movement': [], 'team_colors': {}}
+
+    tracker = Tracker(model_path, **(detection_options or {}))
+    camera_movement_estimator = CameraMovementEstimator(
+        first_frame, **(camera_movement_options or {}))
+    team_assigner = OnlineTeamAssigner(color_mode=color_mode)
+
+    # the camera movement of a window is measured before it is tracked, for the keyframes of keyframe_options
+    camera_movement_stage = CameraMovementStage(camera_movement_estimator)
+    tracking_stage = TrackingStage(tracker, keyframe_options=keyframe_options,
+                                   camera_movement_per_frame=camera_movement_stage.camera_movement)
+    pipeline = FramePipeline(itertools.chain(
+        [first_frame], frames), window_size)
+    pipeline.add_stage(camera_movement_stage)
+    pipeline.add_stage(tracking_stage)
+    pipeline.add_stage(TeamAssignmentStage(
+        team_assigner, tracking_stage.tracks))
+    pipeline.run()
+
+    return {'tracks': tracking_stage.tracks,
+            'camera_movement': camera_movement_stage.camera_movement,
+            'team_colors': team_assigner.team_colors}
+
+
+def match_track_ids(previous_frames, next_frames, min_iou=0.5):
+    """
+    Matches the track ids of next_frames to the ids of previous_frames, both being lists of {track_id: track_info}
+    of the same (overlapping) frames. Each pair of ids gets a vote for every frame where the boxes overlap by
+    at least min_iou, then the pairs are matched one to one, the most voted first.
+    Returns a dictionary next id -> previous id.
+    """
+    votes = {}
+    for previous_track, next_track in zip(previous_frames, next_frames):
+        if not previous_track or not next_track:
+            continue
+        previous_ids = list(previous_track)
+        next_ids = list(next_track)
+        iou = bbox_iou([next_track[track_id]['bbox'] for track_id in next_ids],
+                       [previous_track[track_id]['bbox'] for track_id in previous_ids])
+        best = iou.argmax(axis=1)
+        for i, j in enumerate(best):
+            if iou[i, j] >= min_iou:
+                pair = (next_ids[i], previous_ids[j])
+                votes[pair] = votes.get(pair, 0) + 1
+
+    mapping = {}
+    used_previous_ids = set()
+    for (next_id, previous_id), _ in sorted(votes.items(), key=lambda item: -item[1]):
+        if next_id in mapping or previous_id in used_previous_ids:
+            continue
+        mapping[next_id] = previous_id
+        used_previous_ids.add(previous_id)
+    return mapping
+
+
+def match_teams(reference_colors, team_colors):
+    # Returns the team mapping of a chunk (1 and 2 are swapped when its colours match the reference colours swapped)
+    if not reference_colors or not team_colors:
+        return {1: 1, 2: 2}
+    kept = np.linalg.norm(np.asarray(team_colors[1]) - reference_colors[1]) + \
+        np.linalg.norm(np.asarray(team_colors[2]) - reference_colors[2])
+    swapped = np.linalg.norm(np.asarray(team_colors[1]) - reference_colors[2]) + \
+        np.linalg.norm(np.asarray(team_colors[2]) - reference_colors[1])
+    return {1: 2, 2: 1} if swapped < kept else {1: 1, 2: 2}
+
+
+def set_team(track_info, team, team_colors):
+    # Sets the team of a track and its colour, when the chunks found the colour of this team
+    track_info['team'] = team
+    if team_colors is not None and team_colors.get(team) is not None:
+        track_info['team_color'] = team_colors[team]
+
+
+def stitch_chunk_results(chunks, results, team_overrides=None):
+    """
+    Stitches the results of analyze_chunk into the tracks, the camera movement and the team colours of the
+    whole video. The track ids of the first chunk are kept, so team_overrides (track id -> team) refer to them.
+    """
+    tracks = {"players": [], "referees": [], "ball": []}
+    camera_movement_per_frame = []
+    reference_colors = None
+    # ByteTrack ids are shared by the players and the referees, so are the new ids
+    next_track_id = 1
+
+    for (start, _, kept_start), result in zip(chunks, results):
+        overlap = kept_start - start
+        chunk_tracks = result['tracks']
+        if reference_colors is None and result['team_colors']:
+            reference_colors = dict(result['team_colors'])
+        team_mapping = match_teams(reference_colors, result['team_colors'])
+
+        for object in ("players", "referees"):
+            if kept_start == 0:
+                # the ids of the first chunk are kept as they are
+                mapping = {track_id: track_id for track in chunk_tracks[object]
+                           for track_id in track}
+            else:
+                mapping = match_track_ids(
+                    tracks[object][start:kept_start], chunk_tracks[object][:overlap])
+            if mapping:
+                next_track_id = max(next_track_id, max(mapping.values()) + 1)
+
+            for track in chunk_tracks[object][overlap:]:
+                stitched_track = {}
+                for track_id, track_info in track.items():
+                    if track_id not in mapping:
+                        mapping[track_id] = next_track_id
+                        next_track_id += 1
+                    if 'team' in track_info:
+                        set_team(track_info, team_mapping.get(track_info['team'], track_info['team']),
+                                 reference_colors)
+                    stitched_track[mapping[track_id]] = track_info
+                tracks[object].append(stitched_track)
+
+        tracks["ball"].extend(chunk_tracks["ball"][overlap:])
+        camera_movement_per_frame.extend(result['camera_movement'][overlap:])
+
+    for player_id, team in (team_overrides or {}).items():
+        for player_track in tracks["players"]:
+            if player_id in player_track:
+                set_team(player_track[player_id], team, reference_colors)
+                player_track[player_id]['team_confidence'] = 1.0
+
+    return tracks, camera_movement_per_frame, reference_colors or {}
+
+
+def analyze_video_in_chunks(video_path, model_path, chunk_size=2400, overlap=48, workers=None, window_size=40,
+                            camera_movement_options=None, color_mode='fast', team_overrides=None, number_of_frames=None,
+                            detection_options=None, start_frame=0, end_frame=None, stride=1, keyframe_options=None):
+    """
+    Analyses the video in chunks of chunk_size frames in `workers` processes (None for the number of cores)
+    and returns the stitched tracks, camera movement per frame and team colours.
+    Each worker loads its own YOLO model, so the number of workers is also limited by the GPU memory.
+    detection_options are the keyword arguments of Tracker (batch_size, conf, imgsz, half, adaptive_batch_size).
+    With keyframe_options (the keyword arguments of KeyframeTracker) the detector of each chunk only runs on keyframes.
+    Only every stride-th frame from start_frame to end_frame (excluded, None for the end) is analysed, like iter_video,
+    and the results are indexed by analysed frame.
+    number_of_frames (of analysed frames) defaults to the one given by the frame count of the video header.
+    """
+    if overlap < 1:
+        raise ValueError(
+            "overlap must be at least 1 frame to stitch the chunks")
+    if number_of_frames is None:
+        end = get_frame_count(video_path) if end_frame is None else end_frame
+        number_of_frames = len(range(start_frame, end, stride))
+    chunks = split_into_chunks(number_of_frames, chunk_size, overlap)
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(analyze_chunk, video_path, model_path, start, stop, window_size,
+                                   camera_movement_options, color_mode, detection_options, start_frame, stride,
+                                   keyframe_options)
+                   for start, stop, _ in chunks]
+        results = [future.result() for future in futures]
+
+    return stitch_chunk_results(chunks, results, team_overrides)
@@ -0,0 +1,86 @@
+import itertools
+
+
+class FramePipeline:
+    """
+    Streams the frames of a video through a list of stages and into an optional sink.
+
+    frames: any iterable of frames, usually the generator returned by iter_video.
+    window_size: number of frames decoded and held at the same time. The peak memory of the
+    pipeline is bounded by this window and not by the length of the video.
+
+    A stage is any object with a process_window(start_frame_num, frames) method returning the
+    (possibly annotated) frames of the window, and an optional close() method called at the end.
+    A stage with needs_frames = False (e.g. its result was loaded from a cache) doesn't need the frames,
+    when no stage needs them and there is no sink the video is not decoded at all.
+    A sink is any object with write(frame) and close() methods, like utils.VideoSink.
+    """
+
+    def __init__(self, frames, window_size=40):
+        if window_size < 1:
+            raise ValueError("window_size must be at least 1")
+        self.frames = frames
+        self.window_size = window_size
+        self.stages = []
+        self.sink = None
+
+    def add_stage(self, stage):
+        self.stages.append(stage)
+        return self
+
+    def set_sink(self, sink):
+        self.sink = sink
+        return self
+
+    def windows_held(self):
+        # Number of windows of frames held at the same time
+        return 1
+
+    def limit_memory(self, memory_budget, frame_bytes):
+        """
+        Reduces the window size so that the frames held at the same time take at most memory_budget bytes,
+        frame_bytes being the size of one decoded frame. The window size is at least 1 frame, returns it.
+        """
+        window_size = memory_budget // (self.windows_held() * frame_bytes)
+        self.window_size = max(1, min(self.window_size, int(window_size)))
+        return self.window_size
+
+    def needs_frames(self):
+        return self.sink is not None or any(getattr(stage, 'needs_frames', True) for stage in self.stages)
+
+    def run(self):
+        # Returns the number of frames that went through the pipeline
+        if not self.needs_frames():
+            for stage in self.stages:
+                if hasattr(stage, 'close'):
+                    stage.close()
+            return 0
+
+        frames = iter(self.frames)
+        frame_num = 0
+        try:
+            while True:
+                # decoding the next window of frames, the previous one is released here
+                window = list(itertools.islice(frames, self.window_size))
+                if not window:
+                    break
+
+                # every stage sees the window in the order the stages were added
+                for stage in self.stages:
+                    window = stage.process_window(frame_num, window)
+
+                if self.sink is not None:
+                    for frame in window:
+                        self.sink.write(frame)
+
+                frame_num += len(window)
+
+            # stages are only closed when the whole video went through, so partial results are never saved
+            for stage in self.stages:
+                if hasattr(stage, 'close'):
+                    stage.close()
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+
+        return frame_num
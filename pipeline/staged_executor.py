@@ -0,0 +1,230 @@
+import itertools
+import queue
+import threading
+import time
+from profiling import stage_timer
+from .frame_pipeline import FramePipeline
+
+# Marks the end of the stream in the queues between the threads
+END_OF_STREAM = object()
+
+
+class StagedExecutor(FramePipeline):
+    """
+    FramePipeline where decoding, every stage and encoding run at the same time on their own threads.
+
+    The threads are connected by bounded queues of queue_size windows: a slow stage makes the stages before it
+    wait (backpressure) instead of letting the decoded frames pile up in memory, so at most about
+    (number of stages + 2) * queue_size windows are held at once.
+    OpenCV, NumPy and PyTorch release the GIL in their heavy calls, so the wall time of a run gets close to the
+    time of the slowest stage instead of the sum of all the stages.
+
+    A stage added with workers > 1 processes several windows at once. Its windows are put back in order before
+    being given to the next stage, so it must not depend on the windows before it (e.g. the AnnotationRenderer,
+    not the TrackingStage or the CameraMovementStage).
+
+    After run(), self.stats has one entry per thread ('decode', the stages and 'encode') with the number of
+    frames, the busy time, the time spent waiting for input (input_stall) or for the next stage (output_stall)
+    and the throughput in frames per second of busy time.
+    With a StageProfiler, every window of every thread is also recorded in it under the name of the thread.
+    """
+
+    def __init__(self, frames, window_size=40, queue_size=4, profiler=None):
+        super().__init__(frames, window_size)
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.queue_size = queue_size
+        self.profiler = profiler
+        self.stage_workers = []
+        self.stage_names = []
+        self.stats = {}
+        self.wall_time = 0
+
+    def add_stage(self, stage, workers=1, name=None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        name = name or type(stage).__name__
+        if name in self.stage_names or name in ('decode', 'encode'):
+            name = f"{name}-{len(self.stages)}"
+        self.stage_workers.append(workers)
+        self.stage_names.append(name)
+        return super().add_stage(stage)
+
+    def windows_held(self):
+        # the windows in the queues between the threads, and the one being processed by each thread
+        return (len(self.stages) + 1) * self.queue_size + sum(self.stage_workers) + 2
+
+    def run(self):
+        # Returns the number of frames that went through the pipeline
+        if not self.needs_frames():
+            return super().run()
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.stats = {}
+        names = ['decode'] + self.stage_names + ['encode']
+        for name in names:
+            self.stats[name] = {'frames': 0, 'busy_time': 0.0,
+                                'input_stall': 0.0, 'output_stall': 0.0}
+
+        queues = [queue.Queue(self.queue_size)
+                  for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._decode, args=(queues[0],), name='decode')]
+        for i, stage in enumerate(self.stages):
+            threads.extend(self._stage_threads(
+                stage, self.stage_names[i], self.stage_workers[i], queues[i], queues[i + 1]))
+        threads.append(threading.Thread(
+            target=self._encode, args=(queues[-1],), name='encode'))
+
+        start_time = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.wall_time = time.perf_counter() - start_time
+            if self.sink is not None:
+                self.sink.close()
+
+        if self.errors:
+            raise self.errors[0]
+
+        for name, stats in self.stats.items():
+            stats['fps'] = stats['frames'] / \
+                stats['busy_time'] if stats['busy_time'] > 0 else 0.0
+
+        # stages are only closed when the whole video went through, so partial results are never saved
+        for stage in self.stages:
+            if hasattr(stage, 'close'):
+                stage.close()
+
+        return self.stats['encode']['frames']
+
+    def report(self):
+        # Table of the stats of the last run, one line per thread
+        lines = [f"{'stage':<24}{'frames':>8}{'busy s':>9}{'in stall s':>12}{'out stall s':>13}{'fps':>12}"]
+        for name, stats in self.stats.items():
+            lines.append(f"{name:<24}{stats['frames']:>8}{stats['busy_time']:>9.2f}{stats['input_stall']:>12.2f}"
+                         f"{stats['output_stall']:>13.2f}{stats.get('fps', 0.0):>12.1f}")
+        lines.append(f"wall time: {self.wall_time:.2f} s")
+        return "\n".join(lines)
+
+    # Queue operations that give up when another thread failed, and count the time spent blocked
+
+    def _put(self, output_queue, item, stats):
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        stats['output_stall'] += time.perf_counter() - start
+
+    def _get(self, input_queue, stats):
+        start = time.perf_counter()
+        item = END_OF_STREAM
+        while not self.stop.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        stats['input_stall'] += time.perf_counter() - start
+        return item
+
+    def _fail(self, error):
+        self.errors.append(error)
+        self.stop.set()
+
+    # Threads
+
+    def _decode(self, output_queue):
+        stats = self.stats['decode']
+        try:
+            frames = iter(self.frames)
+            frame_num = 0
+            window_index = 0
+            while not self.stop.is_set():
+                start = time.perf_counter()
+                with stage_timer(self.profiler, 'decode') as timer:
+                    window = list(itertools.islice(frames, self.window_size))
+                    timer.frames = len(window)
+                stats['busy_time'] += time.perf_counter() - start
+                if not window:
+                    break
+                stats['frames'] += len(window)
+                self._put(output_queue, (window_index, frame_num, window), stats)
+                frame_num += len(window)
+                window_index += 1
+        except Exception as error:
+            self._fail(error)
+        finally:
+            self._put(output_queue, END_OF_STREAM, stats)
+
+    def _stage_threads(self, stage, name, workers, input_queue, output_queue):
+        stats = self.stats[name]
+        lock = threading.Condition()
+        # next window index to give to the next stage, and number of workers still running
+        state = {'next_window': 0, 'running': workers}
+
+        def emit(item):
+            # windows finished out of order wait for their turn, the other workers keep processing
+            window_index = item[0]
+            with lock:
+                start = time.perf_counter()
+                while state['next_window'] != window_index and not self.stop.is_set():
+                    lock.wait(0.1)
+                stats['output_stall'] += time.perf_counter() - start
+            self._put(output_queue, item, stats)
+            with lock:
+                state['next_window'] += 1
+                lock.notify_all()
+
+        def work():
+            try:
+                while True:
+                    item = self._get(input_queue, stats)
+                    if item is END_OF_STREAM:
+                        # giving the end back to the other workers of the stage
+                        self._put(input_queue, END_OF_STREAM, stats)
+                        break
+                    window_index, start_frame_num, frames = item
+                    start = time.perf_counter()
+                    with stage_timer(self.profiler, name, len(frames)):
+                        frames = stage.process_window(start_frame_num, frames)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        stats['busy_time'] += elapsed
+                        stats['frames'] += len(frames)
+                    emit((window_index, start_frame_num, frames))
+            except Exception as error:
+                self._fail(error)
+            finally:
+                with lock:
+                    state['running'] -= 1
+                    last = state['running'] == 0
+                if last:
+                    self._put(output_queue, END_OF_STREAM, stats)
+
+        return [threading.Thread(target=work, name=f"{name}-{i}") for i in range(workers)]
+
+    def _encode(self, input_queue):
+        stats = self.stats['encode']
+        try:
+            while True:
+                item = self._get(input_queue, stats)
+                if item is END_OF_STREAM:
+                    break
+                _, _, frames = item
+                start = time.perf_counter()
+                if self.sink is not None:
+                    with stage_timer(self.profiler, 'encode', len(frames)):
+                        for frame in frames:
+                            self.sink.write(frame)
+                stats['busy_time'] += time.perf_counter() - start
+                stats['frames'] += len(frames)
+        except Exception as error:
+            self._fail(error)
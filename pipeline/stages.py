@@ -0,0 +1,134 @@
+import pickle
+import os
+from stage_cache import encode_tracks, decode_tracks, encode_camera_movement, decode_camera_movement, encode_teams, apply_teams
+
+"""
+Stages wrapping the existing components so they can be used in a FramePipeline.
+Each stage consumes the frames of a window and keeps its results (tracks, camera movement) as attributes.
+
+A stage given a StageCache and a cache key takes its result from the cache when the key is there, otherwise from
+the stub, and saves what it computed to the cache. What was read from a stub is never saved to the cache: the key
+doesn't describe the stub, which may come from another video. A stage whose result was loaded has needs_frames = False, when no
+stage needs the frames the pipeline doesn't decode the video at all.
+"""
+
+
+# Loading the result of a stage from a pickle stub if it exists
+def load_stub(read_from_stub, stub_path):
+    if read_from_stub and stub_path is not None and os.path.exists(stub_path):
+        with open(stub_path, 'rb') as f:
+            return pickle.load(f)
+    return None
+
+
+def save_stub(data, stub_path):
+    if stub_path is not None:
+        with open(stub_path, 'wb') as f:
+            pickle.dump(data, f)
+
+
+# Loading the result of a stage from the cache if the key is there
+def load_cached(cache, cache_key, decode):
+    if cache is None or cache_key is None:
+        return None
+    arrays = cache.load(cache_key)
+    return decode(arrays) if arrays is not None else None
+
+
+class TrackingStage:
+    def __init__(self, tracker, read_from_stub=False, stub_path=None, cache=None, cache_key=None,
+                 keyframe_options=None, camera_movement_per_frame=None):
+        self.tracker = tracker
+        # with keyframe_options the detector only runs on keyframes (see Tracker.frame_tracker), the camera movement
+        # is the list of a CameraMovementStage added before this stage, or the loaded camera movement
+        self.frame_tracker = tracker.frame_tracker(keyframe_options, camera_movement_per_frame)
+        self.stub_path = stub_path
+        self.cache = cache
+        self.cache_key = cache_key
+        self.tracks = load_cached(cache, cache_key, decode_tracks)
+        self.from_cache = self.tracks is not None
+        if self.tracks is None:
+            self.tracks = load_stub(read_from_stub, stub_path)
+        # when the tracks come from the cache or the stub the detector is not run at all
+        self.from_stub = self.tracks is not None and not self.from_cache
+        self.needs_frames = self.tracks is None
+        if self.tracks is None:
+            self.tracks = {
+                "players": [],
+                "referees": [],
+                "ball": []
+            }
+
+    def process_window(self, start_frame_num, frames):
+        if self.needs_frames:
+            self.frame_tracker.add_frames_to_tracks(frames, self.tracks)
+        return frames
+
+    def close(self):
+        if self.cache is not None and self.cache_key is not None:
+            # tracks read from the stub are not cached, they might not be the ones of this video
+            if not self.from_cache and not self.from_stub:
+                self.cache.save(self.cache_key, encode_tracks(self.tracks))
+        elif self.needs_frames:
+            save_stub(self.tracks, self.stub_path)
+
+
+class CameraMovementStage:
+    def __init__(self, camera_movement_estimator, read_from_stub=False, stub_path=None, cache=None, cache_key=None):
+        self.camera_movement_estimator = camera_movement_estimator
+        self.stub_path = stub_path
+        self.cache = cache
+        self.cache_key = cache_key
+        self.camera_movement = load_cached(
+            cache, cache_key, decode_camera_movement)
+        self.from_cache = self.camera_movement is not None
+        if self.camera_movement is None:
+            self.camera_movement = load_stub(read_from_stub, stub_path)
+        self.from_stub = self.camera_movement is not None and not self.from_cache
+        self.needs_frames = self.camera_movement is None
+        if self.camera_movement is None:
+            self.camera_movement = []
+            self.camera_movement_estimator.reset_camera_movement()
+
+    def process_window(self, start_frame_num, frames):
+        if self.needs_frames:
+            self.camera_movement_estimator.add_frames_to_camera_movement(
+                frames, self.camera_movement)
+        return frames
+
+    def close(self):
+        if self.cache is not None and self.cache_key is not None:
+            if not self.from_cache and not self.from_stub:
+                self.cache.save(self.cache_key, encode_camera_movement(
+                    self.camera_movement))
+        elif self.needs_frames:
+            save_stub(self.camera_movement, self.stub_path)
+
+
+class TeamAssignmentStage:
+    # tracks must already contain the players of the window, so this stage goes after the TrackingStage
+    def __init__(self, team_assigner, tracks, cache=None, cache_key=None):
+        self.team_assigner = team_assigner
+        self.tracks = tracks
+        self.cache = cache
+        self.cache_key = cache_key
+        # the cached teams are written into the tracks on close, once the tracks are complete
+        self.cached_teams = load_cached(cache, cache_key, lambda arrays: arrays)
+        self.needs_frames = self.cached_teams is None
+
+    def process_window(self, start_frame_num, frames):
+        if not self.needs_frames:
+            return frames
+        for i, frame in enumerate(frames):
+            self.team_assigner.assign_frame_teams(
+                frame, self.tracks['players'][start_frame_num + i])
+        return frames
+
+    def close(self):
+        if not self.needs_frames:
+            self.team_assigner.team_colors = apply_teams(
+                self.tracks, self.cached_teams)
+        elif self.cache is not None and self.cache_key is not None:
+            self.cache.save(self.cache_key, encode_teams(
+                self.tracks, self.team_assigner.team_colors))
+
@@ -1,5 +1,7 @@
 import sys
+import numpy as np
 from utils import get_center_of_bbox, measure_distance
+from track_table import TrackTable
 sys.path.append('../')
 
 
@@ -34,3 +36,101 @@ class PlayerBallAssigner():
                     assigned_player = player_id
 
         return assigned_player
+
+    def assign_ball_to_player_rows(self, ball_bboxes, player_frames, player_bboxes):
+        """
+        Vectorized assign_ball_to_player for a whole match.
+
+        ball_bboxes: (F, 4) array with the ball bbox of every frame, NaN when there is no ball.
+        player_frames: (N,) frame of every player row, player_bboxes: (N, 4) bbox of every player row.
+        Returns an (F,) array with the row of the player assigned to the ball in every frame, -1 when no player is
+        closer than max_player_ball_distance. Like the loop, ties go to the first row of the frame.
+        """
+        ball_bboxes = np.asarray(ball_bboxes, dtype=np.float64).reshape(-1, 4)
+        player_frames = np.asarray(player_frames, dtype=np.int64)
+        player_bboxes = np.asarray(
+            player_bboxes, dtype=np.float64).reshape(-1, 4)
+        assigned_rows = np.full(len(ball_bboxes), -1, dtype=np.int64)
+        if len(player_frames) == 0:
+            return assigned_rows
+
+        # getting center of the ball box as ball position, truncated like get_center_of_bbox
+        ball_positions = np.trunc(np.stack([(ball_bboxes[:, 0] + ball_bboxes[:, 2]) / 2,
+                                            (ball_bboxes[:, 1] + ball_bboxes[:, 3]) / 2], axis=1))
+        ball_of_player = ball_positions[player_frames]
+
+        # distance of the ball to the left (x1, y2) and right (x2, y2) corners of the feet, the real distance is the minimum
+        dy = player_bboxes[:, 3] - ball_of_player[:, 1]
+        distance_left = np.hypot(player_bboxes[:, 0] - ball_of_player[:, 0], dy)
+        distance_right = np.hypot(player_bboxes[:, 2] - ball_of_player[:, 0], dy)
+        distance = np.minimum(distance_left, distance_right)
+
+        # closest player of each frame: rows sorted by frame then distance (lexsort is stable so ties keep the row order)
+        close_rows = np.flatnonzero(distance < self.max_player_ball_distance)
+        order = close_rows[np.lexsort(
+            (distance[close_rows], player_frames[close_rows]))]
+        first_of_frame = np.ones(len(order), dtype=bool)
+        first_of_frame[1:] = player_frames[order][1:] != player_frames[order][:-1]
+        closest_rows = order[first_of_frame]
+        assigned_rows[player_frames[closest_rows]] = closest_rows
+        return assigned_rows
+
+    def assign_ball_to_players(self, ball_bboxes, player_frames, player_bboxes, player_ids):
+        # Same as assign_ball_to_player_rows but returns the track id of the assigned player, -1 for no player
+        assigned_rows = self.assign_ball_to_player_rows(
+            ball_bboxes, player_frames, player_bboxes)
+        assigned_ids = np.full(len(assigned_rows), -1, dtype=np.int64)
+        assigned = assigned_rows >= 0
+        assigned_ids[assigned] = np.asarray(
+            player_ids, dtype=np.int64)[assigned_rows[assigned]]
+        return assigned_ids
+
+    def get_team_ball_control(self, assigned_teams):
+        """
+        Carries the team of the last player who had the ball forward over the frames where no player has it.
+        assigned_teams: (F,) team of the assigned player, 0 when no player is assigned.
+        Frames before the first possession stay 0.
+        """
+        assigned_teams = np.asarray(assigned_teams)
+        frames = np.arange(len(assigned_teams))
+        last_possession = np.maximum.accumulate(
+            np.where(assigned_teams > 0, frames, -1)) if len(assigned_teams) else frames
+        return np.where(last_possession >= 0, assigned_teams[np.maximum(last_possession, 0)], 0)
+
+    def add_ball_possession_to_tracks(self, tracks):
+        """
+        Assigns the ball of every frame in one call, sets 'has_ball' on the assigned players and returns the
+        team_ball_control array. tracks can be the nested tracks dictionary or a TrackTable.
+        """
+        if isinstance(tracks, TrackTable):
+            player_rows = np.flatnonzero(tracks.object_mask('players'))
+            ball_bboxes = np.full((tracks.number_of_frames, 4), np.nan)
+            ball_rows = np.flatnonzero(tracks.object_mask('ball'))
+            ball_bboxes[tracks.frame[ball_rows]] = tracks.bbox[ball_rows]
+
+            assigned_rows = self.assign_ball_to_player_rows(
+                ball_bboxes, tracks.frame[player_rows], tracks.bbox[player_rows])
+            assigned = assigned_rows >= 0
+            tracks.has_ball[player_rows[assigned_rows[assigned]]] = True
+            assigned_teams = np.zeros(tracks.number_of_frames, dtype=np.int64)
+            assigned_teams[assigned] = tracks.team[player_rows[assigned_rows[assigned]]]
+            return self.get_team_ball_control(assigned_teams)
+
+        # Flattening the player dictionaries of every frame into rows
+        player_infos, player_frames, player_bboxes = [], [], []
+        for frame_num, player_track in enumerate(tracks['players']):
+            for player in player_track.values():
+                player_infos.append(player)
+                player_frames.append(frame_num)
+                player_bboxes.append(player['bbox'])
+        ball_bboxes = [ball_track.get(1, {}).get('bbox', [np.nan] * 4)
+                       for ball_track in tracks['ball']]
+
+        assigned_rows = self.assign_ball_to_player_rows(
+            ball_bboxes, player_frames, player_bboxes)
+        assigned_teams = np.zeros(len(assigned_rows), dtype=np.int64)
+        for frame_num, row in enumerate(assigned_rows.tolist()):
+            if row >= 0:
+                player_infos[row]['has_ball'] = True
+                assigned_teams[frame_num] = player_infos[row].get('team', 0)
+        return self.get_team_ball_control(assigned_teams)
@@ -0,0 +1 @@
+from .possession_statistics import PossessionStatistics
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class PossessionStatistics:
+    """
+    Ball possession of each team for every frame, computed once for the whole match.
+
+    team_ball_control is the team that had the ball in every frame (0 before the first possession), like the array
+    returned by PlayerBallAssigner.add_ball_possession_to_tracks.
+    The cumulative counts of each team are one cumsum, so the share of possession up to any frame, and over the
+    last rolling_window_seconds (5 minutes by default) as a difference of two cumulative counts, is a lookup.
+    Frames without a team don't count, a share is 0 until a team had the ball.
+    """
+
+    def __init__(self, team_ball_control, frame_rate=24, rolling_window_seconds=300, teams=(1, 2)):
+        team_ball_control = np.asarray(team_ball_control).reshape(-1)
+        self.teams = tuple(teams)
+        self.frame_rate = frame_rate
+        self.rolling_window = max(int(round(rolling_window_seconds * frame_rate)), 1)
+
+        # (F, number of teams) number of frames each team had the ball up to and including every frame
+        has_ball = team_ball_control[:, None] == np.array(self.teams)[None, :]
+        self.cumulative_counts = np.cumsum(has_ball, axis=0)
+
+        # the same over the last rolling_window frames: the cumulative count minus the one rolling_window frames earlier
+        earlier_counts = np.zeros_like(self.cumulative_counts)
+        earlier_counts[self.rolling_window:] = self.cumulative_counts[:-self.rolling_window]
+        self.rolling_counts = self.cumulative_counts - earlier_counts
+
+        self.cumulative_shares = self.to_shares(self.cumulative_counts)
+        self.rolling_shares = self.to_shares(self.rolling_counts)
+
+    @staticmethod
+    def to_shares(counts):
+        # share of each team among the frames where a team had the ball
+        total = np.maximum(counts.sum(axis=1, keepdims=True), 1)
+        return counts / total
+
+    def __len__(self):
+        return len(self.cumulative_counts)
+
+    def frame_possession(self, frame_num):
+        # {team: share of possession from the first frame to frame_num}
+        return dict(zip(self.teams, self.cumulative_shares[frame_num].tolist()))
+
+    def frame_rolling_possession(self, frame_num):
+        # {team: share of possession over the rolling window ending at frame_num}
+        return dict(zip(self.teams, self.rolling_shares[frame_num].tolist()))
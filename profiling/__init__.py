@@ -0,0 +1 @@
+from .stage_profiler import StageProfiler, StageTimer, stage_timer, current_rss
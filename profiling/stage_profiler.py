@@ -0,0 +1,264 @@
+import cProfile
+import csv
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import numpy as np
+
+# Upper bounds in milliseconds of the buckets of the per-frame latency histograms, the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000)
+
+
+def current_rss():
+    # Resident set size of the process in bytes, from /proc on Linux and the peak from getrusage elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+class StageTimer:
+    """
+    Context manager timing one call of a stage on frames frames and recording it in profiler.
+    With profiler = None it does nothing, so the components can be timed whether or not a profiler is given.
+    frames can be set inside the block when the number of frames is only known at the end (e.g. a detection batch),
+    a call on 0 frames (e.g. the end of the video) is not recorded.
+    """
+
+    def __init__(self, profiler, name, frames=1):
+        self.profiler = profiler
+        self.name = name
+        self.frames = frames
+        self.profile = None
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.profile = self.profiler.start_profile(self.name)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler is not None:
+            elapsed = time.perf_counter() - self.start
+            if self.profile is not None:
+                self.profiler.stop_profile(self.profile)
+            if self.frames > 0:
+                self.profiler.record(self.name, elapsed, self.frames)
+        return False
+
+
+def stage_timer(profiler, name, frames=1):
+    # StageTimer of profiler, which can be None
+    return StageTimer(profiler, name, frames)
+
+
+class StageProfiler:
+    """
+    Collects the time spent in each stage of the pipeline (decode, detect, bytetrack, camera_movement, team, draw,
+    encode...) to find what limits the throughput.
+
+    Every call of a stage is recorded with its duration and number of frames: the summary of a stage has its total
+    time, its throughput and the percentiles and histogram of its latency per frame (duration of the call divided by
+    its frames). Stages can be nested (e.g. detect inside TrackingStage), so the totals don't add up to the wall time.
+    Stages running on several threads at once are recorded safely.
+
+    A background thread samples the RSS of the process every rss_interval seconds (None doesn't sample), the peak RSS
+    is also measured at the end of every call of a stage.
+
+    profile_stage names one stage run under cProfile, profile_path is where its pstats are written by stop()
+    (e.g. 'profile.prof' for snakeviz). cProfile profiles one thread at a time, so when the stage runs on several
+    threads at once only one of its calls is profiled at a time.
+
+    The results are exported with save(path) as JSON (everything) or CSV (one line per stage).
+    """
+
+    def __init__(self, rss_interval=0.5, profile_stage=None, profile_path=None):
+        self.rss_interval = rss_interval
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.frames = {}
+        self.rss_samples = []
+        self.peak_rss = 0
+        self.wall_time = 0.0
+        self.start_time = None
+        self.sampler = None
+        self.stop_sampling = threading.Event()
+        self.profile = cProfile.Profile() if profile_stage is not None else None
+        self.profile_lock = threading.Lock()
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.sample_rss()
+        if self.rss_interval is not None:
+            self.stop_sampling.clear()
+            self.sampler = threading.Thread(target=self._sample_rss_loop, name='rss-sampler', daemon=True)
+            self.sampler.start()
+        return self
+
+    def stop(self):
+        if self.sampler is not None:
+            self.stop_sampling.set()
+            self.sampler.join()
+            self.sampler = None
+        self.sample_rss()
+        if self.start_time is not None:
+            self.wall_time = time.perf_counter() - self.start_time
+        if self.profile is not None and self.profile_path is not None:
+            self.profile.dump_stats(self.profile_path)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def stage(self, name, frames=1):
+        # Context manager timing one call of the stage name on frames frames
+        return StageTimer(self, name, frames)
+
+    def timed(self, name):
+        # Decorator timing every call of a function as the stage name, on one frame per call
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds, frames=1):
+        rss = current_rss()
+        with self.lock:
+            self.durations.setdefault(name, []).append(seconds)
+            self.frames.setdefault(name, []).append(frames)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def sample_rss(self):
+        rss = current_rss()
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+        with self.lock:
+            self.rss_samples.append((elapsed, rss))
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def _sample_rss_loop(self):
+        while not self.stop_sampling.wait(self.rss_interval):
+            self.sample_rss()
+
+    # cProfile hook of profile_stage
+
+    def start_profile(self, name):
+        # Returns the enabled profile when the call has to be profiled, None otherwise
+        if name != self.profile_stage or not self.profile_lock.acquire(blocking=False):
+            return None
+        try:
+            self.profile.enable()
+        except ValueError:
+            # another profiler is already active in this thread
+            self.profile_lock.release()
+            return None
+        return self.profile
+
+    def stop_profile(self, profile):
+        profile.disable()
+        self.profile_lock.release()
+
+    def profile_report(self, limit=20, sort='cumulative'):
+        # The limit functions of the profiled stage with the most time, as printed by pstats
+        if self.profile is None:
+            return ""
+        output = io.StringIO()
+        try:
+            pstats.Stats(self.profile, stream=output).sort_stats(sort).print_stats(limit)
+        except TypeError:
+            # the stage was never called
+            return ""
+        return output.getvalue()
+
+    # Results
+
+    def summary(self):
+        # Dictionary of the stats of every stage, in the order the stages were first recorded
+        with self.lock:
+            recorded = [(name, np.asarray(self.durations[name]), np.asarray(self.frames[name]))
+                        for name in self.durations]
+        summary = {}
+        for name, durations, frames in recorded:
+            total_time = float(durations.sum())
+            total_frames = int(frames.sum())
+            # latency of each frame of a call, every call weighted by its number of frames
+            latencies = np.repeat(durations / np.maximum(frames, 1), np.maximum(frames, 1)) * 1000
+            percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else np.zeros(3)
+            summary[name] = {
+                'calls': len(durations),
+                'frames': total_frames,
+                'total_time': total_time,
+                'fps': total_frames / total_time if total_time > 0 else 0.0,
+                'mean_ms': float(latencies.mean()) if len(latencies) else 0.0,
+                'p50_ms': float(percentiles[0]),
+                'p95_ms': float(percentiles[1]),
+                'p99_ms': float(percentiles[2]),
+                'max_ms': float(latencies.max()) if len(latencies) else 0.0,
+                'histogram': self.histogram(latencies),
+            }
+        return summary
+
+    @staticmethod
+    def histogram(latencies_ms):
+        # Number of frames in each bucket of HISTOGRAM_BOUNDS_MS, keyed by the upper bound of the bucket
+        counts = np.bincount(np.searchsorted(HISTOGRAM_BOUNDS_MS, latencies_ms),
+                             minlength=len(HISTOGRAM_BOUNDS_MS) + 1)
+        labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+        return dict(zip(labels, counts.tolist()))
+
+    def to_dict(self):
+        with self.lock:
+            rss_samples = list(self.rss_samples)
+        return {
+            'wall_time': self.wall_time,
+            'peak_rss_mb': self.peak_rss / 2**20,
+            'stages': self.summary(),
+            'rss_samples': [{'time': elapsed, 'rss_mb': rss / 2**20} for elapsed, rss in rss_samples],
+        }
+
+    def save(self, path):
+        # Writes the results to path, as CSV when it ends with .csv and as JSON otherwise
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith('.csv'):
+            columns = ['calls', 'frames', 'total_time', 'fps', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage'] + columns)
+                for name, stats in self.summary().items():
+                    writer.writerow([name] + [stats[column] for column in columns])
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2)
+
+    def report(self):
+        # Table of the stages, one line per stage, like StagedExecutor.report
+        lines = [f"{'stage':<24}{'calls':>8}{'frames':>8}{'total s':>9}{'fps':>12}{'p50 ms':>9}{'p95 ms':>9}"
+                 f"{'max ms':>9}"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<24}{stats['calls']:>8}{stats['frames']:>8}{stats['total_time']:>9.2f}"
+                         f"{stats['fps']:>12.1f}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['max_ms']:>9.2f}")
+        lines.append(f"wall time: {self.wall_time:.2f} s, peak RSS: {self.peak_rss / 2**20:.0f} MB")
+        return "\n".join(lines)
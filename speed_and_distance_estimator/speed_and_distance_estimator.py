@@ -1,80 +1,197 @@
-from utils import measure_distance, get_foot_position
+from utils import get_foot_position
+from track_table import TrackTable, OBJECT_CLASSES
+import itertools
 import cv2
+import numpy as np
 import sys
 sys.path.append('../')
 
 
 class SpeedAndDistance_Estimator():
-    def __init__(self):
-        # Calculating speed of user every 5 frame
-        self.frame_window = 5
-        self.frame_rate = 24  # frame rate 24 frame per second
+    """
+    Speed (km/h) and covered distance (m) of the players, computed on the position time series of all the
+    tracks at once.
+
+    frame_window: the speed of a frame is the distance from the position of the same track frame_window frames
+    earlier (or the earliest one within that window, or the next ones for the first frames of a track), divided by
+    the time between the two frames.
+    frame_rate: frames per second of the video.
+    smoothing_window: the positions are first smoothed by a centred median over this many frames of the same track,
+    so that a one or two frame jump of the court position (a jittery bbox or homography) doesn't show up as a speed
+    spike. 1 disables the smoothing.
+    The distance is the cumulative length of the smoothed path of the track.
+    Frames where position_transformed is None (outside of the court) get no speed and don't add to the distance.
+    """
+
+    def __init__(self, frame_window=5, frame_rate=24, smoothing_window=5):
+        if frame_window < 1:
+            raise ValueError("frame_window must be at least 1")
+        if smoothing_window < 1 or smoothing_window % 2 == 0:
+            raise ValueError("smoothing_window must be a positive odd number")
+        # number of frames the speed is measured over
+        self.frame_window = frame_window
+        self.frame_rate = frame_rate  # frame rate 24 frame per second by default
+        self.smoothing_window = smoothing_window
+
+    def smooth_positions(self, track_keys, positions):
+        """
+        Centred median of the positions of each track over smoothing_window frames.
+        track_keys is track index * stride + frame for rows sorted by track and frame, positions the (N, 2) array.
+        Returns the smoothed positions and whether each row is kept: a row with fewer positions than half of the
+        window around it (an isolated detection, e.g. at the edge of the court) has no reliable median and is dropped.
+        """
+        half_window = self.smoothing_window // 2
+        if half_window == 0 or len(positions) == 0:
+            return positions, np.ones(len(positions), dtype=bool)
+        # positions of the window around every row, +inf where there is none so that they are sorted last
+        neighbours = np.empty((self.smoothing_window, len(positions), 2))
+        count = np.zeros(len(positions), dtype=np.int64)
+        present = ~np.isnan(positions[:, 0])
+        rows = np.arange(len(positions))
+        for i, offset in enumerate(range(-half_window, half_window + 1)):
+            neighbour = np.clip(rows + offset, 0, len(positions) - 1)
+            # the neighbour row has to exist, be of the same track and be within half_window frames
+            in_window = (neighbour == rows + offset) & present[neighbour] & (
+                np.abs(track_keys[neighbour] - track_keys) <= half_window)
+            neighbours[i] = np.where(in_window[:, None], positions[neighbour], np.inf)
+            count += in_window
+
+        # median of the positions that are there: the middle of the first count sorted values is taken.
+        # The window is short, an odd-even transposition sort of its rows with np.minimum and np.maximum is several
+        # times faster than np.sort along the first axis
+        for sort_round in range(self.smoothing_window):
+            for i in range(sort_round % 2, self.smoothing_window - 1, 2):
+                lower_values = np.minimum(neighbours[i], neighbours[i + 1])
+                np.maximum(neighbours[i], neighbours[i + 1], out=neighbours[i + 1])
+                neighbours[i] = lower_values
+        lower = np.take_along_axis(neighbours, ((count - 1) // 2)[None, :, None], axis=0)[0]
+        upper = np.take_along_axis(neighbours, (count // 2)[None, :, None], axis=0)[0]
+        return (lower + upper) / 2, count > half_window
+
+    def compute_speed_and_distance(self, track_index, frame, positions):
+        """
+        Speed (km/h) and cumulative distance (m) of every row.
+        The rows have to be sorted by track and frame, track_index is the track of each row (any integer),
+        positions the (N, 2) court positions with NaN where there is none.
+        Rows without a position, dropped by the smoothing or alone in their frame window get NaN speed.
+        """
+        track_index = np.asarray(track_index, dtype=np.int64)
+        frame = np.asarray(frame, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        speed = np.full(len(frame), np.nan)
+        distance = np.full(len(frame), np.nan)
+
+        valid = np.flatnonzero(~np.isnan(positions[:, 0]))
+        if len(valid) == 0:
+            return speed, distance
+        # one sorted key per row, tracks are far enough apart that a frame window never spans two of them
+        stride = int(frame.max()) + 2 * self.frame_window + self.smoothing_window + 1
+        track_keys = (track_index[valid] - track_index.min()) * stride + frame[valid]
+        positions, kept = self.smooth_positions(track_keys, positions[valid])
+        valid, track_keys, positions = valid[kept], track_keys[kept], positions[kept]
+        if len(valid) == 0:
+            return speed, distance
+        track_index, frame = track_index[valid], frame[valid]
+
+        # the row frame_window frames earlier (or the earliest row in that window), the later one for the first frames
+        rows = np.arange(len(frame))
+        earlier = np.searchsorted(track_keys, track_keys - self.frame_window, side='left')
+        later = np.searchsorted(track_keys, track_keys + self.frame_window, side='right') - 1
+        has_earlier = earlier < rows
+        start = np.where(has_earlier, earlier, rows)
+        end = np.where(has_earlier, rows, later)
+        time_elapsed = (frame[end] - frame[start]) / self.frame_rate
+        distance_covered = np.hypot(*(positions[end] - positions[start]).T)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            speed_meters_per_second = np.where(
+                time_elapsed > 0, distance_covered / time_elapsed, np.nan)
+        speed[valid] = speed_meters_per_second * 3.6
+
+        # cumulative length of the path, restarting at the first row of every track
+        steps = np.zeros(len(frame))
+        same_track = track_index[1:] == track_index[:-1]
+        steps[1:] = np.where(same_track, np.hypot(*np.diff(positions, axis=0).T), 0)
+        cumulative = np.cumsum(steps)
+        track_starts = np.flatnonzero(np.concatenate(([True], ~same_track)))
+        track_of_row = np.cumsum(np.concatenate(([True], ~same_track))) - 1
+        distance[valid] = cumulative - cumulative[track_starts][track_of_row]
+        return speed, distance
 
     def add_speed_and_distance_to_tracks(self, tracks):
-        total_distance = {}
-
-        for object, object_tracks in tracks.items():
+        """
+        Adds 'speed' and 'distance' to the players (not the ball nor the referees).
+        tracks can be the nested tracks dictionary or a TrackTable.
+        """
+        if isinstance(tracks, TrackTable):
+            rows = tracks.track_order[tracks.object_class[tracks.track_order]
+                                      == OBJECT_CLASSES.index('players')]
+            speed, distance = self.compute_speed_and_distance(
+                tracks.track_id[rows], tracks.frame[rows], tracks.position_transformed[rows])
+            tracks.speed[rows] = speed
+            tracks.distance[rows] = distance
+            tracks.computed_columns.update(('speed', 'distance'))
+            return
+
+        # Flattening the tracks into rows of (track, frame, position)
+        track_infos, track_index, frames = [], [], []
+        for object_number, object in enumerate(tracks):
             if object == "ball" or object == "referees":
                 continue
-            number_of_frames = len(object_tracks)
-            for frame_num in range(0, number_of_frames, self.frame_window):
-                last_frame = min(frame_num+self.frame_window,
-                                 number_of_frames-1)
-
-                # if the track is in first frame but not in last frame then we continue
-                for track_id, _ in object_tracks[frame_num].items():
-                    if track_id not in object_tracks[last_frame]:
-                        continue
-
-                    start_position = object_tracks[frame_num][track_id]['position_transformed']
-                    end_position = object_tracks[last_frame][track_id]['position_transformed']
-
-                    if start_position is None or end_position is None:
-                        continue
-
-                    distance_covered = measure_distance(
-                        start_position, end_position)
-                    time_elapsed = (last_frame-frame_num)/self.frame_rate
-                    speed_meteres_per_second = distance_covered/time_elapsed
-                    speed_km_per_hour = speed_meteres_per_second*3.6
-
-                    if object not in total_distance:
-                        total_distance[object] = {}
-
-                    if track_id not in total_distance[object]:
-                        total_distance[object][track_id] = 0
-
-                    total_distance[object][track_id] += distance_covered
-
-                    for frame_num_batch in range(frame_num, last_frame):
-                        if track_id not in tracks[object][frame_num_batch]:
-                            continue
-                        tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
-                        tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
+            for frame_num, track in enumerate(tracks[object]):
+                track_infos += track.values()
+                # the tracks of different objects can share ids, the object is put in the high bits
+                track_index += [object_number << 32 | track_id for track_id in track]
+                frames += [frame_num] * len(track)
+        if not track_infos:
+            return
+        # points outside of the court (None) all share one NaN position, the x and y are read in one flat pass
+        missing = (np.nan, np.nan)
+        positions = np.fromiter(itertools.chain.from_iterable(
+            missing if track_info.get('position_transformed') is None else track_info['position_transformed']
+            for track_info in track_infos), dtype=np.float64, count=2 * len(track_infos)).reshape(-1, 2)
+
+        # sorting the rows by track and frame
+        track_index = np.array(track_index, dtype=np.int64)
+        frames = np.array(frames, dtype=np.int64)
+        order = np.lexsort((frames, track_index))
+        speed, distance = np.empty(len(order)), np.empty(len(order))
+        speed[order], distance[order] = self.compute_speed_and_distance(
+            track_index[order], frames[order], positions[order])
+
+        for track_info, row_speed, row_distance in zip(track_infos, speed.tolist(), distance.tolist()):
+            if row_speed == row_speed:  # not NaN
+                track_info['speed'] = row_speed
+                track_info['distance'] = row_distance
 
     def draw_speed_and_distance(self, frames, tracks):
         output_frames = []
         for frame_num, frame in enumerate(frames):
-            for object, object_tracks in tracks.items():
-                if object == "ball" or object == "referees":
-                    continue
-                for _, track_info in object_tracks[frame_num].items():
-                    if "speed" in track_info:
-                        speed = track_info.get('speed', None)
-                        distance = track_info.get('distance', None)
-                        if speed is None or distance is None:
-                            continue
-
-                        bbox = track_info['bbox']
-                        position = get_foot_position(bbox)
-                        position = list(position)
-                        position[1] += 40  # buffer of 40 pixels
-
-                        position = tuple(map(int, position))
-                        cv2.putText(
-                            frame, f"{speed:.2f} km/h", position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-                        cv2.putText(frame, f"{distance:.2f} m", (
-                            position[0], position[1]+20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+            frame = self.draw_frame_speed_and_distance(frame, frame_num, tracks)
             output_frames.append(frame)
 
         return output_frames
+
+    # Drawing the speed and distance of a single frame in place
+    def draw_frame_speed_and_distance(self, frame, frame_num, tracks):
+        for object, object_tracks in tracks.items():
+            if object == "ball" or object == "referees":
+                continue
+            for _, track_info in object_tracks[frame_num].items():
+                if "speed" in track_info:
+                    speed = track_info.get('speed', None)
+                    distance = track_info.get('distance', None)
+                    if speed is None or distance is None:
+                        continue
+
+                    bbox = track_info['bbox']
+                    position = get_foot_position(bbox)
+                    position = list(position)
+                    position[1] += 40  # buffer of 40 pixels
+
+                    position = tuple(map(int, position))
+                    cv2.putText(
+                        frame, f"{speed:.2f} km/h", position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+                    cv2.putText(frame, f"{distance:.2f} m", (
+                        position[0], position[1]+20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+        return frame
@@ -0,0 +1 @@
+from .stage_cache import StageCache, encode_tracks, decode_tracks, encode_camera_movement, decode_camera_movement, encode_teams, apply_teams
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import numpy as np
+from track_table import TrackTable
+
+
+class StageCache:
+    """
+    Persistent cache of the results of the pipeline stages, stored as compressed NumPy .npz files.
+
+    Entries are content addressed: the key of a stage is a hash of the stage name, the content hash of the video,
+    the frame range, the hash of the model weights, the stage parameters and the keys of the stages it depends on.
+    So a result is never reused for another video, model or set of parameters, and changing one stage only
+    changes the keys of the stages that come after it.
+
+    The cache is limited to max_bytes on disk, the least recently used entries are evicted first.
+    Hits, misses, writes and evictions are counted in self.stats.
+    """
+
+    def __init__(self, cache_dir='cache', max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # file hashes are remembered by path, size and modification time so big videos are hashed only once
+        self.file_hash_index_path = os.path.join(
+            self.cache_dir, 'file_hashes.json')
+
+    def file_hash(self, path):
+        # sha256 of the content of a file, None if the file doesn't exist
+        if path is None or not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        index_key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        index = self._read_file_hash_index()
+        if index_key in index:
+            return index[index_key]
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        index[index_key] = sha256.hexdigest()
+        self._write_json(self.file_hash_index_path, index)
+        return index[index_key]
+
+    def key(self, stage, video_hash=None, frame_range=None, model_hash=None, params=None, upstream=()):
+        """
+        Returns the cache key of a stage.
+        frame_range is a (start, stop, stride) tuple or None for the whole video, params a JSON serializable
+        dictionary of the stage parameters and upstream the keys of the stages this stage depends on.
+        """
+        description = {
+            'stage': stage,
+            'video': video_hash,
+            'frame_range': list(frame_range) if frame_range is not None else None,
+            'model': model_hash,
+            'params': params or {},
+            'upstream': list(upstream),
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str)
+        return f"{stage}-{hashlib.sha256(encoded.encode()).hexdigest()[:32]}"
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        # Returns the dictionary of arrays saved under key, or None
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.stats['misses'] += 1
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        # updating the modification time marks the entry as recently used
+        os.utime(path)
+        self.stats['hits'] += 1
+        return arrays
+
+    def save(self, key, arrays):
+        # Writing to a temporary file first, so a crash never leaves a truncated entry behind
+        path = self.path(key)
+        temporary_path = f"{path}.tmp.npz"
+        np.savez_compressed(temporary_path, **arrays)
+        os.replace(temporary_path, path)
+        self.stats['writes'] += 1
+        self.evict()
+
+    def evict(self):
+        # Removing the least recently used entries until the cache fits in max_bytes
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz') and '.tmp.' not in name:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total_bytes -= size
+            self.stats['evictions'] += 1
+
+    def _read_file_hash_index(self):
+        if not os.path.exists(self.file_hash_index_path):
+            return {}
+        with open(self.file_hash_index_path) as f:
+            return json.load(f)
+
+    def _write_json(self, path, data):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temporary_path, path)
+
+
+# Encoders and decoders of the results of the stages
+
+def encode_tracks(tracks):
+    # only the tracked bboxes are the result of the tracking stage, the other attributes come from later stages
+    table = TrackTable.from_tracks(tracks)
+    table.computed_columns = set()
+    table.team_colors = {}
+    return table.to_arrays()
+
+
+def decode_tracks(arrays):
+    return TrackTable.from_arrays(arrays).to_tracks()
+
+
+def encode_teams(tracks, team_colors):
+    # team and confidence of every player row, with the team colours
+    frames, track_ids, teams, confidences = [], [], [], []
+    for frame_num, player_track in enumerate(tracks['players']):
+        for player_id, track in player_track.items():
+            if 'team' in track:
+                frames.append(frame_num)
+                track_ids.append(player_id)
+                teams.append(track['team'])
+                confidences.append(track.get('team_confidence', np.nan))
+    return {
+        'frame': np.array(frames, dtype=np.int64),
+        'track_id': np.array(track_ids, dtype=np.int64),
+        'team': np.array(teams, dtype=np.int64),
+        'team_confidence': np.array(confidences, dtype=np.float64),
+        'team_colors': np.array([[team, *color] for team, color in sorted(team_colors.items())],
+                                dtype=np.float64).reshape(-1, 4),
+    }
+
+
+def apply_teams(tracks, arrays):
+    # Writing cached teams back into the tracks dictionary, returns the team colours
+    team_colors = {int(row[0]): row[1:] for row in arrays['team_colors']}
+    for frame_num, player_id, team, confidence in zip(arrays['frame'].tolist(), arrays['track_id'].tolist(),
+                                                      arrays['team'].tolist(), arrays['team_confidence'].tolist()):
+        track = tracks['players'][frame_num][player_id]
+        track['team'] = team
+        track['team_color'] = team_colors[team]
+        if not np.isnan(confidence):
+            track['team_confidence'] = confidence
+    return team_colors
+
+
+def encode_camera_movement(camera_movement):
+    return {'camera_movement': np.asarray(camera_movement, dtype=np.float64).reshape(-1, 2)}
+
+
+def decode_camera_movement(arrays):
+    return arrays['camera_movement'].tolist()
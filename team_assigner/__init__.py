@@ -1 +1,2 @@
 from .team_assigner import TeamAssigner
+from .online_team_assigner import OnlineTeamAssigner
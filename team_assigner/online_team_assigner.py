@@ -0,0 +1,155 @@
+from collections import deque
+import numpy as np
+from .team_assigner import TeamAssigner
+
+
+class OnlineTeamAssigner(TeamAssigner):
+    """
+    Team assignment that keeps learning during the match instead of fixing everything on the first frame.
+
+    - every track keeps its last `window_size` colour samples;
+    - at most `max_samples_per_frame` crops are sampled per frame (new tracks first, then the tracks with the
+      oldest sample), so the per frame cost is bounded whatever the number of tracks;
+    - the two team colours are refined with mini-batch KMeans updates from every batch of samples;
+    - every `revote_every` frames the team of every active track is re-voted from its window of samples;
+    - each assignment comes with a confidence: the fraction of the track's samples that vote for its team.
+
+    team_overrides maps track ids to a fixed team (e.g. a goalkeeper whose kit matches neither team).
+    It has the same assign_frame_teams(frame, player_track) method as TeamAssigner, so it can be used in a TeamAssignmentStage.
+    """
+
+    def __init__(self, color_mode='fast', window_size=30, max_samples_per_frame=8, revote_every=24,
+                 max_center_count=500, forget_after=240, team_overrides=None, sample_size=16, frame_scale=1.0):
+        super().__init__(color_mode=color_mode, sample_size=sample_size, frame_scale=frame_scale)
+        self.window_size = window_size
+        self.max_samples_per_frame = max_samples_per_frame
+        self.revote_every = revote_every
+        # the weight of the current centres is capped so that they keep following the kits (e.g. in shade or sun)
+        self.max_center_count = max_center_count
+        # tracks not seen for this many frames are forgotten
+        self.forget_after = forget_after
+        self.team_overrides = dict(team_overrides or {})
+
+        self.centers = None
+        self.center_counts = np.zeros(2)
+        self.player_samples = {}
+        self.player_last_sample = {}
+        self.player_last_seen = {}
+        self.player_confidence = {}
+        self.frame_num = 0
+
+    def initialize_centers(self, player_colors):
+        # Starting from a full KMeans on the first batch of colours, like assign_team_color
+        self.fit_team_colors(player_colors)
+        self.centers = self.kmeans.cluster_centers_.astype(np.float64).copy()
+        self.center_counts = np.bincount(
+            self.kmeans.labels_, minlength=2).astype(np.float64)
+
+    def nearest_team(self, player_colors):
+        # Returns the team index (0 or 1) of each colour and the distances to the two centres
+        distances = np.linalg.norm(
+            player_colors[:, None, :] - self.centers[None, :, :], axis=-1)
+        return distances.argmin(axis=1), distances
+
+    def update_centers(self, player_colors):
+        # One mini-batch KMeans step: each centre moves towards the mean of its new samples
+        labels, _ = self.nearest_team(player_colors)
+        for team_index in (0, 1):
+            in_team = player_colors[labels == team_index]
+            if len(in_team) == 0:
+                continue
+            count = self.center_counts[team_index] + len(in_team)
+            learning_rate = len(in_team) / count
+            self.centers[team_index] += learning_rate * \
+                (in_team.mean(axis=0) - self.centers[team_index])
+            self.center_counts[team_index] = min(count, self.max_center_count)
+        self.team_colors[1] = self.centers[0].copy()
+        self.team_colors[2] = self.centers[1].copy()
+
+    def select_players_to_sample(self, player_ids):
+        # New tracks are always sampled so they get a team, the others by the age of their last sample
+        new_player_ids = [
+            player_id for player_id in player_ids if player_id not in self.player_samples]
+        known_player_ids = sorted((player_id for player_id in player_ids if player_id in self.player_samples),
+                                  key=lambda player_id: self.player_last_sample[player_id])
+        budget = max(self.max_samples_per_frame - len(new_player_ids), 0)
+        return new_player_ids + known_player_ids[:budget]
+
+    def vote(self, player_id):
+        # Majority vote of the samples of one track, returns the team (1 or 2) and the confidence
+        samples = np.array(self.player_samples[player_id])
+        labels, _ = self.nearest_team(samples)
+        votes = np.bincount(labels, minlength=2)
+        team_index = int(votes.argmax())
+        return team_index + 1, votes[team_index] / len(labels)
+
+    def revote(self):
+        for player_id in self.player_samples:
+            self.set_team(player_id, *self.vote(player_id))
+
+    def set_team(self, player_id, team, confidence):
+        if player_id in self.team_overrides:
+            team, confidence = self.team_overrides[player_id], 1.0
+        self.player_team_dict[player_id] = team
+        self.player_confidence[player_id] = confidence
+
+    def forget_old_players(self):
+        for player_id, last_seen in list(self.player_last_seen.items()):
+            if self.frame_num - last_seen > self.forget_after:
+                for player_dict in (self.player_samples, self.player_last_sample, self.player_last_seen,
+                                    self.player_team_dict, self.player_confidence):
+                    player_dict.pop(player_id, None)
+
+    def assign_frame_teams(self, frame, player_track):
+        player_ids = list(player_track)
+        for player_id in player_ids:
+            self.player_last_seen[player_id] = self.frame_num
+
+        sampled_ids = self.select_players_to_sample(player_ids)
+        if sampled_ids:
+            player_colors = self.get_player_colors(
+                frame, [player_track[player_id]['bbox'] for player_id in sampled_ids])
+
+            if self.centers is None:
+                if len(sampled_ids) < 2:
+                    # not enough players yet to find two teams
+                    self.frame_num += 1
+                    return
+                self.initialize_centers(player_colors)
+            else:
+                self.update_centers(player_colors)
+
+            for player_id, player_color in zip(sampled_ids, player_colors):
+                is_new = player_id not in self.player_samples
+                if is_new:
+                    self.player_samples[player_id] = deque(
+                        maxlen=self.window_size)
+                self.player_samples[player_id].append(player_color)
+                self.player_last_sample[player_id] = self.frame_num
+                if is_new:
+                    self.set_team(player_id, *self.vote(player_id))
+
+        if self.revote_every and self.frame_num % self.revote_every == 0:
+            self.forget_old_players()
+            self.revote()
+
+        for player_id, track in player_track.items():
+            if player_id not in self.player_team_dict:
+                continue
+            team = self.player_team_dict[player_id]
+            track['team'] = team
+            track['team_color'] = self.team_colors[team]
+            track['team_confidence'] = self.player_confidence[player_id]
+
+        self.frame_num += 1
+
+    def get_player_team(self, frame, player_bbox, player_id):
+        # Team of one player, a new player is sampled once and gets the team of the nearest current team colour
+        if player_id not in self.player_team_dict:
+            player_color = self.get_player_colors(frame, [player_bbox])[0]
+            self.player_samples[player_id] = deque(
+                [player_color], maxlen=self.window_size)
+            self.player_last_sample[player_id] = self.frame_num
+            self.player_last_seen[player_id] = self.frame_num
+            self.set_team(player_id, *self.vote(player_id))
+        return self.player_team_dict[player_id]
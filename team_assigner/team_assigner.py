@@ -1,8 +1,26 @@
-from sklearn.cluster import KMeans
+import numpy as np
+import cv2
 
 
 class TeamAssigner:
-    def __init__(self):
+    # Ways of getting the kit colour of the player crops
+    COLOR_MODES = ('exact', 'fast', 'histogram')
+
+    def __init__(self, color_mode='exact', sample_size=16, frame_scale=1.0):
+        """
+        color_mode chooses how the kit colour of each player is extracted:
+        'exact': a KMeans with 2 clusters fitted on every crop, like before
+        'fast': the same two cluster split done for all the crops of a frame at once with NumPy, on crops resized to sample_size x sample_size
+        'histogram': the most common colour bin of the resized crop that is not a background (corner) colour
+        frame_scale: the frames given were resized by this factor (e.g. a downscaled FrameCache), the bboxes of the
+        tracks are in full resolution and are scaled the same way before cropping
+        """
+        if color_mode not in self.COLOR_MODES:
+            raise ValueError(
+                f"color_mode must be one of {self.COLOR_MODES}, got {color_mode!r}")
+        self.color_mode = color_mode
+        self.sample_size = sample_size
+        self.frame_scale = frame_scale
         self.team_colors = {}
         self.player_team_dict = {}
 
@@ -11,6 +29,8 @@ class TeamAssigner:
         image_2d = image.reshape(-1, 3)
 
         # Preform K-means with 2 clusters
+        # scikit-learn is only imported when a KMeans is fitted, the 'fast' and 'histogram' modes don't need it
+        from sklearn.cluster import KMeans
         kmeans = KMeans(n_clusters=2, init="k-means++", n_init=1)
         kmeans.fit(image_2d)
 
@@ -45,15 +65,118 @@ class TeamAssigner:
 
         return player_color
 
+    def get_player_colors(self, frame, bboxes):
+        """
+        Returns the kit colours of all the bboxes of one frame as an (N, 3) array, using self.color_mode.
+        """
+        if len(bboxes) == 0:
+            return np.empty((0, 3))
+        if self.frame_scale != 1:
+            bboxes = np.asarray(bboxes, dtype=np.float64) * self.frame_scale
+        if self.color_mode == 'exact':
+            return np.array([self.get_player_color(frame, bbox) for bbox in bboxes])
+
+        pixels = self.get_torso_samples(frame, bboxes)
+        if self.color_mode == 'fast':
+            return self.split_two_colors(pixels)
+        return self.most_common_colors(pixels)
+
+    def get_torso_samples(self, frame, bboxes):
+        """
+        Crops the top half of every bbox (like get_player_color) and resizes it to sample_size x sample_size,
+        so all the crops can be stacked in one (N, sample_size*sample_size, 3) float32 array.
+        Crops that are empty (bbox outside of the frame) are left black.
+        """
+        size = self.sample_size
+        samples = np.zeros((len(bboxes), size, size, 3), dtype=np.float32)
+        for i, bbox in enumerate(bboxes):
+            x1, y1 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+            x2, y2 = int(bbox[2]), int(bbox[3])
+            top_half_image = frame[y1:y1 + int((y2 - y1)/2), x1:x2]
+            if top_half_image.size == 0:
+                continue
+            samples[i] = cv2.resize(top_half_image, (size, size),
+                                    interpolation=cv2.INTER_AREA)
+        return samples.reshape(len(bboxes), size * size, 3)
+
+    def corner_indices(self):
+        # indices of the four corner pixels in a flattened sample_size x sample_size crop
+        size = self.sample_size
+        return np.array([0, size - 1, size * (size - 1), size * size - 1])
+
+    def split_two_colors(self, pixels, iterations=5):
+        """
+        Two cluster split of every crop at once (a few Lloyd iterations of KMeans with k=2, vectorized over the crops).
+        pixels is the (N, P, 3) array of get_torso_samples.
+        The clusters start from the mean corner colour (background) and the centre pixel (player), and like in
+        get_player_color the cluster of most of the corners is the background.
+        """
+        size = self.sample_size
+        corners = self.corner_indices()
+        centers = np.stack([pixels[:, corners].mean(axis=1),
+                            pixels[:, (size // 2) * size + size // 2]], axis=1)
+
+        total = pixels.sum(axis=1)
+        number_of_pixels = pixels.shape[1]
+        for _ in range(iterations):
+            """
+            With two clusters a pixel x is closer to centre 1 than to centre 0 when
+            2 x.(c1 - c0) > |c1|^2 - |c0|^2, so the labels of all the pixels are one matrix product.
+            """
+            direction = centers[:, 1] - centers[:, 0]
+            threshold = ((centers[:, 1] ** 2).sum(axis=1) -
+                         (centers[:, 0] ** 2).sum(axis=1)) / 2
+            labels = (np.einsum('npc,nc->np', pixels, direction)
+                      > threshold[:, None]).astype(np.float32)
+
+            count_1 = labels.sum(axis=1)[:, None]
+            sum_1 = np.einsum('np,npc->nc', labels, pixels)
+            # a cluster without pixels keeps its centre
+            centers[:, 1] = np.where(
+                count_1 > 0, sum_1 / np.maximum(count_1, 1), centers[:, 1])
+            centers[:, 0] = np.where(count_1 < number_of_pixels, (total - sum_1) /
+                                     np.maximum(number_of_pixels - count_1, 1), centers[:, 0])
+
+        # a tie between the corners gives cluster 0 like max(set(...)) does
+        non_player_cluster = (labels[:, corners].sum(axis=1) > 2).astype(int)
+        player_cluster = 1 - non_player_cluster
+        return centers[np.arange(len(pixels)), player_cluster].astype(np.float64)
+
+    def most_common_colors(self, pixels, bins_per_channel=8):
+        """
+        Colour histogram of every crop at once: the pixels are quantized in bins_per_channel**3 bins and the player
+        colour is the mean colour of the most common bin that none of the corner pixels (background) falls in.
+        """
+        number_of_crops, number_of_pixels, _ = pixels.shape
+        number_of_bins = bins_per_channel ** 3
+        quantized = np.minimum((pixels * bins_per_channel / 256).astype(np.int64), bins_per_channel - 1)
+        bin_index = (quantized[:, :, 0] * bins_per_channel + quantized[:, :, 1]) * \
+            bins_per_channel + quantized[:, :, 2]
+
+        # one histogram per crop with a single bincount by offsetting the bins of each crop
+        offsets = np.arange(number_of_crops)[:, None] * number_of_bins
+        histograms = np.bincount((bin_index + offsets).ravel(),
+                                 minlength=number_of_crops * number_of_bins).reshape(number_of_crops, number_of_bins)
+        corner_bins = bin_index[:, self.corner_indices()]
+        histograms[np.arange(number_of_crops)[:, None], corner_bins] = 0
+
+        player_bin = histograms.argmax(axis=1)
+        in_player_bin = bin_index == player_bin[:, None]
+        # when every pixel is a background colour the whole crop is used
+        in_player_bin[histograms.max(axis=1) == 0] = True
+        count = in_player_bin.sum(axis=1, keepdims=True)
+        return (pixels * in_player_bin[:, :, None]).sum(axis=1) / count
+
     def assign_team_color(self, frame, player_detections):
-        player_colors = []
+        # Getting the colour of every player of the frame in one call
+        player_colors = self.get_player_colors(
+            frame, [player_detection["bbox"] for player_detection in player_detections.values()])
 
-        for _, player_detection in player_detections.items():
-            bbox = player_detection["bbox"]
-            player_color = self.get_player_color(frame, bbox)
-            player_colors.append(player_color)
+        self.fit_team_colors(player_colors)
 
+    def fit_team_colors(self, player_colors):
         # Divding the colours int two
+        from sklearn.cluster import KMeans
         kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10)
         kmeans.fit(player_colors)
 
@@ -62,18 +185,39 @@ class TeamAssigner:
         self.team_colors[1] = kmeans.cluster_centers_[0]
         self.team_colors[2] = kmeans.cluster_centers_[1]
 
+    def predict_teams(self, player_ids, player_colors):
+        # Predicting the team of the given players from their colours and remembering them
+        team_ids = self.kmeans.predict(np.asarray(player_colors).reshape(len(player_ids), -1)) + 1
+
+        for player_id, team_id in zip(player_ids, team_ids):
+            if player_id == 91:  # if goalkeeper assign to team 1
+                team_id = 1
+            self.player_team_dict[player_id] = team_id
+
+        return [self.player_team_dict[player_id] for player_id in player_ids]
+
     def get_player_team(self, frame, player_bbox, player_id):
         if player_id in self.player_team_dict:
             return self.player_team_dict[player_id]
 
-        player_color = self.get_player_color(frame, player_bbox)
+        player_color = self.get_player_colors(frame, [player_bbox])
 
-        team_id = self.kmeans.predict(player_color.reshape(1, -1))[0]
-        team_id += 1
+        return self.predict_teams([player_id], player_color)[0]
 
-        if player_id == 91:  # if goalkeeper assign to team 1
-            team_id = 1
+    # Assigning the team of every player of one frame, the team colours are taken from the first frame given
+    def assign_frame_teams(self, frame, player_track):
+        if not self.team_colors:
+            self.assign_team_color(frame, player_track)
 
-        self.player_team_dict[player_id] = team_id
+        # the colours of all the players seen for the first time are extracted in one batch
+        new_player_ids = [player_id for player_id in player_track
+                          if player_id not in self.player_team_dict]
+        if new_player_ids:
+            player_colors = self.get_player_colors(
+                frame, [player_track[player_id]['bbox'] for player_id in new_player_ids])
+            self.predict_teams(new_player_ids, player_colors)
 
-        return team_id
+        for player_id, track in player_track.items():
+            team = self.player_team_dict[player_id]
+            track['team'] = team
+            track['team_color'] = self.team_colors[team]
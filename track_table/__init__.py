@@ -0,0 +1 @@
+from .track_table import TrackTable, OBJECT_CLASSES
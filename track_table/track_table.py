@@ -0,0 +1,309 @@
+import itertools
+import operator
+import numpy as np
+
+# Objects of the tracks dictionary, their index in this tuple is the object_class column of the table
+OBJECT_CLASSES = ("players", "referees", "ball")
+
+# Columns computed by the enrichment stages, in the order they are serialized
+ATTRIBUTE_COLUMNS = ('position', 'position_adjusted', 'position_transformed',
+                     'speed', 'distance', 'team', 'team_confidence', 'has_ball')
+
+
+class TrackTable:
+    """
+    Columnar version of the nested `tracks` dictionary.
+
+    Every detection of every frame is one row, and each attribute is one NumPy column:
+    frame, object_class, track_id, bbox (N, 4), position, position_adjusted and
+    position_transformed (N, 2), speed, distance, team, team_confidence and has_ball.
+    Missing float values are NaN and a team of 0 means that no team was assigned.
+
+    Rows are sorted by frame, object class and track id, so the rows of frame f are
+    rows[frame_offsets[f]:frame_offsets[f+1]]. The rows of each track sorted by frame are
+    track_order[track_offsets[t]:track_offsets[t+1]], where track_keys[t] is the (object_class, track_id) of track t.
+    """
+
+    def __init__(self, frame, object_class, track_id, bbox, number_of_frames=None, team_colors=None):
+        frame = np.asarray(frame, dtype=np.int64)
+        object_class = np.asarray(object_class, dtype=np.int8)
+        track_id = np.asarray(track_id, dtype=np.int64)
+        bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+
+        # Sorting the rows by frame, then object class, then track id (the last key of lexsort is the primary one)
+        order = np.lexsort((track_id, object_class, frame))
+        # row i of the table is the row source_order[i] of the input columns
+        self.source_order = order
+        self.frame = frame[order]
+        self.object_class = object_class[order]
+        self.track_id = track_id[order]
+        self.bbox = bbox[order]
+
+        number_of_rows = len(self.frame)
+        self.position = np.full((number_of_rows, 2), np.nan)
+        self.position_adjusted = np.full((number_of_rows, 2), np.nan)
+        self.position_transformed = np.full((number_of_rows, 2), np.nan)
+        self.speed = np.full(number_of_rows, np.nan)
+        self.distance = np.full(number_of_rows, np.nan)
+        self.team = np.zeros(number_of_rows, dtype=np.int8)
+        self.team_confidence = np.full(number_of_rows, np.nan)
+        self.has_ball = np.zeros(number_of_rows, dtype=bool)
+
+        # team id -> BGR colour, used by the compatibility view for 'team_color'
+        self.team_colors = dict(team_colors or {})
+        # names of the columns that have been computed, the others are left out of the compatibility view
+        self.computed_columns = set()
+
+        if number_of_frames is None:
+            number_of_frames = int(self.frame.max()) + 1 if number_of_rows else 0
+        self.number_of_frames = number_of_frames
+
+        self._build_offsets()
+
+    def _build_offsets(self):
+        # Per-frame offsets: the rows of frame f are between frame_offsets[f] and frame_offsets[f+1]
+        self.frame_offsets = np.searchsorted(
+            self.frame, np.arange(self.number_of_frames + 1))
+
+        # Per-track offsets on the rows sorted by object class, track id and frame
+        self.track_order = np.lexsort(
+            (self.frame, self.track_id, self.object_class))
+        track_object_class = self.object_class[self.track_order]
+        track_id = self.track_id[self.track_order]
+        new_track = np.ones(len(self.track_order), dtype=bool)
+        new_track[1:] = (track_object_class[1:] != track_object_class[:-1]) | (
+            track_id[1:] != track_id[:-1])
+        starts = np.flatnonzero(new_track)
+        self.track_offsets = np.append(starts, len(self.track_order))
+        self.track_keys = list(
+            zip(track_object_class[starts].tolist(), track_id[starts].tolist()))
+        self._track_index = {key: index for index,
+                             key in enumerate(self.track_keys)}
+
+    def __len__(self):
+        return len(self.frame)
+
+    @classmethod
+    def from_tracks(cls, tracks, team_colors=None):
+        """
+        Builds the table from the nested tracks dictionary.
+        Attributes already present in the dictionaries (position, speed, team, ...) are copied as well.
+        The dictionaries are flattened and their values read with map and itertools, without a Python loop per row.
+        """
+        frame, object_class, track_id, records = [], [], [], []
+        number_of_frames = 0
+        for object, object_tracks in tracks.items():
+            object_tracks = list(object_tracks)
+            number_of_frames = max(number_of_frames, len(object_tracks))
+            counts = np.fromiter(map(len, object_tracks), dtype=np.int64, count=len(object_tracks))
+            number_of_rows = int(counts.sum())
+            frame.append(np.repeat(np.arange(len(object_tracks)), counts))
+            object_class.append(np.full(number_of_rows, OBJECT_CLASSES.index(object), dtype=np.int8))
+            track_id.append(np.fromiter(itertools.chain.from_iterable(object_tracks), dtype=np.int64,
+                                        count=number_of_rows))
+            records += itertools.chain.from_iterable(map(dict.values, object_tracks))
+        bbox = np.fromiter(itertools.chain.from_iterable(map(operator.itemgetter('bbox'), records)),
+                           dtype=np.float64, count=4 * len(records))
+
+        table = cls(np.concatenate(frame) if frame else [], np.concatenate(object_class) if frame else [],
+                    np.concatenate(track_id) if frame else [], bbox, number_of_frames)
+
+        # Copying the optional attributes in the sorted row order, missing values stay NaN (or 0 for the team)
+        for column in ATTRIBUTE_COLUMNS:
+            if not any(map(operator.contains, records, itertools.repeat(column))):
+                continue
+            values = list(map(operator.methodcaller('get', column), records))
+            target = getattr(table, column)
+            if target.ndim == 2:
+                missing = (np.nan,) * target.shape[1]
+                pairs = (missing if value is None else value for value in values) if None in values else values
+                column_values = np.fromiter(itertools.chain.from_iterable(pairs), dtype=np.float64,
+                                            count=target.size).reshape(target.shape)
+            else:
+                # None becomes NaN
+                column_values = np.array(values, dtype=np.float64)
+                if target.dtype != np.float64:
+                    column_values = np.nan_to_num(column_values)
+            target[:] = column_values[table.source_order]
+            if column != 'has_ball':
+                table.computed_columns.add(column)
+
+        # team colours are taken from the dictionaries when they are not given, from the first row of each team
+        table.team_colors = dict(team_colors or {})
+        if 'team' in table.computed_columns:
+            for team in np.unique(table.team[table.team > 0]).tolist():
+                track_info = records[table.source_order[np.argmax(table.team == team)]]
+                if 'team_color' in track_info:
+                    table.team_colors.setdefault(team, track_info['team_color'])
+        return table
+
+    def to_arrays(self):
+        """
+        Returns the table as a dictionary of NumPy arrays (e.g. for np.savez), only with the computed columns.
+        Team colours are stored as a (number of teams, 4) array of team id and BGR colour.
+        """
+        arrays = {
+            'frame': self.frame,
+            'object_class': self.object_class,
+            'track_id': self.track_id,
+            'bbox': self.bbox,
+            'number_of_frames': np.array(self.number_of_frames),
+            'team_colors': np.array([[team, *color] for team, color in sorted(self.team_colors.items())],
+                                    dtype=np.float64).reshape(-1, 4),
+        }
+        for column in ATTRIBUTE_COLUMNS:
+            if column in self.computed_columns or column == 'has_ball':
+                arrays[column] = getattr(self, column)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        # Inverse of to_arrays, arrays can be the NpzFile returned by np.load
+        team_colors = {int(row[0]): tuple(row[1:].tolist())
+                       for row in np.asarray(arrays['team_colors'])}
+        table = cls(arrays['frame'], arrays['object_class'], arrays['track_id'], arrays['bbox'],
+                    int(arrays['number_of_frames']), team_colors)
+        for column in ATTRIBUTE_COLUMNS:
+            if column in arrays:
+                # the rows were saved sorted, source_order is the identity
+                getattr(table, column)[:] = np.asarray(arrays[column])[table.source_order]
+                if column != 'has_ball':
+                    table.computed_columns.add(column)
+        return table
+
+    def frame_range(self, start_frame, end_frame):
+        # Table of the rows of the frames start_frame to end_frame (left out), renumbered from 0
+        rows = slice(self.frame_offsets[start_frame], self.frame_offsets[end_frame])
+        table = TrackTable(self.frame[rows] - start_frame, self.object_class[rows], self.track_id[rows],
+                           self.bbox[rows], end_frame - start_frame, self.team_colors)
+        # the rows are already sorted, source_order is the identity
+        for column in ATTRIBUTE_COLUMNS:
+            getattr(table, column)[:] = getattr(self, column)[rows]
+        table.computed_columns = set(self.computed_columns)
+        return table
+
+    def frame_rows(self, frame_num, object=None):
+        # Returns the slice of the rows of one frame, optionally only of one object
+        start, end = self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+        if object is None:
+            return slice(start, end)
+        object_class_id = OBJECT_CLASSES.index(object)
+        classes = self.object_class[start:end]
+        return slice(start + np.searchsorted(classes, object_class_id, side='left'),
+                     start + np.searchsorted(classes, object_class_id, side='right'))
+
+    def track_rows(self, object, track_id):
+        # Returns the row indices of one track sorted by frame
+        index = self._track_index.get((OBJECT_CLASSES.index(object), track_id))
+        if index is None:
+            return np.empty(0, dtype=np.int64)
+        return self.track_order[self.track_offsets[index]:self.track_offsets[index + 1]]
+
+    def iter_tracks(self, object=None):
+        # Yields (object, track_id, rows) for every track, rows being sorted by frame
+        for index, (object_class_id, track_id) in enumerate(self.track_keys):
+            if object is not None and OBJECT_CLASSES[object_class_id] != object:
+                continue
+            rows = self.track_order[self.track_offsets[index]:self.track_offsets[index + 1]]
+            yield OBJECT_CLASSES[object_class_id], track_id, rows
+
+    def object_mask(self, object):
+        return self.object_class == OBJECT_CLASSES.index(object)
+
+    # Vectorized enrichment stages
+
+    def add_positions(self):
+        # Foot position for players and referees and center for the ball, same integer rounding as utils.bbox_utils
+        x1, y1, x2, y2 = self.bbox.T
+        ball = self.object_mask('ball')
+        self.position[:, 0] = np.trunc((x1 + x2) / 2)
+        self.position[:, 1] = np.where(
+            ball, np.trunc((y1 + y2) / 2), np.trunc(y2))
+        self.computed_columns.add('position')
+
+    def add_adjusted_positions(self, camera_movement_per_frame):
+        # Subtracting the camera movement of each row's frame from its position
+        camera_movement = np.asarray(
+            camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        self.position_adjusted[:] = self.position - camera_movement[self.frame]
+        self.computed_columns.add('position_adjusted')
+
+    def set_team_colors(self, team_colors):
+        self.team_colors = dict(team_colors)
+
+    # Compatibility with the nested dictionary
+
+    def frame_dict(self, object, frame_num):
+        # Builds the {track_id: track_info} dictionary of one object in one frame
+        frame_tracks = {}
+        rows = self.frame_rows(frame_num, object)
+        for row in range(rows.start, rows.stop):
+            frame_tracks[int(self.track_id[row])] = self._row_dict(row)
+        return frame_tracks
+
+    def _row_dict(self, row):
+        track_info = {"bbox": self.bbox[row].tolist()}
+        for column in ('position', 'position_adjusted'):
+            if column in self.computed_columns and not np.isnan(getattr(self, column)[row, 0]):
+                track_info[column] = tuple(getattr(self, column)[row].tolist())
+        if 'position_transformed' in self.computed_columns:
+            # points outside of the court are None like in ViewTransformer
+            value = self.position_transformed[row]
+            track_info['position_transformed'] = None if np.isnan(
+                value[0]) else value.tolist()
+        for column in ('speed', 'distance', 'team_confidence'):
+            value = getattr(self, column)[row]
+            if not np.isnan(value):
+                track_info[column] = float(value)
+        if self.team[row] > 0:
+            team = int(self.team[row])
+            track_info['team'] = team
+            if team in self.team_colors:
+                track_info['team_color'] = self.team_colors[team]
+        if self.has_ball[row]:
+            track_info['has_ball'] = True
+        return track_info
+
+    def as_tracks(self):
+        """
+        Read-only view with the same layout as the nested tracks dictionary, so the existing drawing code
+        (tracks["players"][frame_num].items(), ...) keeps working. Each frame dictionary is built when it is accessed,
+        changes made to it are not written back to the table.
+        """
+        return TracksView(self)
+
+    def to_tracks(self):
+        # Fully materialized nested tracks dictionary
+        return {object: [self.frame_dict(object, frame_num) for frame_num in range(self.number_of_frames)]
+                for object in OBJECT_CLASSES}
+
+
+class TracksView(dict):
+    # dictionary of object -> ObjectTracksView
+    def __init__(self, table):
+        super().__init__({object: ObjectTracksView(table, object)
+                          for object in OBJECT_CLASSES})
+        self.table = table
+
+
+class ObjectTracksView:
+    # list-like view of the frames of one object
+    def __init__(self, table, object):
+        self.table = table
+        self.object = object
+
+    def __len__(self):
+        return self.table.number_of_frames
+
+    def __getitem__(self, frame_num):
+        if isinstance(frame_num, slice):
+            return [self[i] for i in range(*frame_num.indices(len(self)))]
+        if frame_num < 0:
+            frame_num += len(self)
+        if not 0 <= frame_num < len(self):
+            raise IndexError(frame_num)
+        return self.table.frame_dict(self.object, frame_num)
+
+    def __iter__(self):
+        for frame_num in range(len(self)):
+            yield self.table.frame_dict(self.object, frame_num)
@@ -1 +1,3 @@
 from .tracker import Tracker
+from .detection_engine import DetectionEngine, FrameDetections
+from .keyframe_tracker import KeyframeTracker
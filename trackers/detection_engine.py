@@ -0,0 +1,147 @@
+import itertools
+import os
+import time
+import numpy as np
+
+
+class FrameDetections:
+    """
+    Compact detections of one frame: only the boxes (xyxy), their confidence and class id as NumPy arrays,
+    and the class names of the model. Unlike the ultralytics Results it doesn't keep the original image,
+    so holding the detections of a whole video costs a few bytes per box instead of a frame per detection.
+    """
+    __slots__ = ('xyxy', 'confidence', 'class_id', 'names')
+
+    def __init__(self, xyxy, confidence, class_id, names):
+        self.xyxy = xyxy
+        self.confidence = confidence
+        self.class_id = class_id
+        self.names = names
+
+    def __len__(self):
+        return len(self.class_id)
+
+    @classmethod
+    def from_result(cls, result):
+        boxes = result.boxes
+        return cls(boxes.xyxy.cpu().numpy().astype(np.float32),
+                   boxes.conf.cpu().numpy().astype(np.float32),
+                   boxes.cls.cpu().numpy().astype(int),
+                   result.names)
+
+
+class DetectionEngine:
+    """
+    Runs the YOLO model on batches taken from any iterable of frames and yields compact FrameDetections.
+
+    model is a loaded model or the path of the YOLO weights. A path is only loaded (and ultralytics and torch only
+    imported) when the first batch is predicted, so replaying the tracks from the cache or a stub doesn't pay for them.
+
+    batch_size, conf, imgsz (None for the size the model was trained with) and half (FP16 inference, GPU only)
+    are given to model.predict.
+    With adaptive=True the batch size is tuned while the video is processed:
+    - it is doubled (up to max_batch_size) as long as the time per frame keeps going down, and stepped back
+      when a bigger batch is not faster;
+    - it is halved when a batch takes longer than max_batch_latency seconds (to bound the latency of streaming),
+      when the GPU memory reserved by torch goes above max_memory_fraction, or when the GPU runs out of memory
+      (the batch is then run again with the smaller size, which becomes the maximum).
+    """
+
+    def __init__(self, model, batch_size=20, conf=0.1, imgsz=None, half=False, adaptive=False,
+                 min_batch_size=1, max_batch_size=64, max_batch_latency=None, max_memory_fraction=0.9):
+        if isinstance(model, (str, os.PathLike)):
+            self.model_path, self._model = model, None
+        else:
+            self.model_path, self._model = None, model
+        self.batch_size = batch_size
+        self.conf = conf
+        self.imgsz = imgsz
+        self.half = half
+        self.adaptive = adaptive
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_latency = max_batch_latency
+        self.max_memory_fraction = max_memory_fraction
+        # best time per frame measured for each batch size, used by the adaptive batch size
+        self.frame_latency = {}
+        self.batch_size_history = []
+
+    @property
+    def model(self):
+        if self._model is None:
+            from ultralytics import YOLO
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    def predict(self, batch):
+        options = {'conf': self.conf, 'half': self.half, 'verbose': False}
+        if self.imgsz is not None:
+            options['imgsz'] = self.imgsz
+        results = self.model.predict(batch, **options)
+        return [FrameDetections.from_result(result) for result in results]
+
+    def iter_batches(self, frames):
+        # Yields the list of FrameDetections of every batch, only one batch of frames is held at a time
+        frames = iter(frames)
+        pending = []
+        while True:
+            # frames left over from a batch that ran out of memory are used first
+            if len(pending) < self.batch_size:
+                pending += list(itertools.islice(frames,
+                                self.batch_size - len(pending)))
+            batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+            if not batch:
+                break
+
+            start = time.perf_counter()
+            try:
+                detections = self.predict(batch)
+            except RuntimeError as error:
+                if not self.adaptive or 'out of memory' not in str(error) or len(batch) <= self.min_batch_size:
+                    raise
+                # running the frames again with half the batch size
+                import torch
+                torch.cuda.empty_cache()
+                self.batch_size = max(len(batch) // 2, self.min_batch_size)
+                self.max_batch_size = self.batch_size
+                pending = batch + pending
+                continue
+            elapsed = time.perf_counter() - start
+
+            self.batch_size_history.append(len(batch))
+            if self.adaptive:
+                self.adapt_batch_size(len(batch), elapsed)
+            yield detections
+
+    def iter_detections(self, frames):
+        # Yields the FrameDetections of every frame
+        for detections in self.iter_batches(frames):
+            yield from detections
+
+    def adapt_batch_size(self, batch_size, elapsed):
+        if batch_size != self.batch_size:
+            # the last batch of the video is smaller, it says nothing about the batch size
+            return
+        frame_latency = elapsed / batch_size
+        self.frame_latency[batch_size] = min(
+            frame_latency, self.frame_latency.get(batch_size, np.inf))
+
+        if (self.max_batch_latency is not None and elapsed > self.max_batch_latency) or \
+                self.memory_fraction() > self.max_memory_fraction:
+            self.batch_size = max(batch_size // 2, self.min_batch_size)
+            return
+
+        smaller = [size for size in self.frame_latency if size < batch_size]
+        if smaller and self.frame_latency[max(smaller)] <= self.frame_latency[batch_size]:
+            # the bigger batch was not faster per frame, going back to the previous size
+            self.batch_size = max(smaller)
+        elif batch_size * 2 <= self.max_batch_size and batch_size * 2 not in self.frame_latency:
+            self.batch_size = batch_size * 2
+
+    def memory_fraction(self):
+        # Fraction of the GPU memory reserved by torch, 0 on the CPU
+        import torch
+        if not torch.cuda.is_available():
+            return 0.0
+        total = torch.cuda.get_device_properties(0).total_memory
+        return torch.cuda.memory_reserved() / total
@@ -0,0 +1,153 @@
+import numpy as np
+from profiling import stage_timer
+from .detection_engine import FrameDetections
+
+
+class KeyframeTracker:
+    """
+    Tracking with the detector run only on keyframes.
+
+    A frame is a keyframe when:
+    - detect_every frames went by since the last keyframe, or fewer when the tracks move fast: the interval is
+      shortened so that the fastest track can't drift more than max_drift pixels between two keyframes;
+    - or the camera moved more than max_camera_movement pixels since the previous frame.
+    On the other frames the players and referees of the previous frame are moved by their velocity in the image
+    (measured on the last two frames) and these propagated boxes are given to ByteTrack like detections.
+    With compensate_camera_movement=True the velocity is split into the movement of the object and the movement of
+    the camera, and the camera movement of the new frame is used instead of the previous one. This only helps with a
+    smooth per frame camera movement (e.g. the 'median' or 'affine' motion estimators): with the gated 'max' estimator
+    of the stubs it makes the propagated boxes worse, so it is off by default.
+    The ball is not propagated, its missing frames are filled by Tracker.interpolate_ball_positions.
+
+    The camera movement of each frame comes from camera_movement_estimator, or from camera_movement_per_frame when it
+    was already computed (e.g. from the stub or the cache). Without either the camera is assumed to be static.
+    It has the same add_frames_to_tracks(frames, tracks) method as Tracker, so it can be used in a TrackingStage.
+    """
+
+    def __init__(self, tracker, detect_every=3, max_drift=None, max_camera_movement=None,
+                 camera_movement_estimator=None, camera_movement_per_frame=None, compensate_camera_movement=False,
+                 propagated_confidence=0.5):
+        if detect_every < 1:
+            raise ValueError("detect_every must be at least 1")
+        self.tracker = tracker
+        self.detect_every = detect_every
+        self.max_drift = max_drift
+        self.max_camera_movement = max_camera_movement
+        self.camera_movement_estimator = camera_movement_estimator
+        self.camera_movement_per_frame = camera_movement_per_frame
+        self.compensate_camera_movement = compensate_camera_movement
+        self.propagated_confidence = propagated_confidence
+
+        self.frame_num = 0
+        self.last_keyframe = None
+        self.names = None
+        self.previous_camera_movement = np.zeros(2)
+        # frame numbers where the detector was run
+        self.keyframes = []
+
+    def get_camera_movements(self, frames):
+        if self.camera_movement_estimator is not None:
+            return np.array([self.camera_movement_estimator.get_frame_camera_movement(frame) for frame in frames],
+                            dtype=np.float64).reshape(-1, 2)
+        if self.camera_movement_per_frame is not None:
+            return np.asarray(self.camera_movement_per_frame[self.frame_num:self.frame_num + len(frames)],
+                              dtype=np.float64).reshape(-1, 2)
+        return np.zeros((len(frames), 2))
+
+    def keyframe_interval(self, tracks):
+        # detect_every, shortened so that the fastest track doesn't drift more than max_drift pixels
+        if self.max_drift is None:
+            return self.detect_every
+        _, _, velocities = self.track_velocities(tracks)
+        if len(velocities) == 0:
+            return self.detect_every
+        max_speed = np.hypot(velocities[:, 0], velocities[:, 1]).max()
+        if max_speed == 0:
+            return self.detect_every
+        return int(np.clip(self.max_drift // max_speed, 1, self.detect_every))
+
+    def select_keyframes(self, camera_movements, interval):
+        is_keyframe = np.zeros(len(camera_movements), dtype=bool)
+        for i, camera_movement in enumerate(camera_movements):
+            frame_num = self.frame_num + i
+            if self.last_keyframe is None or frame_num - self.last_keyframe >= interval or \
+                    (self.max_camera_movement is not None and np.hypot(*camera_movement) > self.max_camera_movement):
+                is_keyframe[i] = True
+                self.last_keyframe = frame_num
+        return is_keyframe
+
+    def add_frames_to_tracks(self, frames, tracks):
+        """
+        Detects (on keyframes) or propagates (on the other frames) the objects of a window of frames and appends them
+        to tracks. Like Tracker.add_frames_to_tracks it can be called with consecutive windows of the video.
+        """
+        frames = list(frames)
+        camera_movements = self.get_camera_movements(frames)
+        is_keyframe = self.select_keyframes(
+            camera_movements, self.keyframe_interval(tracks))
+
+        # the keyframes of the window are detected in batches, timed as the 'detect' stage like in Tracker
+        detection_batches = self.tracker.detection_engine.iter_batches(
+            frame for frame, keyframe in zip(frames, is_keyframe) if keyframe)
+        detections = iter(())
+        for keyframe, camera_movement in zip(is_keyframe, camera_movements):
+            if keyframe:
+                detection = next(detections, None)
+                if detection is None:
+                    # the detector runs when the next batch is taken from the generator
+                    with stage_timer(self.tracker.profiler, 'detect') as timer:
+                        detections_batch = next(detection_batches)
+                        timer.frames = len(detections_batch)
+                    detections = iter(detections_batch)
+                    detection = next(detections)
+                self.names = detection.names
+                self.keyframes.append(self.frame_num)
+            else:
+                detection = self.propagate(tracks, camera_movement)
+            self.tracker.add_detection_to_tracks(detection, tracks)
+            self.previous_camera_movement = camera_movement
+            self.frame_num += 1
+
+    def track_velocities(self, tracks):
+        """
+        Returns the class names ('players' or 'referees'), the last bboxes (N, 4) and the velocities (N, 2) of the
+        tracks of the last frame. The velocity is the movement of the box centre between the last two frames, plus
+        the camera movement of the last frame (i.e. the movement of the object itself) with compensate_camera_movement.
+        """
+        objects, bboxes, velocities = [], [], []
+        if not tracks["players"]:
+            return objects, np.empty((0, 4)), np.empty((0, 2))
+        for object in ("players", "referees"):
+            last_track = tracks[object][-1]
+            previous_track = tracks[object][-2] if len(
+                tracks[object]) > 1 else {}
+            for track_id, track_info in last_track.items():
+                bbox = np.asarray(track_info['bbox'], dtype=np.float64)
+                velocity = np.zeros(2)
+                if track_id in previous_track:
+                    previous_bbox = np.asarray(
+                        previous_track[track_id]['bbox'], dtype=np.float64)
+                    velocity = (bbox[:2] + bbox[2:]) / 2 - \
+                        (previous_bbox[:2] + previous_bbox[2:]) / 2
+                    if self.compensate_camera_movement:
+                        velocity += self.previous_camera_movement
+                objects.append(object)
+                bboxes.append(bbox)
+                velocities.append(velocity)
+        return objects, np.array(bboxes).reshape(-1, 4), np.array(velocities).reshape(-1, 2)
+
+    def propagate(self, tracks, camera_movement):
+        # Boxes of the last frame moved by their velocity, and by the camera movement (old minus new position)
+        objects, bboxes, velocities = self.track_velocities(tracks)
+        shift = velocities
+        if self.compensate_camera_movement:
+            shift = velocities - np.asarray(camera_movement, dtype=np.float64)
+        bboxes = bboxes + np.tile(shift, 2)
+
+        class_ids = {v: k for k, v in self.names.items()}
+        return FrameDetections(bboxes.astype(np.float32),
+                               np.full(len(bboxes), self.propagated_confidence,
+                                       dtype=np.float32),
+                               np.array([class_ids['player' if object == 'players' else 'referee']
+                                         for object in objects], dtype=int),
+                               self.names)
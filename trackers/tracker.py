@@ -1,8 +1,11 @@
-from utils import get_center_of_bbox, get_bbox_width, get_foot_position
-from ultralytics import YOLO
-import supervision as sv
+from utils import get_center_of_bbox, get_bbox_width, get_foot_position, draw_transparent_rectangle, color_key
+from track_table import TrackTable
+from ball_trajectory import BallTrajectory
+from possession_statistics import PossessionStatistics
+from profiling import stage_timer
+from .detection_engine import DetectionEngine
+from .keyframe_tracker import KeyframeTracker
 import numpy as np
-import pandas as pd
 import pickle
 import os
 import sys
@@ -11,12 +14,29 @@ sys.path.append('../')
 
 
 class Tracker:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
-        # each detected object is assigned a unique tracker ID, enabling the continuous following of the object's motion path across different frames
-        self.tracker = sv.ByteTrack()
+    # SpriteCache used by the drawing methods, None draws every shape directly on the frame
+    sprite_cache = None
+    # StageProfiler timing the detector ('detect') and the ByteTrack updates ('bytetrack'), None doesn't time them
+    profiler = None
+    # ByteTrack of the detections, created with the first tracked frame so that supervision is only imported then
+    tracker = None
+
+    def __init__(self, model_path, batch_size=20, conf=0.1, imgsz=None, half=False, adaptive_batch_size=False):
+        # the detector runs on batches of frames and keeps only the boxes, see DetectionEngine for the options
+        # the YOLO model is loaded by the first batch, tracks replayed from the cache or a stub never load it
+        self.detection_engine = DetectionEngine(model_path, batch_size=batch_size, conf=conf, imgsz=imgsz,
+                                                half=half, adaptive=adaptive_batch_size)
+
+    @property
+    def model(self):
+        return self.detection_engine.model
 
     def add_position_to_tracks(self, tracks):
+        # a TrackTable computes the positions of all the rows in one vectorized pass
+        if isinstance(tracks, TrackTable):
+            tracks.add_positions()
+            return
+
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
                 for track_id, track_info in track.items():
@@ -27,52 +47,164 @@ class Tracker:
                         position = get_foot_position(bbox)
                     tracks[object][frame_num][track_id]['position'] = position
 
-    # method to detect the frames from the videos with self as reference and frames as list or array of image frames
-    def interpolate_ball_positions(self, ball_positions):
-        # Converting ball position format to pandas dataframe format
-        # We are getting track id 1 and if no track id then
-        # it's going to be empty dictonary
-        # and then we get bbox and if not bbox then empty list and then
-        # the empty list will be interpolated by pandas dataframe
-        ball_positions = [x.get(1, {}).get('bbox', []) for x in ball_positions]
-        # converting to pandas dataframes with columns 'x1', 'y1', 'x2', and 'y2'.
-        df_ball_positions = pd.DataFrame(
-            ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
-
-        # Interpolate/inserting Missing Values
-        df_ball_positions = df_ball_positions.interpolate()
-        # Edge case if the missing detection is first one we not going to interpolate it
-        # bfill()performs a backward fill on the DataFrame, filling any remaining NaN values with the next valid value.
-        df_ball_positions = df_ball_positions.bfill()
-
-        # Converting the processed DataFrame back into the original nested dictionary structure.
-        ball_positions = [{1: {"bbox": x}}
-                          for x in df_ball_positions.to_numpy().tolist()]
-
-        return ball_positions
+    def interpolate_ball_positions(self, ball_positions, max_gap=None, max_speed=None, kalman=False):
+        """
+        Interpolating/inserting the missing ball positions with NumPy (see BallTrajectory).
+        With the default parameters the result is the same as the previous pandas interpolate() and bfill():
+        every gap is interpolated and the frames before the first detection take its bbox.
+        max_gap limits the length of the interpolated gaps, max_speed (pixels per frame) rejects the isolated jumps
+        of false positive detections and kalman smooths the trajectory.
+        Frames left without ball are empty dictionaries.
+        """
+        ball_trajectory = BallTrajectory(
+            max_gap=max_gap, max_speed=max_speed, kalman=kalman)
+        return ball_trajectory.interpolate_ball_tracks(ball_positions)
 
     def detect_frames(self, frames):
+        # collecting every batch of detections into one list
+        detections = []  # initialising an empty list to store all the detection results
+        for detections_batch in self.iter_detection_batches(frames):
+            # adding the etections from the current batch to the overall detections list.
+            detections += detections_batch
+
+        return detections  # returning the detections
 
-        batch_size = 20  # stating batch_size as 20. In image processing, working with batches of data can be more efficient than processing each item individually
+    def iter_detection_batches(self, frames):
+        """
+        Following generator takes the frames in batches from any iterable (a list or a generator of decoded frames) and yields the detections of each batch.
+        Only one batch of frames is held at a time, so the video doesn't have to be loaded in memory.
 
-        detections = []  # initialising an empty list to store all the detection results
+        The detections are compact FrameDetections (boxes, confidences and class ids) and not the ultralytics Results,
+        which keep a copy of their frame. The batch size, confidence threshold, image size and FP16 inference
+        are the options of self.detection_engine.
+        """
+        return self.detection_engine.iter_batches(frames)
 
+    def add_frames_to_tracks(self, frames, tracks):
+        """
+        Detects and tracks the objects of frames (any iterable of frames) and appends them to tracks.
+        It can be called several times with consecutive windows of the video to build the tracks incrementally.
+        """
+        detection_batches = self.iter_detection_batches(frames)
+        while True:
+            # the detector runs when the next batch is taken from the generator
+            with stage_timer(self.profiler, 'detect') as timer:
+                detections_batch = next(detection_batches, None)
+                timer.frames = len(detections_batch) if detections_batch is not None else 0
+            if detections_batch is None:
+                break
+            for detection in detections_batch:
+                self.add_detection_to_tracks(detection, tracks)
+
+    def add_detection_to_tracks(self, detection, tracks):
+        """
+        Tracks the detections of one frame and appends the result to tracks as a new frame.
+        ByteTrack keeps its state in self.tracker, so frames have to be given in order.
         """
-        Following loop iterates over the frames in batches. It uses range() with a step size of batch_size, so `i` will take on values 0, 20, 40, etc., until it reaches or exceeds the length of frames
+        import supervision as sv
+        if self.tracker is None:
+            # each detected object is assigned a unique tracker ID, enabling the continuous following of the object's motion path across different frames
+            self.tracker = sv.ByteTrack()
+
+        frame_num = len(tracks["players"])
+        # overwriting goalkeeper with the player due to error in detection
+        # mapping class and names{0:person, 1: goal,.. etc}
+        cls_names = detection.names
+
+        # k is key and v is value
+        cls_names_inv = {v: k for k, v in cls_names.items()}
+
+        # Converting to supervision detection format
+        detection_supervision = sv.Detections(xyxy=detection.xyxy.copy(),
+                                              confidence=detection.confidence,
+                                              class_id=detection.class_id.copy())
+
+        # Converting goalkeeper to player object
+        """
+        This loop iterates over the class IDs in the detection. If a class is identified as "goalkeeper", it changes its class ID to that of "player".
+        """
+        for object_ind, class_id in enumerate(detection_supervision.class_id):
+            if cls_names[class_id] == "goalkeeper":
+                detection_supervision.class_id[object_ind] = cls_names_inv["player"]
+
+        # Tracking Objects
+
+        """
+        Following code is crucial in maintaining continuity of object identities across video frames, which is essential for tasks like counting unique objects or analyzing their trajectories over time.
+        
+        detection_with_tracks variable contains the updated tracking information, including both the current detections and their associated track IDs.
+        
+        self.tracker is an object responsible for tracking detected objects across multiple frames of video.
+        
+        detection_supervision is the input to the method.
         
-        self.model.predict() calls the prediction method of YOLO
-        frames[i:i+batch_size] selects a batch of frames from the input.
-        conf=0.1 sets a confidence threshold of 0.1 for the detections.
+        update_with_detections() is a method of the tracker object. Its purpose is to update the current tracks (ongoing object trajectories) with new detection information.
         """
-        for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(
-                frames[i:i+batch_size], conf=0.1)
-            # adding the etections from the current batch to the overall detections list.
-            detections += detections_batch
+        with stage_timer(self.profiler, 'bytetrack'):
+            detection_with_tracks = self.tracker.update_with_detections(
+                detection_supervision)
 
-        return detections  # returning the detections
+        # for each frame we are going to have tracks of players, referees and balls
+        # then we append a dict and and this is going to have key with track id and value is going to be bounding box
+        # Each list item represents a frame, and we're adding an empty dictionary for the current frame.
+        # This structure allows for frame-by-frame tracking of multiple objects.
+        tracks["players"].append({})
+        tracks["referees"].append({})
+        tracks["ball"].append({})
+
+        # going to loop over each detection with tracks
+        """
+        frame_detection[0] is the bounding box, converted to a list (it was likely a numpy array).
+        frame_detection[3] is the class ID (e.g., player, referee).
+        frame_detection[4] is the track ID, which is unique for each tracked object.
+        """
+        for frame_detection in detection_with_tracks:
+            # 0 is the key of bounding box
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]  # 3 is the key of class id
+            track_id = frame_detection[4]  # 4 is the key of track id
+
+            """
+            This part organizes the tracked objects by type and track ID.
+            
+            cls_names_inv is a dictionary mapping class names to IDs.
+            For each player and referee, we're storing their bounding box in the current frame (frame_num), indexed by their track_id.
+            """
+            if cls_id == cls_names_inv['player']:
+                tracks["players"][frame_num][track_id] = {"bbox": bbox}
+
+            if cls_id == cls_names_inv['referee']:
+                tracks["referees"][frame_num][track_id] = {"bbox": bbox}
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+        # Processing ball detection
+
+        """
+        Here we use the original detection_supervision because there is only one ball and we don't need complex tracking like players or referees.
+        
+        The ball's bounding box is always stored with key 1, suggesting we're not tracking multiple balls or maintaining a consistent track ID for the ball across frames.
+        """
+        for frame_detection in detection_supervision:
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]
+
+            if cls_id == cls_names_inv['ball']:
+                tracks["ball"][frame_num][1] = {"bbox": bbox}
+
+    def frame_tracker(self, keyframe_options=None, camera_movement_per_frame=None):
+        """
+        Returns the object tracking the frames: the tracker itself, or with keyframe_options (the keyword arguments of
+        KeyframeTracker: detect_every, max_drift, max_camera_movement, compensate_camera_movement) a KeyframeTracker
+        running the detector only on keyframes.
+        camera_movement_per_frame forces keyframes on large camera movements and propagates the boxes with the camera.
+        It can still be growing while the frames are tracked, e.g. the list of a CameraMovementStage run before the
+        tracking, as long as it covers the frames given to add_frames_to_tracks.
+        """
+        if not keyframe_options:
+            return self
+        return KeyframeTracker(self, camera_movement_per_frame=camera_movement_per_frame, **keyframe_options)
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None, keyframe_options=None,
+                          camera_movement_per_frame=None):
         """
         Here we are checking if:
         read_from_stub is True AND
@@ -82,14 +214,13 @@ class Tracker:
         we will open the stub file in binary read mode
         Loads the tracking data from the file using pickle
         And returns the loaded tracking data and exits the function
+        With keyframe_options the detector only runs on keyframes and the boxes are propagated in between (see frame_tracker).
         """
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             with open(stub_path, 'rb') as f:
                 tracks = pickle.load(f)
             return tracks
 
-        detections = self.detect_frames(frames)
-
         # putting the tracked object in a format so we can utilise easily
         # here we are using dictionary with the lists
         tracks = {
@@ -98,87 +229,7 @@ class Tracker:
             "ball": []
         }
 
-        # overwriting goalkeeper with the player due to error in detection
-        for frame_num, detection in enumerate(detections):
-            # mapping class and names{0:person, 1: goal,.. etc}
-            cls_names = detection.names
-
-            # k is key and v is value
-            cls_names_inv = {v: k for k, v in cls_names.items()}
-            print(cls_names)
-
-            # Converting to supervision detection format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
-            # Converting goalkeeper to player object
-            """
-            This loop iterates over the class IDs in the detection. If a class is identified as "goalkeeper", it changes its class ID to that of "player".
-            """
-            for object_ind, class_id in enumerate(detection_supervision.class_id):
-                if cls_names[class_id] == "goalkeeper":
-                    detection_supervision.class_id[object_ind] = cls_names_inv["player"]
-
-            # Tracking Objects
-
-            """
-            Following code is crucial in maintaining continuity of object identities across video frames, which is essential for tasks like counting unique objects or analyzing their trajectories over time.
-            
-            detection_with_tracks variable contains the updated tracking information, including both the current detections and their associated track IDs.
-            
-            self.tracker is an object responsible for tracking detected objects across multiple frames of video.
-            
-            detection_supervision is the input to the method.
-            
-            update_with_detections() is a method of the tracker object. Its purpose is to update the current tracks (ongoing object trajectories) with new detection information.
-            """
-            detection_with_tracks = self.tracker.update_with_detections(
-                detection_supervision)
-
-            # for each frame we are going to have tracks of players, referees and balls
-            # then we append a dict and and this is going to have key with track id and value is going to be bounding box
-            # Each list item represents a frame, and we're adding an empty dictionary for the current frame.
-            # This structure allows for frame-by-frame tracking of multiple objects.
-            tracks["players"].append({})
-            tracks["referees"].append({})
-            tracks["ball"].append({})
-
-            # going to loop over each detection with tracks
-            """
-            frame_detection[0] is the bounding box, converted to a list (it was likely a numpy array).
-            frame_detection[3] is the class ID (e.g., player, referee).
-            frame_detection[4] is the track ID, which is unique for each tracked object.
-            """
-            for frame_detection in detection_with_tracks:
-                # 0 is the key of bounding box
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]  # 3 is the key of class id
-                track_id = frame_detection[4]  # 4 is the key of track id
-
-                """
-                This part organizes the tracked objects by type and track ID.
-                
-                cls_names_inv is a dictionary mapping class names to IDs.
-                For each player and referee, we're storing their bounding box in the current frame (frame_num), indexed by their track_id.
-                """
-                if cls_id == cls_names_inv['player']:
-                    tracks["players"][frame_num][track_id] = {"bbox": bbox}
-
-                if cls_id == cls_names_inv['referee']:
-                    tracks["referees"][frame_num][track_id] = {"bbox": bbox}
-
-            # Processing ball detection
-
-            """
-            Here we use the original detection_supervision because there is only one ball and we don't need complex tracking like players or referees.
-            
-            The ball's bounding box is always stored with key 1, suggesting we're not tracking multiple balls or maintaining a consistent track ID for the ball across frames.
-            """
-            for frame_detection in detection_supervision:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-
-                if cls_id == cls_names_inv['ball']:
-                    tracks["ball"][frame_num][1] = {"bbox": bbox}
+        self.frame_tracker(keyframe_options, camera_movement_per_frame).add_frames_to_tracks(frames, tracks)
 
         # If a stub_path was provided, save the tracking data to this file using pickle
         if stub_path is not None:
@@ -203,6 +254,10 @@ class Tracker:
         x_center, _ = get_center_of_bbox(bbox)
         width = get_bbox_width(bbox)
 
+        # with a sprite cache the same ellipse and label are blitted from pre-rendered sprites
+        if self.sprite_cache is not None:
+            return self.draw_cached_ellipse(frame, (x_center, y2), width, color, track_id)
+
         """
         Here we calling OpenCV's ellipse function to draw an ellipse on the frame.
     
@@ -283,6 +338,43 @@ class Tracker:
             )
         return frame
 
+    def draw_cached_ellipse(self, frame, anchor, width, color, track_id=None):
+        """
+        Same drawing as draw_ellipse with sprites of self.sprite_cache anchored at (x_center, y2):
+        one sprite per ellipse width and colour, and one per track id label and colour.
+        """
+        axes = (int(width), int(0.35*width))
+
+        def draw_ellipse(image, center):
+            cv2.ellipse(image, center=center, axes=axes, angle=0.0, startAngle=-45, endAngle=235,
+                        color=color, thickness=2, lineType=cv2.LINE_4)
+
+        # the ellipse goes at most its axes and the line thickness away from its centre
+        extent = (axes[0] + 2, axes[1] + 2, axes[0] + 2, axes[1] + 2)
+        self.sprite_cache.draw(frame, anchor, ('ellipse', axes, color_key(color)),
+                               draw_ellipse, extent)
+        if track_id is None:
+            return frame
+
+        # the rectangle and text of draw_ellipse relative to (x_center, y2)
+        text_x = -20 + 12 - (10 if track_id > 99 else 0)
+
+        def draw_label(image, origin):
+            x, y = origin
+            cv2.rectangle(image, (x - 20, y + 5), (x + 20, y + 25), color, cv2.FILLED)
+            cv2.putText(image, f"{track_id}", (x + text_x, y + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+
+        def label_extent():
+            (text_width, text_height), baseline = cv2.getTextSize(
+                f"{track_id}", cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            return (max(20, -text_x) + 2, max(0, text_height - 20) + 2,
+                    max(20, text_x + text_width) + 2, max(25, 20 + baseline) + 2)
+
+        self.sprite_cache.draw(frame, anchor, ('label', int(track_id), color_key(color)),
+                               draw_label, label_extent)
+        return frame
+
     """
     Here we define a method named draw_triangle that takes parameters:
     self: Indicates this is a method in a class
@@ -297,6 +389,15 @@ class Tracker:
         # x is obtained by calling get_center_of_bbox(bbox), which returns the center x-coordinate of the bounding box
         x, _ = get_center_of_bbox(bbox)
 
+        # with a sprite cache the triangle of each colour is rendered once, anchored at its bottom point
+        if self.sprite_cache is not None:
+            def draw(image, point):
+                px, py = point
+                points = np.array([[px, py], [px-10, py-20], [px+10, py-20]])
+                cv2.drawContours(image, [points], 0, color, cv2.FILLED)
+                cv2.drawContours(image, [points], 0, (0, 0, 0), 2)
+            return self.sprite_cache.draw(frame, (x, y), ('triangle', color_key(color)), draw, (12, 22, 12, 2))
+
         """
         Here we are defining the trangle points.
         This creates a NumPy array defining three points of a triangle:
@@ -331,47 +432,44 @@ class Tracker:
         self: The instance of the class this method belongs to
         frame: The current video frame to draw on
         frame_num: The current frame number
-        team_ball_control: An array containing ball control data
+        team_ball_control: A PossessionStatistics of the match, so each frame only looks up its shares.
+        The share of each team since the start of the match is drawn, and over the last minutes of its rolling window.
 
 
         """
         # Drawing a semi-transparent rectangle
-        # Creating a copy of the current frame, which will be used to create a semi-transparent overlay
-        overlay = frame.copy()
         """
-        Here we draw a white rectangle on the overlay image. The rectangle's top-left corner is at (1350, 850) and bottom-right corner is at (1900, 970). The -1 thickness means the rectangle is filled.
-        
-        And then we blend the overlay with the original frame to create a semi-transparent effect.
-        cv2.addWeighted() function is used to blend two images.
-        overlay:is the first input array (image). In this case, it's the copy of the frame with the white rectangle drawn on it.
-        alpha: is the weight of the first array elements. It's set to 0.4 in our code, which means the overlay will be 40% opaque.
-        frame: is the second input array (image). Here, it's the original frame.
-        1 - alpha: is the weight of the second array elements. Since alpha is 0.4, this will be 0.6, meaning the original frame will be 60% visible.
-        0: is a scalar added to each sum. In this case, it's 0, so nothing extra is added.
-        frame: is the output array. The result is stored back in the original frame.
-        """
-        cv2.rectangle(overlay, (1350, 850), (1900, 970), (255, 255, 255), -1)
+        Here we draw a white rectangle with its top-left corner at (1350, 850) and bottom-right corner at (1900, 1020) and blend it with the frame to create a semi-transparent effect.
+        alpha: is the weight of the white rectangle. It's set to 0.4 in our code, which means the rectangle will be 40% opaque and the original frame will be 60% visible.
+        Only the pixels inside the rectangle are blended, so the whole frame doesn't need to be copied.
+        """
         alpha = 0.4  # for transparency
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-
-        # slicing the team_ball_control array from the beginning up to and including the current frame.
-        team_ball_control_till_frame = team_ball_control[:frame_num+1]
-        # Get the number of time each team had ball control
+        draw_transparent_rectangle(
+            frame, (1350, 850), (1900, 1020), (255, 255, 255), alpha)
+
+        # counting the possession again on every frame would be quadratic in the length of the match,
+        # draw_annotations and build_match_renderer compute the PossessionStatistics once
+        if not isinstance(team_ball_control, PossessionStatistics):
+            raise TypeError("team_ball_control must be a PossessionStatistics, build it once for the whole match")
+        # Get the share of ball control of each team up to and including the current frame
         """
-        Here we count, how many frames each team had control of the ball. It does this by counting how many times 1 (for team 1) and 2 (for team 2) appear in the sliced array.
-        
-        Then we calculate the percentage of ball control for each team by dividing each team's frame count by the total number of frames. These lines add text to the frame showing the ball control percentages for each team. The text is black, uses the HERSHEY_SIMPLEX font, has a scale of 1, and a thickness of 3.
+        The number of frames each team had control of the ball is counted once for the whole match by PossessionStatistics
+        and divided by the number of frames where a team had the ball, so here we only look up the shares of this frame.
+        These lines add text to the frame showing the ball control percentages for each team. The text is black, uses the HERSHEY_SIMPLEX font, has a scale of 1, and a thickness of 3.
         """
-        team_1_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 1].shape[0]
-        team_2_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 2].shape[0]
-        team_1 = team_1_num_frames/(team_1_num_frames+team_2_num_frames)
-        team_2 = team_2_num_frames/(team_1_num_frames+team_2_num_frames)
+        team_1, team_2 = team_ball_control.cumulative_shares[frame_num]
 
         cv2.putText(frame, f"Team 1 Ball Control: {team_1*100:.2f}%",
                     (1400, 900), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
         cv2.putText(frame, f"Team 2 Ball Control: {team_2*100:.2f}%",
                     (1400, 950), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
 
+        # the shares over the rolling window (the last 5 minutes by default) show who dominates the current phase
+        rolling_team_1, rolling_team_2 = team_ball_control.rolling_shares[frame_num]
+        minutes = team_ball_control.rolling_window / team_ball_control.frame_rate / 60
+        cv2.putText(frame, f"Last {minutes:g} min: {rolling_team_1*100:.2f}% / {rolling_team_2*100:.2f}%",
+                    (1400, 1000), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+
         return frame
 
     # Drawing Near Bounding Boxes
@@ -388,50 +486,66 @@ class Tracker:
     def draw_annotations(self, video_frames, tracks, team_ball_control):
         # initialising an empty list to store the annotated video frames
         output_video_frames = []  # video frames after drawing the output on
+        # the possession shares of all the frames are computed once
+        if not isinstance(team_ball_control, PossessionStatistics):
+            team_ball_control = PossessionStatistics(team_ball_control)
 
         # Here we starting a loop that iterates through each frame in video_frames. enumerate() is used to get both the index (frame_num) and the frame itself.
         for frame_num, frame in enumerate(video_frames):
             # creating a copy of the current frame to avoid modifying the original frame.
             frame = frame.copy()
 
-            # Retrieving dictionaries containing tracking information for players, the ball, and referees for the current frame.
-            player_dict = tracks["players"][frame_num]
-            ball_dict = tracks["ball"][frame_num]
-            referee_dict = tracks["referees"][frame_num]
+            frame = self.draw_frame_annotations(
+                frame, frame_num, tracks, team_ball_control)
 
-            # Drawing Players
-            """
-            Here we looping through each player in the dict.
-        
-            First we retrieve the player's team color, defaulting to red.
-        
-            Calling 'self.draw_ellipse' to draw an ellipse around the player's bounding box (player["bbox"]) in the specified color. 
-        
-            If the player has the ball (player.get('has_ball', False)), calls self.draw_traingle to draw a triangle on the player's bounding box.
-            """
-            for track_id, player in player_dict.items():
-                color = player.get("team_color", (0, 0, 255))
-                frame = self.draw_ellipse(
-                    frame, player["bbox"], color, track_id)
+            output_video_frames.append(frame)
+
+        return output_video_frames
 
-                # if player doesn't have ball then we can draw just a triangle with colour red
-                if player.get('has_ball', False):
-                    frame = self.draw_triangle(
-                        frame, player["bbox"], (0, 0, 255))
+    # Drawing the annotations of a single frame in place, used when the frames are streamed one at a time
+    def draw_frame_annotations(self, frame, frame_num, tracks, team_ball_control):
+        frame = self.draw_frame_tracks(frame, frame_num, tracks)
 
-            # Drawing Referee
-            for _, referee in referee_dict.items():
-                frame = self.draw_ellipse(
-                    frame, referee["bbox"], (0, 255, 255))
+        # Drawing team ball control box
+        frame = self.draw_team_ball_control(
+            frame, frame_num, team_ball_control)
 
-            # Draw ball
-            for track_id, ball in ball_dict.items():
-                frame = self.draw_triangle(frame, ball["bbox"], (0, 255, 0))
+        return frame
 
-            # Drawing team ball control box
-            frame = self.draw_team_ball_control(
-                frame, frame_num, team_ball_control)
+    # Drawing the players, referees and ball of a single frame in place
+    def draw_frame_tracks(self, frame, frame_num, tracks):
+        # Retrieving dictionaries containing tracking information for players, the ball, and referees for the current frame.
+        player_dict = tracks["players"][frame_num]
+        ball_dict = tracks["ball"][frame_num]
+        referee_dict = tracks["referees"][frame_num]
 
-            output_video_frames.append(frame)
+        # Drawing Players
+        """
+        Here we looping through each player in the dict.
 
-        return output_video_frames
+        First we retrieve the player's team color, defaulting to red.
+
+        Calling 'self.draw_ellipse' to draw an ellipse around the player's bounding box (player["bbox"]) in the specified color. 
+
+        If the player has the ball (player.get('has_ball', False)), calls self.draw_traingle to draw a triangle on the player's bounding box.
+        """
+        for track_id, player in player_dict.items():
+            color = player.get("team_color", (0, 0, 255))
+            frame = self.draw_ellipse(
+                frame, player["bbox"], color, track_id)
+
+            # if player doesn't have ball then we can draw just a triangle with colour red
+            if player.get('has_ball', False):
+                frame = self.draw_triangle(
+                    frame, player["bbox"], (0, 0, 255))
+
+        # Drawing Referee
+        for _, referee in referee_dict.items():
+            frame = self.draw_ellipse(
+                frame, referee["bbox"], (0, 255, 255))
+
+        # Draw ball
+        for track_id, ball in ball_dict.items():
+            frame = self.draw_triangle(frame, ball["bbox"], (0, 255, 0))
+
+        return frame
@@ -1,3 +1,9 @@
-from .video_utils import read_video, save_video
+from .video_utils import read_video, save_video, iter_video, read_first_frame, get_frame_count, get_video_info, VideoInfo, VideoSink, FFmpegSink, ThreadedSink, make_video_sink
 
-from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, measure_xy_distance, get_foot_position
+from .frame_cache import FrameCache
+
+from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, measure_xy_distance, get_foot_position, bbox_iou
+
+from .drawing_utils import draw_transparent_rectangle
+
+from .sprite_cache import SpriteCache, Sprite, blit_sprite, color_key
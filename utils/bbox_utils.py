@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def get_center_of_bbox(bbox):
     x1, y1, x2, y2 = bbox
     return int((x1+x2)/2), int((y1+y2)/2)
@@ -32,3 +35,20 @@ def measure_xy_distance(p1, p2):
 def get_foot_position(bbox):
     x1, y1, x2, y2 = bbox
     return int((x1+x2)/2), int(y2)
+
+
+def bbox_iou(boxes_a, boxes_b):
+    # IoU of every box of boxes_a (N, 4) with every box of boxes_b (M, 4), as an (N, M) array
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) -
+                    np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) -
+                     np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = width * height
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * \
+        (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * \
+        (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0)
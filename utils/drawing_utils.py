@@ -0,0 +1,25 @@
+import numpy as np
+import cv2
+
+
+def draw_transparent_rectangle(frame, top_left, bottom_right, color, alpha):
+    """
+    Draws a filled semi-transparent rectangle on frame in place.
+
+    It gives the same result as drawing the rectangle on a copy of the frame and calling
+    cv2.addWeighted on the full frame, but only the pixels of the rectangle (the ROI) are
+    blended, so the frame is never copied.
+    top_left and bottom_right are included in the rectangle like in cv2.rectangle.
+    """
+    x1, y1 = max(int(top_left[0]), 0), max(int(top_left[1]), 0)
+    x2 = min(int(bottom_right[0]) + 1, frame.shape[1])
+    y2 = min(int(bottom_right[1]) + 1, frame.shape[0])
+    if x1 >= x2 or y1 >= y2:
+        return frame
+
+    roi = frame[y1:y2, x1:x2]
+    overlay = np.empty_like(roi)
+    overlay[:] = color
+    # roi is a view of frame so the blend is written straight into the frame
+    cv2.addWeighted(overlay, alpha, roi, 1 - alpha, 0, roi)
+    return frame
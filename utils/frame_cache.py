@@ -0,0 +1,99 @@
+"""
+FrameCache: the decoded frames of a video kept on disk as one raw uint8 array, memory-mapped when it is read.
+"""
+import json
+import os
+import cv2
+import numpy as np
+from .video_utils import iter_video, get_video_info
+
+
+class FrameCache:
+    """
+    Raw frames of a video stored in a (F, H, W, 3) uint8 array (or (F, H, W) for grayscale) memory-mapped from disk.
+
+    The video is decoded once by build(), afterwards frame k is a view of the file at a fixed offset: no decoding,
+    O(1) random access, and the pages are read by the OS only when they are used.
+    scale resizes the frames (e.g. 0.5 stores a quarter of the pixels) and grayscale stores one channel, which is
+    all the optical flow of CameraMovementEstimator needs. At full resolution a 1080p frame takes 6 MB, so a whole
+    match should be stored downscaled and/or in grayscale.
+
+    The frames are stored in path + '.u8' and the shape and parameters in path + '.json'.
+    frames is read-only: a frame has to be copied before drawing on it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}.json") as f:
+            self.metadata = json.load(f)
+        self.scale = self.metadata['scale']
+        self.grayscale = self.metadata['grayscale']
+        self.fps = self.metadata['fps']
+        self.frames = np.memmap(f"{path}.u8", dtype=np.uint8, mode='r',
+                                shape=tuple(self.metadata['shape']))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def iter_frames(self, start_frame=0, end_frame=None, stride=1):
+        # Views of the frames, like iter_video
+        yield from self.frames[start_frame:end_frame:stride]
+
+    @staticmethod
+    def source_description(video_path, scale, grayscale, start_frame, end_frame):
+        # What the frames were made from, a cache is reused only when all of it matches
+        stat = os.stat(video_path)
+        return {'video': os.path.abspath(video_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'scale': scale, 'grayscale': grayscale, 'start_frame': start_frame, 'end_frame': end_frame}
+
+    @classmethod
+    def build(cls, video_path, path, scale=1.0, grayscale=False, start_frame=0, end_frame=None):
+        """
+        Decodes the frames from start_frame to end_frame of video_path and writes them to the cache at path.
+        The frames are written one at a time, so building doesn't hold the video in memory.
+        """
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be in (0, 1]")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        frame_shape = None
+        number_of_frames = 0
+        # the metadata is written last, an interrupted build leaves no cache that could be opened
+        if os.path.exists(f"{path}.json"):
+            os.remove(f"{path}.json")
+        with open(f"{path}.u8", 'wb') as f:
+            for frame in iter_video(video_path, start_frame, end_frame):
+                if scale != 1:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale,
+                                       interpolation=cv2.INTER_AREA)
+                if grayscale:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                frame_shape = frame.shape
+                f.write(np.ascontiguousarray(frame).tobytes())
+                number_of_frames += 1
+        if frame_shape is None:
+            raise IOError(f"no frames could be read from {video_path}")
+
+        metadata = cls.source_description(
+            video_path, scale, grayscale, start_frame, end_frame)
+        metadata['fps'] = get_video_info(video_path).fps
+        metadata['shape'] = [number_of_frames, *frame_shape]
+        with open(f"{path}.json", 'w') as f:
+            json.dump(metadata, f)
+        return cls(path)
+
+    @classmethod
+    def load_or_build(cls, video_path, path, scale=1.0, grayscale=False, start_frame=0, end_frame=None):
+        # Opens the cache at path if it was built from the same video with the same parameters, builds it otherwise
+        if os.path.exists(f"{path}.json") and os.path.exists(f"{path}.u8"):
+            frame_cache = cls(path)
+            description = cls.source_description(
+                video_path, scale, grayscale, start_frame, end_frame)
+            if all(frame_cache.metadata.get(name) == value for name, value in description.items()):
+                return frame_cache
+        return cls.build(video_path, path, scale, grayscale, start_frame, end_frame)
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import threading
+import numpy as np
+import cv2
+
+
+class Sprite:
+    """
+    A pre-rendered overlay: its colour premultiplied by its alpha (the overlay drawn on black), the transmission of
+    each pixel (255 * (1 - alpha), per channel) and the position of its anchor in the patch.
+    When every pixel is either opaque or transparent, mask is the uint8 mask of the opaque pixels and the sprite is
+    blitted with a masked copy, otherwise mask is None and it is alpha blended.
+    """
+    __slots__ = ('patch', 'transmission', 'mask', 'anchor', 'height', 'width')
+
+    def __init__(self, patch, transmission, anchor):
+        self.patch = patch
+        self.transmission = transmission
+        self.height, self.width = patch.shape[:2]
+        self.anchor = anchor
+        self.mask = None
+        if self.width > 0:
+            opaque = cv2.inRange(transmission, (0, 0, 0), (0, 0, 0))
+            transparent = cv2.inRange(transmission, (255, 255, 255), (255, 255, 255))
+            if cv2.countNonZero(opaque) + cv2.countNonZero(transparent) == self.height * self.width:
+                self.mask = opaque
+
+
+class SpriteCache:
+    """
+    LRU cache of pre-rendered overlay sprites (ellipses, labels, triangles, text), so that a shape drawn on many
+    frames is rasterized once and then copied into each frame.
+
+    A sprite is rendered by calling draw(image, anchor) with the same OpenCV calls as the drawing on the frame,
+    relative to an integer anchor point, once on a black and once on a white canvas. The black one is the colour
+    premultiplied by the alpha and their difference is what is left of the background (255 * (1 - alpha)), so the
+    sprite is alpha-blitted as patch + frame * transmission / 255.
+    Shapes drawn without antialiasing (the ellipses and triangles) have an alpha of 0 or 1 and are copied exactly,
+    antialiased text can differ from the direct drawing by one grey level on its edges.
+    OpenCV clips thick lines differently at the border of the image, so a sprite that doesn't fit entirely in the
+    frame is drawn directly instead.
+
+    Keys are any hashable value, e.g. ('ellipse', axes, colour) or ('text', text, colour). At most max_sprites
+    sprites are kept, the least recently used are evicted first. It can be shared by drawing threads.
+    """
+
+    def __init__(self, max_sprites=4096):
+        self.max_sprites = max_sprites
+        self.sprites = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def get(self, key, draw, extent):
+        """
+        Returns the sprite of key, rendering it with draw(image, anchor) when it is not cached.
+        extent is (left, top, right, bottom): how far from the anchor the drawing can go in pixels, or a function
+        returning it, called only when the sprite is rendered.
+        """
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.sprites.move_to_end(key)
+                self.stats['hits'] += 1
+                return sprite
+            self.stats['misses'] += 1
+
+        sprite = self.render(draw, extent() if callable(extent) else extent)
+        with self.lock:
+            self.sprites[key] = sprite
+            while len(self.sprites) > self.max_sprites:
+                self.sprites.popitem(last=False)
+                self.stats['evictions'] += 1
+        return sprite
+
+    @staticmethod
+    def render(draw, extent):
+        left, top, right, bottom = [int(value) + 1 for value in extent]
+        anchor = (left, top)
+        black = np.zeros((top + bottom + 1, left + right + 1, 3), dtype=np.uint8)
+        white = np.full_like(black, 255)
+        draw(black, anchor)
+        draw(white, anchor)
+        transmission = cv2.subtract(white, black)
+
+        # cropping the patch to its drawn pixels, where the transmission of a channel is below 255
+        drawn = 255 - np.minimum(np.minimum(transmission[..., 0], transmission[..., 1]), transmission[..., 2])
+        x, y, width, height = cv2.boundingRect(drawn)
+        return Sprite(black[y:y + height, x:x + width].copy(), transmission[y:y + height, x:x + width].copy(),
+                      (left - x, top - y))
+
+    def draw(self, frame, anchor, key, draw, extent):
+        # Blits the sprite of key into frame with its anchor at the integer point anchor, in place
+        sprite = self.get(key, draw, extent)
+        x, y = anchor[0] - sprite.anchor[0], anchor[1] - sprite.anchor[1]
+        if x < 0 or y < 0 or x + sprite.width > frame.shape[1] or y + sprite.height > frame.shape[0]:
+            draw(frame, anchor)
+            return frame
+        return blit_sprite(frame, sprite, (x, y))
+
+
+def color_key(color):
+    # Hashable version of a colour (the team colours are NumPy arrays) for the keys of the sprites
+    return tuple(float(value) for value in color)
+
+
+def blit_sprite(frame, sprite, top_left):
+    # Alpha-blits sprite into frame with the top left corner of its patch at top_left, the sprite has to fit in frame
+    if sprite.width == 0:
+        return frame
+    x, y = top_left
+    # roi is a view of frame so the sprite is written straight into the frame
+    roi = frame[y:y + sprite.height, x:x + sprite.width]
+    if sprite.mask is not None:
+        cv2.copyTo(sprite.patch, sprite.mask, roi)
+    else:
+        # a transmission of 255 keeps the frame pixel and 0 replaces it, with rounding in between
+        cv2.add(cv2.multiply(roi, sprite.transmission, scale=1 / 255), sprite.patch, dst=roi)
+    return frame
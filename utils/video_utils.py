@@ -1,53 +1,291 @@
 """
 Here we will have utilites to read from a video and save the video
 """
+import os
+import queue
+import subprocess
+import threading
 import cv2
 
+# with a stride of at least this many frames the capture seeks to the next frame instead of grabbing the frames in between
+SEEK_STRIDE = 48
+
+# codec used by VideoSink for each container when no codec is given
+CONTAINER_CODECS = {'.avi': 'XVID', '.mp4': 'mp4v',
+                    '.mov': 'mp4v', '.mkv': 'XVID'}
+
+
+class VideoInfo:
+    # Properties read from the header of a video
+    def __init__(self, fps, frame_count, width, height, codec):
+        self.fps = fps
+        self.frame_count = frame_count
+        self.width = width
+        self.height = height
+        self.codec = codec
+
+    @property
+    def duration(self):
+        # duration in seconds
+        return self.frame_count / self.fps if self.fps else 0.0
+
+    def __repr__(self):
+        return (f"VideoInfo(fps={self.fps}, frame_count={self.frame_count}, width={self.width}, "
+                f"height={self.height}, codec={self.codec!r})")
+
+
+def get_video_info(video_path):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise IOError(f"cannot open the video {video_path}")
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+        return VideoInfo(fps=cap.get(cv2.CAP_PROP_FPS),
+                         frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+                         width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         codec=codec)
+    finally:
+        cap.release()
+
+# function to yield the frames of a video one at a time
+
+
+def iter_video(video_path, start_frame=0, end_frame=None, stride=1):
+    """
+    Generator version of read_video.
+    Frames are decoded lazily, so only the frame currently being used is kept in memory
+    instead of the whole match.
+    Only the frames from start_frame (included) to end_frame (excluded, None for the end of the video) are read,
+    the capture seeks to start_frame instead of decoding the frames before it.
+    With stride > 1 only every stride-th frame is returned: the frames in between are grabbed without being
+    converted, or skipped with a seek when the stride is at least SEEK_STRIDE.
+    video_path can also be a FrameCache, its frames are then views of the memory-mapped file.
+    """
+    if stride < 1:
+        raise ValueError("stride must be at least 1")
+    if is_frame_cache(video_path):
+        yield from video_path.iter_frames(start_frame, end_frame, stride)
+        return
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_num = start_frame
+        while end_frame is None or frame_num < end_frame:
+            ret, frame = cap.read()
+            if not ret:  # if falls video will end
+                break
+            yield frame
+            frame_num += stride
+            if stride >= SEEK_STRIDE:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            else:
+                for _ in range(stride - 1):
+                    if not cap.grab():
+                        return
+    finally:
+        cap.release()
+
+
+def get_frame_count(video_path):
+    # Number of frames written in the header of the video, can be approximate for some containers
+    if is_frame_cache(video_path):
+        return len(video_path)
+    return get_video_info(video_path).frame_count
+
+
+def is_frame_cache(video_path):
+    # imported here because frame_cache uses the functions of this module to decode the video
+    from .frame_cache import FrameCache
+    return isinstance(video_path, FrameCache)
+
 # function to return the list of frames of video
 
 
 def read_video(video_path):
-    cap = cv2.VideoCapture(video_path)
-    frames = []  # initalising empty frames
-    while True:
-        ret, frame = cap.read()
-        if not ret:  # if falls video will end
-            break
-        frames.append(frame)
+    # Kept for short clips, for long videos iter_video should be used
+    # the frames of a FrameCache are returned as the memory-mapped (F, H, W, 3) array itself, without copying them
+    if is_frame_cache(video_path):
+        return video_path.frames
+    return list(iter_video(video_path))
+
+# function to return only the first frame of the video
 
-    return frames
+
+def read_first_frame(video_path):
+    return next(iter_video(video_path), None)
 
 # function to save sequence of image frames as a video file
 
 
 """
-ouput_video_frames is expected to be a list or array of numpy arrays, where each numpy array represents an image frame.
-output_video_path is a string representing the file path where the video will be saved, including the filename and extension 
+VideoSink is the streaming counterpart of save_video.
+The writer is opened lazily with the size of the first frame and every frame is written
+as soon as it is received, so frames don't need to be collected in a list.
+The codec is a FourCC code, by default the one of CONTAINER_CODECS for the extension of the output path.
 """
 
 
-def save_video(output_video_frames, output_video_path):
+class VideoSink:
+    def __init__(self, output_video_path, fps=24, codec=None):
+        self.output_video_path = output_video_path
+        self.fps = fps
+        extension = os.path.splitext(output_video_path)[1].lower()
+        self.codec = codec or CONTAINER_CODECS.get(extension, 'XVID')
+        self.out = None
+
+    def write(self, frame):
+        if self.out is None:
+            """
+            cv2.VideoWriter_fourcc() is a function from OpenCV that creates a 4-byte code used to specify the video codec.
+            XVID is an open-source video codec that provides good compression while maintaining quality
+            """
+            fourcc = cv2.VideoWriter_fourcc(*self.codec)
+            self.out = cv2.VideoWriter(self.output_video_path, fourcc, self.fps,
+                                       (frame.shape[1], frame.shape[0]))
+            if not self.out.isOpened():
+                self.out = None
+                raise IOError(
+                    f"cannot open a {self.codec} writer for {self.output_video_path}")
+        self.out.write(frame)
+
+    def close(self):
+        # releasing the VideoWriter object after all frames have been written
+        if self.out is not None:
+            self.out.release()
+            self.out = None
+
+
+class FFmpegSink:
+    """
+    Sink writing the raw BGR frames to the stdin of an ffmpeg process, so any codec and container of ffmpeg can be used
+    (e.g. libx264 in .mp4, or a hardware encoder like h264_nvenc or h264_videotoolbox), and the encoding runs in
+    the ffmpeg process instead of the Python one.
+    """
+
+    def __init__(self, output_video_path, fps=24, codec='libx264', preset='veryfast', crf=23,
+                 pixel_format='yuv420p', ffmpeg_path='ffmpeg', extra_args=()):
+        self.output_video_path = output_video_path
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.pixel_format = pixel_format
+        self.ffmpeg_path = ffmpeg_path
+        self.extra_args = list(extra_args)
+        self.process = None
+
+    def command(self, width, height):
+        command = [self.ffmpeg_path, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{width}x{height}", '-r', str(self.fps),
+                   '-i', '-', '-c:v', self.codec, '-pix_fmt', self.pixel_format]
+        if self.preset is not None:
+            command += ['-preset', self.preset]
+        if self.crf is not None:
+            command += ['-crf', str(self.crf)]
+        return command + self.extra_args + [self.output_video_path]
+
+    def write(self, frame):
+        if self.process is None:
+            self.frame_shape = frame.shape
+            self.process = subprocess.Popen(self.command(frame.shape[1], frame.shape[0]),
+                                            stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        if frame.shape != self.frame_shape:
+            raise ValueError(
+                f"frame of shape {frame.shape} written to a video of shape {self.frame_shape}")
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        if not process.stdin.closed:
+            process.stdin.close()
+        error = process.stderr.read().decode(errors='replace')
+        if process.wait() != 0:
+            raise IOError(f"ffmpeg failed writing {self.output_video_path}: {error.strip()}")
+
+
+class ThreadedSink:
     """
-    cv2.VideoWriter_fourcc() is a function from OpenCV that creates a 4-byte code used to specify the video codec.
-    XVID is an open-source video codec that provides good compression while maintaining quality
+    Wraps a sink so that the frames are encoded on a background thread.
+    write() only puts the frame in a queue of queue_size frames (and waits when the encoder is that far behind),
+    an error of the encoder is raised by the next write() or by close().
     """
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')  # assinging video formam XVID
 
+    def __init__(self, sink, queue_size=32):
+        self.sink = sink
+        self.frames = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.encode, daemon=True)
+        self.thread.start()
+
+    def encode(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.sink.write(frame)
+                except Exception as error:
+                    self.error = error
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.frames.put(frame)
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.sink.close()
+        finally:
+            if self.error is not None:
+                raise self.error
+
+
+def make_video_sink(output_video_path, fps=24, backend='opencv', codec=None, threaded=False):
+    """
+    Returns a sink for output_video_path: backend 'opencv' (VideoSink, codec is a FourCC code) or
+    'ffmpeg' (FFmpegSink, codec is an ffmpeg encoder name), encoding on a background thread if threaded.
+    """
+    if backend == 'opencv':
+        sink = VideoSink(output_video_path, fps, codec)
+    elif backend == 'ffmpeg':
+        sink = FFmpegSink(output_video_path, fps, codec or 'libx264')
+    else:
+        raise ValueError(
+            f"backend must be 'opencv' or 'ffmpeg', got {backend!r}")
+    return ThreadedSink(sink) if threaded else sink
+
+
+"""
+ouput_video_frames is expected to be a list or any iterable (e.g. a generator) of numpy arrays, where each numpy array represents an image frame.
+output_video_path is a string representing the file path where the video will be saved, including the filename and extension
+"""
+
+
+def save_video(output_video_frames, output_video_path, fps=24):
     """
-    This creates a cv2.VideoWriter object which will be used to write the video file.
+    This creates a VideoSink which will be used to write the video file.
 
     output_video_path is the path where the video will be saved.
-    
-    24 is the frame rate of the output video
-    after that we define frame and height of the video frame
 
+    fps is the frame rate of the output video, 24 by default (use get_video_info(input_path).fps to keep the one of the source)
+    the frame and height of the video are taken from the first frame
     """
-    out = cv2.VideoWriter(output_video_path, fourcc, 24,
-                          (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
+    sink = VideoSink(output_video_path, fps=fps)
 
-    # This loop iterates through each frame in the ouput_video_frames list and out.write(frame) writes each frame to the video file.
+    # This loop iterates through each frame in the ouput_video_frames and writes each frame to the video file.
     for frame in output_video_frames:
-        out.write(frame)
+        sink.write(frame)
 
-    # After all frames have been written, out.release() is called to release the VideoWriter object.
-    out.release()
+    # After all frames have been written the sink is closed to release the VideoWriter object.
+    sink.close()
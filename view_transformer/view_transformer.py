@@ -1,5 +1,6 @@
 import numpy as np
 import cv2
+from track_table import TrackTable
 
 
 class ViewTransformer():
@@ -63,21 +64,68 @@ class ViewTransformer():
             reshaped_point, self.persepctive_transformer)  # the transformed point
         return transform_point.reshape(-1, 2)
 
+    def is_inside(self, points):
+        """
+        Vectorized version of cv2.pointPolygonTest(self.pixel_vertices, p, False) >= 0 for an (N, 2) array of points.
+
+        The points are converted to integer co-ordinates like before. The trapezoid is convex, so a point is inside
+        (or on an edge) when it is on the same side of every edge, i.e. the cross products of each edge with the
+        vector from the edge start to the point all have the same sign (or are zero).
+        """
+        points = np.trunc(points)
+        edge_start = self.pixel_vertices.astype(np.float64)
+        edge_vector = np.roll(edge_start, -1, axis=0) - edge_start
+        # cross products of shape (N, number of edges)
+        relative = points[:, None, :] - edge_start[None, :, :]
+        cross = edge_vector[None, :, 0] * relative[:, :, 1] - \
+            edge_vector[None, :, 1] * relative[:, :, 0]
+        return np.all(cross >= 0, axis=1) | np.all(cross <= 0, axis=1)
+
+    def transform_points(self, points):
+        """
+        Transforms an (N, 2) array of pixel positions (a whole frame or a whole match) to court co-ordinates.
+        The inside-polygon test and the homography are done for all the points at once, points outside of
+        the court (or NaN positions) are returned as NaN.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        transformed_points = np.full(points.shape, np.nan)
+
+        valid = np.isfinite(points).all(axis=1)
+        valid[valid] = self.is_inside(points[valid])
+        if not valid.any():
+            return transformed_points
+
+        """
+        reshape(-1, 1, 2) is the format required by the cv2.perspectiveTransform() function and
+        astype(np.float32) converts the points to float32 like for a single point.
+        """
+        reshaped_points = points[valid].reshape(-1, 1, 2).astype(np.float32)
+        transformed_points[valid] = cv2.perspectiveTransform(
+            reshaped_points, self.persepctive_transformer).reshape(-1, 2)
+        return transformed_points
+
     def add_transformed_position_to_tracks(self, tracks):
-        # Iterating over each object and its tracks in the dictionary
-        for object, object_tracks in tracks.items():
-            # Iteraring over each frame's track in the list of object tracks
-            for frame_num, track in enumerate(object_tracks):
-                # Iterating over each track ID and its info in the dictionary
-                for track_id, track_info in track.items():
-                    # Extracting ethe 'position_adjusted' value from track_info
-                    position = track_info['position_adjusted']
-                    # Converting the position to a NumPy array
-                    position = np.array(position)
-                    # Applying a transformation to the position using a method called transform_point.
-                    position_transformed = self.transform_point(position)
-                    # If the transformed position is not None, squeeze and convert to a list
-                    if position_transformed is not None:
-                        position_transformed = position_transformed.squeeze().tolist()
-                    # Updating the tracks dictionary with the transformed position
-                    tracks[object][frame_num][track_id]['position_transformed'] = position_transformed
+        # a TrackTable is transformed in a single call on its position_adjusted column
+        if isinstance(tracks, TrackTable):
+            tracks.position_transformed[:] = self.transform_points(
+                tracks.position_adjusted)
+            tracks.computed_columns.add('position_transformed')
+            return
+
+        # Collecting the 'position_adjusted' value of every object, frame and track ID
+        track_infos = [track_info
+                       for object_tracks in tracks.values()
+                       for track in object_tracks
+                       for track_info in track.values()]
+        if not track_infos:
+            return
+        positions = np.array([track_info['position_adjusted']
+                              for track_info in track_infos], dtype=np.float64)
+
+        # Transforming all the positions of the match at once
+        positions_transformed = self.transform_points(positions)
+
+        # Updating the tracks dictionary with the transformed position, None if the point is outside the court
+        inside = ~np.isnan(positions_transformed[:, 0])
+        for track_info, is_inside, position_transformed in zip(track_infos, inside.tolist(), positions_transformed.tolist()):
+            track_info['position_transformed'] = position_transformed if is_inside else None